@@ -4,7 +4,18 @@ ADB 自动化工具类
 """
 import subprocess
 import os
-from typing import Optional, Tuple, Any
+import re
+import struct
+import threading
+import time
+from collections import deque
+from functools import wraps
+from math import gcd
+from typing import Optional, Tuple, Any, Dict, Iterable
+
+from adb_wire_client import AdbWireClient, RecvBuffer
+from device_clock import (ClockOffset, DEVICE_CLOCK_SAMPLES, DEVICE_CLOCK_SAMPLE_TIMEOUT, DEVICE_TIME_COMMAND,
+                          parse_device_time, estimate_offset)
 
 # 【优化】尝试导入 adbutils（常驻连接，节省 8-15ms）
 try:
@@ -13,6 +24,111 @@ try:
 except ImportError:
     ADBUTILS_AVAILABLE = False
 
+# ========== 截图传输模式 ==========
+CAPTURE_MODE_PNG = 'png'  # screencap -p：设备端 PNG 编码，主机端再解码（兼容性最好）
+CAPTURE_MODE_RAW = 'raw'  # screencap：原始帧缓冲（头部 + 像素），主机端零解码直接转 numpy
+CAPTURE_MODE_ROWS = 'rows'  # screencap + 设备端 dd 切片：只传回检测需要的行（几十 KB / 帧）
+
+# 【优化】screencap 原始输出的像素格式（android PixelFormat -> (帧格式, 每像素字节数)）
+# RGBX 的第4字节无意义，检测只读前3个通道，按 RGBA 处理即可
+RAW_PIXEL_FORMATS = {
+    1: ('RGBA', 4),  # PIXEL_FORMAT_RGBA_8888
+    2: ('RGBA', 4),  # PIXEL_FORMAT_RGBX_8888
+    3: ('RGB', 3),   # PIXEL_FORMAT_RGB_888
+}
+# 原始输出头部长度：width, height, format（Android 9+ 额外带 colorspace）
+RAW_HEADER_SIZES = (12, 16)
+RAW_CAPTURE_MAX_FAILURES = 3  # raw 截图连续失败次数，超过后自动回退到 PNG
+# adbutils 执行 shell 命令时附加的退出码标记（与 adb shell 的返回码语义保持一致）
+SHELL_EXIT_MARKER = b'__ADB_EXIT__'
+
+# ========== 常驻输入通道（直接写 /dev/input/eventX）==========
+# linux input_event 编码常量
+EV_SYN = 0x00
+EV_KEY = 0x01
+EV_ABS = 0x03
+SYN_REPORT = 0x00
+BTN_TOUCH = 0x14a
+ABS_MT_SLOT = 0x2f
+ABS_MT_TOUCH_MAJOR = 0x30
+ABS_MT_POSITION_X = 0x35
+ABS_MT_POSITION_Y = 0x36
+ABS_MT_TRACKING_ID = 0x39
+ABS_MT_PRESSURE = 0x3a
+
+# 【优化】内置 adb 协议客户端预分配的截图接收缓冲区个数（空闲列表，取出后直到归还前不会被其他请求复用）
+WIRE_CAPTURE_BUFFERS = 3
+
+# 行提取模式的设备端临时文件：dd 需要可 seek 的输入，管道上按块读取可能读不满（短读）导致错位
+# 文件名带 shell 进程号，流水线截图时多个请求同时在途也不会互相覆盖
+ROWS_CAPTURE_TEMP_PATH = '/data/local/tmp/screencap_rows_$$.raw'
+
+
+def _traced_transfer(method):
+    """
+    截图方法装饰器：记录本线程这次请求的首字节/末字节时间（用于延迟追踪）
+
+    只有内置协议客户端能测到首字节；其他传输方式首字节为 NaN，末字节取方法返回时间
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        timings = [float('nan'), float('nan')]
+        self._transfer.timings = timings
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._transfer.timings = None
+            if timings[1] != timings[1]:  # NaN：传输层没有记录
+                timings[1] = time.perf_counter()
+            self._transfer.last = (timings[0], timings[1])
+    return wrapper
+
+
+class ShellStream:
+    """
+    长连接 shell 流（adbutils 套接字或 adb 子进程管道的统一包装）
+    
+    用于 screenrecord 等持续输出的命令：一次建立连接，之后只做 read/write
+    """
+    
+    def __init__(self, sock=None, process: Optional[subprocess.Popen] = None, connection: Any = None):
+        """
+        Args:
+            sock: adbutils 连接的底层 socket
+            process: adb 子进程（回退方式）
+            connection: adbutils AdbConnection（用于关闭）
+        """
+        self.sock = sock
+        self.process = process
+        self.connection = connection
+    
+    def read(self, size: int = 65536) -> bytes:
+        """读取最多 size 字节，流结束返回 b''"""
+        if self.sock is not None:
+            return self.sock.recv(size)
+        return self.process.stdout.read1(size)
+    
+    def write(self, data: bytes):
+        """写入数据（发送到设备端命令的 stdin）"""
+        if self.sock is not None:
+            self.sock.sendall(data)
+        else:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+    
+    def close(self):
+        """关闭流（设备端命令随之结束）"""
+        try:
+            if self.connection is not None:
+                self.connection.close()
+            elif self.sock is not None:
+                self.sock.close()
+            if self.process is not None:
+                self.process.kill()
+                self.process.wait(timeout=1)
+        except Exception:
+            pass
+
 
 class ADBAutomation:
     """ADB 自动化类"""
@@ -29,6 +145,27 @@ class ADBAutomation:
         # 【优化】常驻 ADB 连接（adbutils）
         self.adb_client = None
         self.adb_device = None
+        # 截图传输模式（connect 时选择，raw 不可用时自动回退到 png）
+        self.capture_mode = CAPTURE_MODE_PNG
+        self.raw_header_size: Optional[int] = None  # 探测到的 raw 头部长度
+        self.raw_frame_info: Optional[Tuple[int, int, str, int]] = None  # (宽, 高, 帧格式, 每像素字节数)
+        self._raw_failures = 0
+        self._rows_failures = 0
+        self._rows_command_cache: Dict[Tuple[int, ...], Tuple[str, list]] = {}
+        # 【优化】内置 adb 协议客户端（connect(use_wire_client=True) 时启用）
+        self.wire_client: Optional[AdbWireClient] = None
+        self._free_capture_buffers: deque = deque(RecvBuffer() for _ in range(WIRE_CAPTURE_BUFFERS))
+        self._capture_buffer_lock = threading.Lock()
+        # 各线程最近一次截图的 (首字节, 末字节) 时间和取出的接收缓冲区（流水线截图时多个线程同时在途）
+        self._transfer = threading.local()
+        # 【优化】常驻输入通道（open_input_channel 打开，失败时 tap 回退到 input tap）
+        self.input_stream: Optional[ShellStream] = None
+        self.input_device: Optional[dict] = None  # 触摸屏信息 {path, abs: {code: (min, max)}, btn_touch}
+        self.input_event_format = '<qqHHi'  # input_event 结构（64 位用户态 24 字节，32 位 16 字节）
+        self.input_tap_hold = 0.0  # 按下到抬起的间隔（秒）
+        self._input_lock = threading.Lock()
+        self._input_tracking_id = 0
+        self._input_scale: Optional[Tuple[float, float, float, float]] = None  # (x0, sx, y0, sy)
         if ADBUTILS_AVAILABLE:
             try:
                 self.adb_client = adbutils.AdbClient()
@@ -62,15 +199,32 @@ class ADBAutomation:
                 if os.path.exists(path):
                     return path
         
+        # adbutils 自带的 adb 可执行文件（pip 安装即可用，适合 CI 机器）
+        if ADBUTILS_AVAILABLE:
+            try:
+                path = adbutils.adb_path()
+                if path and os.path.exists(path):
+                    return path
+            except Exception:
+                pass
+        
         # 默认返回 adb（假设在 PATH 中）
         return 'adb'
     
-    def connect(self, device_id: Optional[str] = None) -> bool:
+    def connect(
+        self,
+        device_id: Optional[str] = None,
+        capture_mode: str = CAPTURE_MODE_PNG,
+        use_wire_client: bool = False
+    ) -> bool:
         """
         连接设备
         
         Args:
             device_id: 设备 ID，如果为 None 则使用初始化时的 device_id 或自动选择
+            capture_mode: 截图传输模式（CAPTURE_MODE_PNG / CAPTURE_MODE_RAW / CAPTURE_MODE_ROWS），
+                          不可用时自动回退（rows -> raw -> png）
+            use_wire_client: 是否启用内置 adb 协议客户端（预热连接池 + 复用接收缓冲区）
         
         Returns:
             是否连接成功
@@ -146,6 +300,12 @@ class ADBAutomation:
                 elif device_found:
                     print(f"✅ 已连接到设备: {self.device_id} (传统方式)")
             
+            if device_found and use_wire_client:
+                self._start_wire_client()
+            
+            if device_found:
+                self._select_capture_mode(capture_mode)
+            
             return device_found
                 
         except subprocess.TimeoutExpired:
@@ -167,6 +327,136 @@ class ADBAutomation:
         """
         运行 ADB 命令
         
+        Args:
+            args: ADB 命令参数（不包含 'adb' 和设备 ID）
+            timeout: 超时时间（秒）
+            capture_binary: 是否以二进制模式捕获输出
+        
+        Returns:
+            (成功标志, 输出内容)
+        """
+        # 【优化】内置协议客户端：预热连接上直接发送服务请求
+        if self.wire_client and args and args[0] in ('shell', 'exec-out'):
+            result = self._run_wire_command(args, timeout, capture_binary)
+            if result is not None:
+                return result
+        
+        # 【优化】shell/exec-out/pull/push 优先走 adbutils 常驻连接（socket 写入，无 fork 开销）
+        if self.adb_device and args and args[0] in ('shell', 'exec-out', 'pull', 'push'):
+            result = self._run_adbutils_command(args, timeout, capture_binary)
+            if result is not None:
+                return result
+        
+        # 回退到 adb 子进程（兼容性）
+        return self._run_subprocess_command(args, timeout, capture_binary)
+    
+    def _start_wire_client(self):
+        """启动内置 adb 协议客户端（失败时保持 adbutils/子进程方式）"""
+        client = AdbWireClient(self.device_id)
+        if client.start():
+            self.wire_client = client
+            print(f"✅ 内置 adb 协议客户端已启动 ({client.host}:{client.port}, 预热连接池)")
+        else:
+            print("⚠️  内置 adb 协议客户端不可用，继续使用 adbutils/传统方式")
+    
+    def close(self):
+        """关闭常驻输入通道和内置协议客户端的连接"""
+        self.close_input_channel()
+        if self.wire_client is not None:
+            self.wire_client.close()
+            self.wire_client = None
+    
+    def _run_wire_command(
+        self,
+        args: list,
+        timeout: int,
+        capture_binary: bool
+    ) -> Optional[Tuple[bool, Any]]:
+        """
+        通过内置协议客户端执行 shell/exec-out（shell v2 原生返回退出码）
+        
+        Returns:
+            (成功标志, 输出内容)，连接层失败返回 None（由调用方回退）
+        """
+        command = ' '.join(str(arg) for arg in args[1:])
+        try:
+            exit_code, output = self.wire_client.shell(
+                command, timeout=timeout, timings=getattr(self._transfer, 'timings', None)
+            )
+        except Exception as e:
+            if isinstance(e, TimeoutError):
+                return (False, "命令超时")
+            return None
+        # exec-out 与 adb 行为一致：不关心设备端退出码
+        success = exit_code == 0 or args[0] == 'exec-out'
+        if capture_binary:
+            return (success, output)
+        return (success, output.decode('utf-8', errors='replace').strip())
+    
+    def _run_adbutils_command(
+        self,
+        args: list,
+        timeout: int,
+        capture_binary: bool
+    ) -> Optional[Tuple[bool, Any]]:
+        """
+        通过 adbutils 常驻连接执行命令（返回值与 _run_subprocess_command 一致）
+        
+        - shell: 附加退出码标记，成功标志 = 设备端命令退出码为 0（与 adb shell 一致）
+        - exec-out: 原样返回输出（二进制安全）
+        - pull/push: 走 sync 协议
+        
+        Args:
+            args: ADB 命令参数（不包含 'adb' 和设备 ID）
+            timeout: 超时时间（秒）
+            capture_binary: 是否以二进制模式返回输出
+        
+        Returns:
+            (成功标志, 输出内容)，连接层失败返回 None（由调用方回退到子进程）
+        """
+        service = args[0]
+        try:
+            if service == 'pull':
+                self.adb_device.sync.pull(args[1], args[2])
+                return (True, b'' if capture_binary else '')
+            if service == 'push':
+                self.adb_device.sync.push(args[1], args[2])
+                return (True, b'' if capture_binary else '')
+            
+            # 与 adb 一致：参数用空格拼接后交给设备端 sh 解释
+            command = ' '.join(str(arg) for arg in args[1:])
+            if service == 'shell':
+                # 命令放进子 shell：以 & / 注释结尾或自带 exit 的命令也不会吞掉标记
+                # （换行再闭合括号，避免结尾的 # 注释掉括号）
+                command = f"( {command}\n); echo {SHELL_EXIT_MARKER.decode()}$?"
+            output = self.adb_device.shell(command, timeout=timeout, encoding=None)
+            
+            success = True
+            if service == 'shell':
+                marker_pos = output.rfind(SHELL_EXIT_MARKER)
+                if marker_pos < 0:
+                    return None
+                success = output[marker_pos + len(SHELL_EXIT_MARKER):].strip() == b'0'
+                output = output[:marker_pos]
+            
+            if capture_binary:
+                return (success, output)
+            return (success, output.decode('utf-8', errors='replace').strip())
+        except Exception as e:
+            # 超时直接返回（不再用子进程重试，避免等待时间翻倍）；其他连接错误回退到子进程
+            if isinstance(e, TimeoutError) or type(e).__name__ == 'AdbTimeout':
+                return (False, "命令超时")
+            return None
+    
+    def _run_subprocess_command(
+        self,
+        args: list,
+        timeout: int = 10,
+        capture_binary: bool = False
+    ) -> Tuple[bool, Any]:
+        """
+        通过 adb 子进程运行命令（最后的回退方式）
+        
         Args:
             args: ADB 命令参数（不包含 'adb' 和设备 ID）
             timeout: 超时时间（秒）
@@ -230,6 +520,69 @@ class ADBAutomation:
         print("⚠️  无法获取屏幕尺寸，使用默认值: 1080x2400")
         return (1080, 2400)
     
+    def sample_device_time(
+        self,
+        timeout: float = DEVICE_CLOCK_SAMPLE_TIMEOUT
+    ) -> Optional[Tuple[float, float, float, float]]:
+        """
+        读取一次设备时间（echo $EPOCHREALTIME，不支持时 date +%s.%N）
+        
+        Args:
+            timeout: 超时（秒）
+        
+        Returns:
+            (主机发出时间, 设备时间, 主机收到时间, 设备读数分辨率)，主机时间为 perf_counter；失败返回 None
+        """
+        send = time.perf_counter()
+        success, output = self._run_adb_command(['shell', DEVICE_TIME_COMMAND], timeout=timeout)
+        recv = time.perf_counter()
+        if not success:
+            return None
+        parsed = parse_device_time(output)
+        if parsed is None:
+            return None
+        return (send, parsed[0], recv, parsed[1])
+    
+    def estimate_clock_offset(
+        self,
+        samples: int = DEVICE_CLOCK_SAMPLES,
+        budget: Optional[float] = None
+    ) -> Optional[ClockOffset]:
+        """
+        【优化】估计设备时钟偏差（设备时间 - 主机 time.time()）
+        
+        多次采样，每个样本给出偏差的区间 [读数 - 收到, 读数 - 发出]，取交集（NTP 式最小往返过滤），
+        往返越短的样本界越紧；主机时间用同一个 perf_counter 锚点换算，采样期间不受主机校时影响
+        
+        Args:
+            samples: 采样次数
+            budget: 时间预算（秒）：剩余时间不够一次最短往返时停止采样，单个样本的超时不超过剩余时间；None 表示不限
+        
+        Returns:
+            偏差估计，设备时间读取失败（或预算内没有样本）返回 None
+        """
+        anchor_perf = time.perf_counter()
+        anchor_wall = time.time()
+        deadline = anchor_perf + budget if budget is not None else None
+        collected = []
+        resolution = 0.0
+        shortest_rtt = 0.0
+        for _ in range(samples):
+            timeout = DEVICE_CLOCK_SAMPLE_TIMEOUT
+            if deadline is not None:
+                remaining = deadline - time.perf_counter()
+                if remaining <= shortest_rtt:
+                    break
+                timeout = min(timeout, remaining)
+            sample = self.sample_device_time(timeout)
+            if sample is None:
+                continue
+            send, device_time, recv, sample_resolution = sample
+            resolution = max(resolution, sample_resolution)
+            shortest_rtt = recv - send if not collected else min(shortest_rtt, recv - send)
+            collected.append((anchor_wall + send - anchor_perf, device_time, anchor_wall + recv - anchor_perf))
+        return estimate_offset(collected, resolution)
+    
     def tap(self, x: int, y: int) -> bool:
         """
         点击坐标
@@ -241,9 +594,168 @@ class ADBAutomation:
         Returns:
             是否成功
         """
+        # 【优化】常驻输入通道：一次 socket 写入（<5ms），无需启动 input 工具（100-300ms）
+        if self.input_stream is not None:
+            if self._input_channel_tap(x, y):
+                return True
+        
         success, _ = self._run_adb_command(['shell', 'input', 'tap', str(x), str(y)])
         return success
     
+    def _find_touch_device(self) -> Optional[dict]:
+        """
+        通过 getevent -pl 查找触摸屏设备（带 ABS_MT_POSITION_X/Y 的第一个设备）
+        
+        Returns:
+            {'path': '/dev/input/eventX', 'abs': {code: (min, max)}, 'btn_touch': bool}，未找到返回 None
+        """
+        success, output = self._run_adb_command(['shell', 'getevent', '-pl'])
+        if not success or not output:
+            return None
+        
+        abs_codes = {
+            'ABS_MT_SLOT': ABS_MT_SLOT,
+            'ABS_MT_TOUCH_MAJOR': ABS_MT_TOUCH_MAJOR,
+            'ABS_MT_POSITION_X': ABS_MT_POSITION_X,
+            'ABS_MT_POSITION_Y': ABS_MT_POSITION_Y,
+            'ABS_MT_TRACKING_ID': ABS_MT_TRACKING_ID,
+            'ABS_MT_PRESSURE': ABS_MT_PRESSURE,
+        }
+        # 按 "add device N: /dev/input/eventX" 切分设备块
+        for block in re.split(r'\n(?=add device)', output):
+            path_match = re.search(r'add device \d+:\s*(\S+)', block)
+            if not path_match:
+                continue
+            ranges = {}
+            for name, low, high in re.findall(r'(ABS_MT_\w+)\s*:\s*value -?\d+, min (-?\d+), max (-?\d+)', block):
+                if name in abs_codes:
+                    ranges[abs_codes[name]] = (int(low), int(high))
+            if ABS_MT_POSITION_X in ranges and ABS_MT_POSITION_Y in ranges:
+                return {
+                    'path': path_match.group(1),
+                    'abs': ranges,
+                    'btn_touch': 'BTN_TOUCH' in block,
+                }
+        return None
+    
+    def open_input_channel(self, tap_hold: float = 0.0) -> bool:
+        """
+        【优化】打开常驻输入通道：一条长连接 shell 运行 cat > /dev/input/eventX，
+        点击时直接写入预编码的 input_event（多点触控 type B 协议）
+        
+        Args:
+            tap_hold: 按下到抬起的间隔（秒），0 表示同一次写入
+        
+        Returns:
+            是否打开成功（失败时 tap 继续使用 input tap）
+        """
+        self.close_input_channel()
+        
+        device = self._find_touch_device()
+        if device is None:
+            print("⚠️  未找到触摸屏设备，点击使用 input tap")
+            return False
+        
+        # shell 用户通常属于 input 组，可直接写事件设备
+        success, output = self._run_adb_command(['shell', f"test -w {device['path']} && echo ok"])
+        if not success or output != 'ok':
+            print(f"⚠️  无权写入 {device['path']}，点击使用 input tap")
+            return False
+        
+        # input_event 中 timeval 的长度取决于用户态位数
+        success, abi = self._run_adb_command(['shell', 'getprop', 'ro.product.cpu.abi'])
+        self.input_event_format = '<qqHHi' if (not success or '64' in abi) else '<iiHHi'
+        
+        stream = self.open_shell_stream(f"cat > {device['path']}", writable=True)
+        if stream is None:
+            print("⚠️  输入通道打开失败，点击使用 input tap")
+            return False
+        
+        # 预计算屏幕坐标 -> 触摸坐标的线性映射（竖屏）
+        width, height = self.get_screen_size()
+        x_min, x_max = device['abs'][ABS_MT_POSITION_X]
+        y_min, y_max = device['abs'][ABS_MT_POSITION_Y]
+        self._input_scale = (
+            x_min, (x_max - x_min + 1) / width,
+            y_min, (y_max - y_min + 1) / height,
+        )
+        self.input_device = device
+        self.input_tap_hold = tap_hold
+        self.input_stream = stream
+        print(f"✅ 常驻输入通道已打开: {device['path']} "
+              f"(触摸范围 {x_max - x_min + 1}x{y_max - y_min + 1})")
+        return True
+    
+    def close_input_channel(self):
+        """关闭常驻输入通道"""
+        with self._input_lock:
+            if self.input_stream is not None:
+                self.input_stream.close()
+            self.input_stream = None
+    
+    def _encode_tap_events(self, x: int, y: int) -> Tuple[bytes, bytes]:
+        """
+        预编码一次点击的按下/抬起事件（input_event 二进制序列）
+        
+        Returns:
+            (按下事件, 抬起事件)
+        """
+        pack = struct.Struct(self.input_event_format).pack
+        abs_ranges = self.input_device['abs']
+        x0, sx, y0, sy = self._input_scale
+        
+        self._input_tracking_id = (self._input_tracking_id + 1) & 0xffff
+        down = []
+        if ABS_MT_SLOT in abs_ranges:
+            down.append(pack(0, 0, EV_ABS, ABS_MT_SLOT, 0))
+        down.append(pack(0, 0, EV_ABS, ABS_MT_TRACKING_ID, self._input_tracking_id))
+        down.append(pack(0, 0, EV_ABS, ABS_MT_POSITION_X, int(x0 + x * sx)))
+        down.append(pack(0, 0, EV_ABS, ABS_MT_POSITION_Y, int(y0 + y * sy)))
+        if ABS_MT_TOUCH_MAJOR in abs_ranges:
+            low, high = abs_ranges[ABS_MT_TOUCH_MAJOR]
+            down.append(pack(0, 0, EV_ABS, ABS_MT_TOUCH_MAJOR, low + (high - low) // 8))
+        if ABS_MT_PRESSURE in abs_ranges:
+            low, high = abs_ranges[ABS_MT_PRESSURE]
+            down.append(pack(0, 0, EV_ABS, ABS_MT_PRESSURE, low + (high - low) // 2))
+        if self.input_device['btn_touch']:
+            down.append(pack(0, 0, EV_KEY, BTN_TOUCH, 1))
+        down.append(pack(0, 0, EV_SYN, SYN_REPORT, 0))
+        
+        up = []
+        if ABS_MT_SLOT in abs_ranges:
+            up.append(pack(0, 0, EV_ABS, ABS_MT_SLOT, 0))
+        up.append(pack(0, 0, EV_ABS, ABS_MT_TRACKING_ID, -1))
+        if self.input_device['btn_touch']:
+            up.append(pack(0, 0, EV_KEY, BTN_TOUCH, 0))
+        up.append(pack(0, 0, EV_SYN, SYN_REPORT, 0))
+        return b''.join(down), b''.join(up)
+    
+    def _input_channel_tap(self, x: int, y: int) -> bool:
+        """
+        通过常驻输入通道点击（写入失败时关闭通道，由调用方回退到 input tap）
+        
+        Returns:
+            是否成功
+        """
+        with self._input_lock:
+            stream = self.input_stream
+            if stream is None:
+                return False
+            try:
+                down, up = self._encode_tap_events(x, y)
+                if self.input_tap_hold > 0:
+                    stream.write(down)
+                    time.sleep(self.input_tap_hold)
+                    stream.write(up)
+                else:
+                    stream.write(down + up)
+                return True
+            except Exception as e:
+                print(f"⚠️  输入通道写入失败: {e}，回退到 input tap")
+                stream.close()
+                self.input_stream = None
+                return False
+    
     def take_screenshot(self, filename: str) -> bool:
         """
         截图
@@ -287,6 +799,13 @@ class ADBAutomation:
         print("❌ 截图失败")
         return False
     
+    def get_transfer_times(self) -> Tuple[float, float]:
+        """
+        本线程最近一次截图请求的 (首字节, 末字节) 时间（perf_counter，未知为 NaN）
+        """
+        return getattr(self._transfer, 'last', (float('nan'), float('nan')))
+    
+    @_traced_transfer
     def get_screenshot_data(self) -> Optional[bytes]:
         """
         获取截图数据（优化版：优先使用 adbutils 常驻连接）
@@ -294,16 +813,15 @@ class ADBAutomation:
         Returns:
             截图数据的 bytes，失败返回 None
         """
-        # 【优化】优先使用 adbutils（常驻连接，无 fork 开销，节省 8-15ms）
+        # 【优化】exec-out 优先走 adbutils 常驻连接（无 fork 开销，节省 8-15ms）
         if self.adb_device:
-            try:
-                # 关键：encoding=None 避免额外 decode，直接返回 bytes
-                png_data = self.adb_device.shell("screencap -p", encoding=None)
-                if png_data:
-                    return png_data
-            except Exception as e:
-                # 静默失败，回退到传统方式
-                pass
+            success, png_data = self._run_adb_command(
+                ['exec-out', 'screencap', '-p'],
+                timeout=5,
+                capture_binary=True
+            )
+            if success and png_data:
+                return png_data
         
         # 回退到传统方式（兼容性）
         import tempfile
@@ -342,6 +860,314 @@ class ADBAutomation:
         
         return None
     
+    def _select_capture_mode(self, capture_mode: str):
+        """
+        选择截图传输模式（raw/rows 模式先探测一帧，失败则回退到 png）
+        
+        rows 模式同样依赖 raw 探测得到的头部长度和帧尺寸来计算 dd 偏移
+        
+        Args:
+            capture_mode: 期望的截图传输模式
+        """
+        self.capture_mode = CAPTURE_MODE_PNG
+        self._raw_failures = 0
+        self._rows_failures = 0
+        if capture_mode not in (CAPTURE_MODE_RAW, CAPTURE_MODE_ROWS):
+            return
+        
+        parsed = self.parse_raw_screenshot(self.get_raw_screenshot_data())
+        if parsed is None:
+            print("⚠️  raw 截图不可用，使用 PNG 模式")
+            return
+        
+        width, height, frame_format, _ = parsed
+        self.capture_mode = CAPTURE_MODE_RAW
+        print(f"✅ 截图模式: raw ({width}x{height} {frame_format}, 头部 {self.raw_header_size} 字节)")
+        
+        if capture_mode == CAPTURE_MODE_ROWS:
+            # 用第一行探测设备端 dd 切片是否可用
+            if self.get_screenshot_rows([0]) is None:
+                print("⚠️  设备端行提取不可用，使用 raw 模式")
+                return
+            self.capture_mode = CAPTURE_MODE_ROWS
+            print(f"✅ 截图模式: rows (设备端 dd 切片，只传回检测行)")
+    
+    def set_capture_concurrency(self, concurrency: int):
+        """
+        设置同时在途的截图请求数（流水线截图），预先补足空闲接收缓冲区（请求路径上不再分配）
+        
+        Args:
+            concurrency: 同时在途的截图请求数
+        """
+        needed = WIRE_CAPTURE_BUFFERS + max(0, concurrency - 1)
+        with self._capture_buffer_lock:
+            while len(self._free_capture_buffers) < needed:
+                self._free_capture_buffers.append(RecvBuffer())
+    
+    def _checkout_capture_buffer(self) -> RecvBuffer:
+        """取出一个空闲接收缓冲区（本线程上一次未被取走的缓冲区先归还；空闲列表为空时新建）"""
+        self.release_capture_buffer()
+        with self._capture_buffer_lock:
+            recv_buffer = self._free_capture_buffers.popleft() if self._free_capture_buffers else None
+        if recv_buffer is None:
+            recv_buffer = RecvBuffer()
+        self._transfer.capture_buffer = recv_buffer
+        return recv_buffer
+    
+    def take_capture_buffer(self) -> Optional[RecvBuffer]:
+        """
+        取走本线程最近一次截图使用的接收缓冲区（帧数据仍要使用时调用，用完后交给 release_capture_buffer）
+        
+        Returns:
+            接收缓冲区，本线程没有取出的缓冲区时返回 None
+        """
+        recv_buffer = getattr(self._transfer, 'capture_buffer', None)
+        self._transfer.capture_buffer = None
+        return recv_buffer
+    
+    def release_capture_buffer(self, recv_buffer: Optional[RecvBuffer] = None):
+        """
+        归还接收缓冲区（之后可能被任意截图请求覆盖，归还前应已复制出需要的数据）
+        
+        Args:
+            recv_buffer: 要归还的缓冲区，None 时归还本线程最近一次截图使用的缓冲区
+        """
+        if recv_buffer is None:
+            recv_buffer = self.take_capture_buffer()
+            if recv_buffer is None:
+                return
+        with self._capture_buffer_lock:
+            # 归还到队尾：最近使用过的缓冲区最晚被复用
+            self._free_capture_buffers.append(recv_buffer)
+    
+    def parse_raw_screenshot(self, data: Optional[bytes]) -> Optional[Tuple[int, int, str, memoryview]]:
+        """
+        解析 screencap 原始输出（不带 -p）
+        
+        格式: width(u32) height(u32) format(u32) [colorspace(u32)] + 像素数据（小端）
+        
+        Args:
+            data: screencap 原始输出
+        
+        Returns:
+            (宽度, 高度, 帧格式, 像素数据 memoryview)，无法解析返回 None
+        """
+        if not data or len(data) < RAW_HEADER_SIZES[0]:
+            return None
+        
+        width, height, pixel_format = struct.unpack_from('<III', data, 0)
+        fmt = RAW_PIXEL_FORMATS.get(pixel_format)
+        if fmt is None or width == 0 or height == 0:
+            return None
+        
+        frame_format, bytes_per_pixel = fmt
+        header_size = len(data) - width * height * bytes_per_pixel
+        if header_size not in RAW_HEADER_SIZES:
+            return None
+        
+        self.raw_header_size = header_size
+        self.raw_frame_info = (width, height, frame_format, bytes_per_pixel)
+        # 【优化】memoryview 切片不复制像素数据
+        return width, height, frame_format, memoryview(data)[header_size:]
+    
+    @_traced_transfer
+    def get_raw_screenshot_data(self) -> Optional[bytes]:
+        """
+        获取原始帧缓冲数据（screencap 不带 -p，设备端不做 PNG 编码）
+        
+        启用内置协议客户端时返回指向接收缓冲区的 memoryview：缓冲区从空闲列表取出，
+        在本线程下一次截图或 release_capture_buffer 之前有效（需要更久时用 take_capture_buffer 取走）
+        
+        Returns:
+            screencap 原始输出，失败返回 None
+        """
+        # 【优化】内置协议客户端：recv_into 复用缓冲区，截图循环不再分配新的 bytes
+        if self.wire_client:
+            recv_buffer = self._checkout_capture_buffer()
+            try:
+                raw_data = self.wire_client.exec_into('screencap', recv_buffer, timeout=5,
+                                                      timings=self._transfer.timings)
+                if raw_data:
+                    return raw_data
+            except Exception:
+                # 静默失败，回退到 adbutils/传统方式
+                pass
+            self.release_capture_buffer()
+        
+        # exec-out 不分配 pty，二进制数据不会被换行符转换破坏（优先走 adbutils 常驻连接）
+        success, raw_data = self._run_adb_command(
+            ['exec-out', 'screencap'],
+            timeout=5,
+            capture_binary=True
+        )
+        if success and raw_data:
+            return raw_data
+        return None
+    
+    def get_raw_screenshot(self) -> Optional[Tuple[int, int, str, memoryview]]:
+        """
+        获取并解析一帧原始截图（连续失败时自动回退到 PNG 模式）
+        
+        Returns:
+            (宽度, 高度, 帧格式, 像素数据 memoryview)，失败返回 None
+        """
+        parsed = self.parse_raw_screenshot(self.get_raw_screenshot_data())
+        if parsed is not None:
+            self._raw_failures = 0
+            return parsed
+        
+        self._raw_failures += 1
+        if self._raw_failures >= RAW_CAPTURE_MAX_FAILURES and self.capture_mode == CAPTURE_MODE_RAW:
+            print(f"⚠️  raw 截图连续失败 {self._raw_failures} 次，自动回退到 PNG 模式")
+            self.capture_mode = CAPTURE_MODE_PNG
+        return None
+    
+    def _build_rows_command(self, rows: Tuple[int, ...]) -> Tuple[str, list]:
+        """
+        构造设备端行提取命令（screencap 写临时文件，dd 按偏移切出需要的行）
+        
+        连续的行合并为一段；dd 的块大小取 gcd(头部长度, 行字节数)，
+        使每段的字节偏移都能用 skip/count 精确表达（不依赖 iflag=skip_bytes 等扩展参数）
+        
+        Args:
+            rows: 升序排列的行号
+        
+        Returns:
+            (命令, [(起始行, 行数), ...])
+        """
+        width, _, _, bytes_per_pixel = self.raw_frame_info
+        row_bytes = width * bytes_per_pixel
+        block = gcd(self.raw_header_size, row_bytes)
+        
+        # 合并连续行，减少 dd 次数
+        runs = []
+        for y in rows:
+            if runs and runs[-1][0] + runs[-1][1] == y:
+                runs[-1][1] += 1
+            else:
+                runs.append([y, 1])
+        
+        parts = [f"screencap $f"]
+        for start, count in runs:
+            skip = (self.raw_header_size + start * row_bytes) // block
+            parts.append(f"dd if=$f bs={block} skip={skip} count={count * row_bytes // block} 2>/dev/null")
+        command = f"f={ROWS_CAPTURE_TEMP_PATH}; " + " && ".join(parts) + "; rm -f $f"
+        return command, [tuple(run) for run in runs]
+    
+    @_traced_transfer
+    def get_screenshot_rows(self, rows: Iterable[int]) -> Optional[Tuple[int, str, Dict[int, memoryview]]]:
+        """
+        【优化】设备端行提取：只把指定行传回主机（1080 宽约 4KB/行，整帧约 10MB）
+        
+        连续失败时自动回退到 raw 模式
+        
+        Args:
+            rows: 需要的行号（y 坐标）
+        
+        Returns:
+            (宽度, 帧格式, {y: 行像素 memoryview})，失败返回 None
+        """
+        if self.raw_frame_info is None or self.raw_header_size is None:
+            return None
+        
+        key = tuple(sorted(set(rows)))
+        width, height, frame_format, bytes_per_pixel = self.raw_frame_info
+        if not key or key[0] < 0 or key[-1] >= height:
+            return None
+        
+        if key not in self._rows_command_cache:
+            self._rows_command_cache[key] = self._build_rows_command(key)
+        command, runs = self._rows_command_cache[key]
+        
+        row_bytes = width * bytes_per_pixel
+        success, data = self._run_adb_command(['exec-out', command], timeout=5, capture_binary=True)
+        if success and data and len(data) == len(key) * row_bytes:
+            # memoryview 切片，不复制行数据
+            view = memoryview(data)
+            result = {}
+            offset = 0
+            for start, count in runs:
+                for y in range(start, start + count):
+                    result[y] = view[offset:offset + row_bytes]
+                    offset += row_bytes
+            self._rows_failures = 0
+            return width, frame_format, result
+        
+        self._rows_failures += 1
+        if self._rows_failures >= RAW_CAPTURE_MAX_FAILURES and self.capture_mode == CAPTURE_MODE_ROWS:
+            print(f"⚠️  行提取连续失败 {self._rows_failures} 次，自动回退到 raw 模式")
+            self.capture_mode = CAPTURE_MODE_RAW
+        return None
+    
+    def open_shell_stream(self, command: str, writable: bool = False) -> Optional[ShellStream]:
+        """
+        打开长连接 shell 流（优先 adbutils 常驻连接，失败回退到 adb 子进程）
+        
+        Args:
+            command: 设备端命令
+            writable: 是否需要向命令的 stdin 写入数据
+        
+        Returns:
+            ShellStream，失败返回 None
+        """
+        if self.wire_client:
+            try:
+                # 输入通道（可写）使用 tap 通道的预热连接
+                sock = self.wire_client.open_stream(
+                    f"exec:{command}",
+                    channel='tap' if writable else 'capture'
+                )
+                return ShellStream(sock=sock)
+            except Exception:
+                # 静默失败，回退到 adbutils/传统方式
+                pass
+        
+        if self.adb_device:
+            try:
+                connection = self.adb_device.shell(command, stream=True)
+                return ShellStream(sock=connection.conn, connection=connection)
+            except Exception:
+                # 静默失败，回退到传统方式
+                pass
+        
+        cmd = [self.adb_path]
+        if self.device_id:
+            cmd.extend(['-s', self.device_id])
+        # exec-out / shell -T 都不分配 pty，二进制数据不会被换行符转换破坏
+        cmd.extend(['shell', '-T', command] if writable else ['exec-out', command])
+        try:
+            process = subprocess.Popen(
+                cmd,
+                stdin=subprocess.PIPE if writable else subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                bufsize=0
+            )
+            return ShellStream(process=process)
+        except Exception as e:
+            print(f"❌ 打开 shell 流失败: {e}")
+            return None
+    
+    def open_screenrecord_stream(
+        self,
+        bit_rate: int = 8000000,
+        size: Optional[Tuple[int, int]] = None
+    ) -> Optional[ShellStream]:
+        """
+        打开 screenrecord H.264 裸流（一条长连接持续输出编码帧）
+        
+        Args:
+            bit_rate: 编码码率（bps）
+            size: 输出分辨率 (宽, 高)，None 使用设备默认
+        
+        Returns:
+            ShellStream，失败返回 None
+        """
+        command = f"screenrecord --output-format=h264 --bit-rate {int(bit_rate)}"
+        if size:
+            command += f" --size {size[0]}x{size[1]}"
+        return self.open_shell_stream(command + " -")
+    
     def get_ui_hierarchy(self, filename: str) -> bool:
         """
         获取 UI 层次结构
@@ -0,0 +1,505 @@
+"""
+离线回放后端（代替真机）
+把录制好的截图序列按原始时间间隔"播放"出来，实现 TimedMultiThreadPurchase 用到的 ADBAutomation
+截图/点击接口，状态机、检测、点击节奏全部原样运行，不需要手机：
+
+- 帧来源：目录或 zip 中的 PNG（时间取自文件名中的 YYYYmmdd_HHMMSS[_mmm]，
+  或调试截图目录的 index.jsonl，都没有时用文件修改时间），或会话录制的帧归档（.tkarc，
+  画面由最近的关键帧 + 该帧检测行重建，时间取自录制时的截图时间）
+- speed=1 按原始节奏实时回放，speed=N 加速 N 倍，speed=0 尽快回放（每次截图前进一帧）；
+  尽快回放时每帧等检测线程处理完（TimedMultiThreadPurchase 调用 acknowledge_frame）再前进，
+  每一帧都会被检测，结果可复现（需要连时间也可复现时用 sim_clock.py 的虚拟时钟）
+- 点击不发送到任何设备，只记录（时间、坐标、当时屏幕上的帧）
+
+用法：
+    python adb_replay.py temp_screenshots --speed 0
+    python adb_replay.py session.zip --speed 1 --capture-mode rows
+    python adb_replay.py temp_recordings/session_20260122_090000_000.tkarc --speed 1
+"""
+import bisect
+import json
+import os
+import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple, List, Dict, Iterable, Callable, NamedTuple, Union
+
+from adb_automation import CAPTURE_MODE_PNG, CAPTURE_MODE_RAW, CAPTURE_MODE_ROWS
+from frame_archive import ARCHIVE_MAGIC, FrameArchiveReader, convert_format
+from sim_clock import SystemClock, SYSTEM_CLOCK
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+try:
+    from PIL import Image
+    from io import BytesIO
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+REPLAY_MAX_GAP = 2.0          # 相邻帧的最大时间间隔（秒），录制中更长的空档压缩到这个值
+REPLAY_DECODE_CACHE = 4       # 解码后的帧缓存个数（整帧 RGBA 约 10MB/帧）
+REPLAY_DEFAULT_INTERVAL = 0.2  # 无法得到时间戳时相邻帧的间隔（秒）
+REPLAY_ACK_TIMEOUT = 1.0      # 尽快回放：等待上一帧处理完成的最长时间（秒，没有检测线程处理该帧时不至于卡住）
+
+# 文件名中的时间戳：20260121_224019 或 20260122_090000_123
+FILENAME_TIME_PATTERN = re.compile(r'(\d{8})_(\d{6})(?:_(\d{1,6}))?')
+
+
+class ReplayFrame(NamedTuple):
+    """回放序列中的一帧"""
+    name: str
+    offset: float                         # 相对第一帧的回放时间（秒）
+    load: Callable[[], Union[bytes, 'np.ndarray']]  # 读取 PNG 数据（帧归档直接给出 RGBA 画面）
+
+
+class ReplayTap(NamedTuple):
+    """回放中收到的一次点击"""
+    offset: float       # 回放时间（秒）
+    x: int
+    y: int
+    frame_index: int    # 点击时屏幕上的帧
+    frame_name: str
+
+
+def _parse_filename_time(name: str) -> Optional[float]:
+    """从文件名解析时间戳（秒），没有时间戳返回 None"""
+    match = FILENAME_TIME_PATTERN.search(os.path.basename(name))
+    if not match:
+        return None
+    date_part, time_part, fraction = match.groups()
+    try:
+        moment = datetime.strptime(date_part + time_part, '%Y%m%d%H%M%S')
+    except ValueError:
+        return None
+    seconds = moment.timestamp()
+    if fraction:
+        seconds += int(fraction) / (10 ** len(fraction))
+    return seconds
+
+
+def _read_file(path: str) -> Callable[[], bytes]:
+    def load() -> bytes:
+        with open(path, 'rb') as f:
+            return f.read()
+    return load
+
+
+def _scan_directory(path: str) -> List[Tuple[str, Optional[float], Callable[[], bytes]]]:
+    """目录中的帧：优先使用调试截图的 index.jsonl，否则扫描 PNG 文件"""
+    index_path = os.path.join(path, 'index.jsonl')
+    entries = []
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    timestamp = datetime.strptime(record['time'], '%Y-%m-%d %H:%M:%S.%f').timestamp()
+                except (ValueError, KeyError):
+                    continue
+                entries.append((record['name'], timestamp, _read_file(os.path.join(path, record['object']))))
+        if entries:
+            return entries
+
+    for root, _, files in os.walk(path):
+        for filename in files:
+            if not filename.lower().endswith('.png'):
+                continue
+            file_path = os.path.join(root, filename)
+            timestamp = _parse_filename_time(filename)
+            if timestamp is None:
+                timestamp = os.path.getmtime(file_path)
+            entries.append((filename, timestamp, _read_file(file_path)))
+    return entries
+
+
+def _scan_zip(path: str) -> List[Tuple[str, Optional[float], Callable[[], bytes]]]:
+    """zip 中的 PNG（每次读取时重新打开，解码线程与截图线程可以并发读取）"""
+    entries = []
+    with zipfile.ZipFile(path) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith('.png'):
+                continue
+            timestamp = _parse_filename_time(info.filename)
+            if timestamp is None:
+                timestamp = datetime(*info.date_time).timestamp()
+
+            def load(member=info.filename) -> bytes:
+                with zipfile.ZipFile(path) as zf:
+                    return zf.read(member)
+            entries.append((info.filename, timestamp, load))
+    return entries
+
+
+def _is_archive(path: str) -> bool:
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+
+
+def _scan_archive(path: str) -> List[Tuple[str, Optional[float], Callable[[], 'np.ndarray']]]:
+    """帧归档中的每一帧（含未变化的帧，保留原始截图节奏）"""
+    reader = FrameArchiveReader(path)
+    entries = []
+    for i in range(len(reader)):
+        entry = reader.entry(i)
+
+        def load(index=i) -> 'np.ndarray':
+            frame, frame_format = reader.reconstruct(index)
+            return convert_format(frame, frame_format, 'RGBA')
+        entries.append((f"frame_{i:06d}#{entry.frame_id}", reader.wall_time(entry.capture_start), load))
+    return entries
+
+
+def load_replay_frames(source: str, max_gap: float = REPLAY_MAX_GAP) -> List[ReplayFrame]:
+    """
+    读取回放序列（按时间排序，超过 max_gap 的空档压缩为 max_gap）
+
+    Args:
+        source: 目录、zip 文件或帧归档
+        max_gap: 相邻帧最大间隔（秒），<=0 表示不压缩
+
+    Returns:
+        [ReplayFrame, ...]
+    """
+    if _is_archive(source):
+        entries = _scan_archive(source)
+    elif zipfile.is_zipfile(source):
+        entries = _scan_zip(source)
+    elif os.path.isdir(source):
+        entries = _scan_directory(source)
+    else:
+        entries = [(os.path.basename(source), _parse_filename_time(source), _read_file(source))]
+
+    entries.sort(key=lambda entry: (entry[1] or 0.0, entry[0]))
+    frames = []
+    offset = 0.0
+    for i, (name, timestamp, load) in enumerate(entries):
+        if i > 0:
+            previous = entries[i - 1][1]
+            gap = timestamp - previous if timestamp is not None and previous is not None else REPLAY_DEFAULT_INTERVAL
+            if max_gap > 0:
+                gap = min(gap, max_gap)
+            offset += max(0.0, gap)
+        frames.append(ReplayFrame(name, offset, load))
+    return frames
+
+
+class ReplayAutomation:
+    """
+    回放设备：实现 TimedMultiThreadPurchase 使用的 ADBAutomation 截图/点击接口
+
+    回放时钟在第一次截图时开始；回放结束后保持最后一帧，并设置 finished 事件
+    """
+
+    def __init__(
+        self,
+        source: str,
+        speed: float = 1.0,
+        max_gap: float = REPLAY_MAX_GAP,
+        clock: SystemClock = SYSTEM_CLOCK,
+        capture_latency: float = 0.0,
+        lockstep: bool = True
+    ):
+        """
+        Args:
+            source: 帧目录或 zip 文件
+            speed: 回放速度（1 为实时，0 为尽快回放：每次截图前进一帧）
+            max_gap: 相邻帧最大间隔（秒）
+            clock: 回放时钟（虚拟时间仿真时与 TimedMultiThreadPurchase 共用同一个 VirtualClock）
+            capture_latency: 每次截图的模拟耗时（秒）；虚拟时间下计算不消耗时间，
+                背靠背截图（截图节奏 max 阶段不等待）需要它推进虚拟时间
+            lockstep: 尽快回放时是否等上一帧处理完（acknowledge_frame）再前进到下一帧；
+                没有调用方确认时（如模拟 adb 设备）应关闭
+        """
+        self.source = source
+        self.speed = speed
+        self.clock = clock
+        self.capture_latency = capture_latency
+        self.frames = load_replay_frames(source, max_gap)
+        self.device_id = f"replay:{os.path.basename(os.path.normpath(source))}"
+        self.capture_mode = CAPTURE_MODE_RAW
+        self.wire_client = None
+
+        self.finished = threading.Event()
+        self.taps: List[ReplayTap] = []
+        self.captures = 0
+        self._start_time: Optional[float] = None
+        self._next_index = 0  # 尽快回放模式下一次截图的帧
+        self._served_times: List[float] = []  # 每次截图的时间（perf_counter），用于把时间映射回帧
+        self._served_indexes: List[int] = []  # 每次截图得到的帧下标
+        self._lock = threading.Lock()
+        # 尽快回放的逐帧确认：上一帧确认前，下一次截图不前进
+        self.lockstep = lockstep and speed <= 0
+        self.ack_timeouts = 0
+        self._ack_cond = threading.Condition()
+        self._awaiting_ack = False
+        self._decoded: 'OrderedDict[int, Tuple[np.ndarray, bytes]]' = OrderedDict()
+        self._screen_size: Optional[Tuple[int, int]] = None
+
+    # ---------- 连接 ----------
+    def connect(self, capture_mode: str = CAPTURE_MODE_RAW, **kwargs) -> bool:
+        """载入第一帧确定屏幕尺寸（其他连接参数忽略）"""
+        if not self.frames:
+            print(f"❌ 回放源中没有帧: {self.source}")
+            return False
+        if not NUMPY_AVAILABLE or not (OPENCV_AVAILABLE or PIL_AVAILABLE):
+            print("❌ 回放需要 numpy 和 OpenCV/PIL")
+            return False
+        self.capture_mode = capture_mode
+        frame, _ = self._decode(0)
+        self._screen_size = (frame.shape[1], frame.shape[0])
+        duration = self.frames[-1].offset
+        print(f"✅ 回放源: {self.source} ({len(self.frames)} 帧, 时长 {duration:.1f} 秒, "
+              f"速度 {'尽快' if self.speed <= 0 else f'{self.speed:g}x'}, 截图模式 {capture_mode})")
+        return True
+
+    def close(self):
+        """释放解码缓存"""
+        self._decoded.clear()
+
+    def get_screen_size(self) -> Tuple[int, int]:
+        if self._screen_size is None:
+            frame, _ = self._decode(0)
+            self._screen_size = (frame.shape[1], frame.shape[0])
+        return self._screen_size
+
+    def set_capture_concurrency(self, concurrency: int):
+        """回放没有接收缓冲区，忽略"""
+
+    def get_transfer_times(self) -> Tuple[float, float]:
+        """回放没有传输环节"""
+        return float('nan'), float('nan')
+
+    def open_screenrecord_stream(self, *args, **kwargs):
+        """回放不提供视频流（截图后端回退到逐帧截图）"""
+        return None
+
+    def open_input_channel(self, tap_hold: float = 0.0) -> bool:
+        return False
+
+    def close_input_channel(self):
+        pass
+
+    # ---------- 回放时钟 ----------
+    def _elapsed(self, now: float) -> float:
+        """当前回放时间（秒），第一次调用时开始计时"""
+        if self._start_time is None:
+            self._start_time = now
+        return (now - self._start_time) * self.speed
+
+    def offset_of(self, timestamp: float) -> float:
+        """某一时刻（perf_counter）的回放时间（尽快回放模式为实际经过的秒数）"""
+        if self._start_time is None:
+            return 0.0
+        return (timestamp - self._start_time) * (self.speed if self.speed > 0 else 1.0)
+
+    def _index_at(self, elapsed: float) -> int:
+        """回放时间对应的帧（最后一个 offset <= elapsed 的帧）"""
+        low, high = 0, len(self.frames) - 1
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.frames[mid].offset <= elapsed:
+                low = mid
+            else:
+                high = mid - 1
+        return low
+
+    def acknowledge_frame(self):
+        """调用方已处理完最近一次截图的帧（检测完成 / 画面未变化 / 未发布），尽快回放模式下允许前进"""
+        if not self.lockstep:
+            return
+        with self._ack_cond:
+            self._awaiting_ack = False
+            self.clock.notify_all(self._ack_cond)
+
+    def _wait_for_ack(self):
+        """尽快回放：等上一帧被确认（超时后照常前进，计入 ack_timeouts）"""
+        with self._ack_cond:
+            deadline = self.clock.perf_counter() + REPLAY_ACK_TIMEOUT
+            while self._awaiting_ack:
+                remaining = deadline - self.clock.perf_counter()
+                if remaining <= 0:
+                    self.ack_timeouts += 1
+                    break
+                self.clock.wait(self._ack_cond, remaining)
+            self._awaiting_ack = True
+
+    def _next_frame_index(self) -> int:
+        """本次截图得到的帧"""
+        if self.lockstep:
+            self._wait_for_ack()
+        now = self.clock.perf_counter()
+        with self._lock:
+            if self.speed <= 0:
+                self._elapsed(now)
+                index = min(self._next_index, len(self.frames) - 1)
+                self._next_index += 1
+                if self._next_index >= len(self.frames):
+                    self.finished.set()
+            else:
+                elapsed = self._elapsed(now)
+                index = self._index_at(elapsed)
+                if elapsed >= self.frames[-1].offset:
+                    self.finished.set()
+            self.captures += 1
+            # 截图耗时结束时画面才送达（虚拟时间下与同一时刻的阶段切换区分开）
+            self._served_times.append(now + self.capture_latency)
+            self._served_indexes.append(index)
+        if self.capture_latency > 0:
+            self.clock.sleep(self.capture_latency)
+        return index
+
+    def frame_at(self, timestamp: float) -> int:
+        """某一时刻（perf_counter）屏幕上的帧（回放开始前为 -1）"""
+        if self._start_time is None or timestamp < self._start_time:
+            return -1
+        if self.speed > 0:
+            return self._index_at((timestamp - self._start_time) * self.speed)
+        with self._lock:
+            position = bisect.bisect_right(self._served_times, timestamp)
+            return self._served_indexes[position - 1] if position else -1
+
+    def _decode(self, index: int) -> Tuple['np.ndarray', Optional[bytes]]:
+        """解码一帧为 RGBA（结果缓存，连续截图同一帧不重复解码）"""
+        with self._lock:
+            cached = self._decoded.get(index)
+            if cached is not None:
+                self._decoded.move_to_end(index)
+                return cached
+
+        png_data = self.frames[index].load()
+        frame = None
+        if isinstance(png_data, np.ndarray):
+            frame, png_data = png_data, None
+        elif OPENCV_AVAILABLE:
+            decoded = cv2.imdecode(np.frombuffer(png_data, np.uint8), cv2.IMREAD_COLOR)
+            if decoded is not None:
+                frame = cv2.cvtColor(decoded, cv2.COLOR_BGR2RGBA)
+        if frame is None and PIL_AVAILABLE:
+            frame = np.array(Image.open(BytesIO(png_data)).convert('RGBA'))
+        if frame is None:
+            raise ValueError(f"无法解码回放帧: {self.frames[index].name}")
+        frame = np.ascontiguousarray(frame)
+        frame.setflags(write=False)
+
+        with self._lock:
+            self._decoded[index] = (frame, png_data)
+            while len(self._decoded) > REPLAY_DECODE_CACHE:
+                self._decoded.popitem(last=False)
+        return frame, png_data
+
+    # ---------- 截图接口 ----------
+    def get_screenshot_data(self) -> Optional[bytes]:
+        """PNG 模式：返回原始 PNG 数据（帧归档重建的画面现场编码）"""
+        index = self._next_frame_index()
+        data = self.frames[index].load()
+        if not isinstance(data, np.ndarray):
+            return data
+        frame, _ = self._decode(index)
+        if not OPENCV_AVAILABLE:
+            return None
+        success, encoded = cv2.imencode('.png', cv2.cvtColor(frame, cv2.COLOR_RGBA2BGRA))
+        return encoded.tobytes() if success else None
+
+    def get_raw_screenshot(self) -> Optional[Tuple[int, int, str, memoryview]]:
+        """raw 模式：(宽度, 高度, 'RGBA', 像素数据)"""
+        frame, _ = self._decode(self._next_frame_index())
+        return frame.shape[1], frame.shape[0], 'RGBA', memoryview(frame).cast('B')
+
+    def get_screenshot_rows(self, rows: Iterable[int]) -> Optional[Tuple[int, str, Dict[int, memoryview]]]:
+        """rows 模式：(宽度, 'RGBA', {y: 行像素})"""
+        frame, _ = self._decode(self._next_frame_index())
+        height = frame.shape[0]
+        result = {}
+        for y in rows:
+            if not 0 <= y < height:
+                return None
+            result[y] = memoryview(frame[y]).cast('B')
+        return frame.shape[1], 'RGBA', result
+
+    # ---------- 点击 ----------
+    def tap(self, x: int, y: int) -> bool:
+        """记录点击（不发送到设备）"""
+        now = self.clock.perf_counter()
+        index = self.frame_at(now)
+        with self._lock:
+            self.taps.append(ReplayTap(self.offset_of(now), x, y, index,
+                                       self.frames[index].name if index >= 0 else ''))
+        return True
+
+    # ---------- 报告 ----------
+    def print_report(self, purchase=None):
+        """输出回放结果：阶段切换（及当时的帧）、点击、截图次数"""
+        print("\n" + "=" * 60)
+        print("🎞️  回放报告")
+        print("=" * 60)
+        served = len(set(self._served_indexes))
+        print(f"📸 截图 {self.captures} 次, 覆盖 {served}/{len(self.frames)} 帧")
+        if self.ack_timeouts:
+            print(f"⏱️  逐帧确认超时 {self.ack_timeouts} 次（该帧没有被检测，超时后继续前进）")
+
+        if purchase is not None and purchase.detection_engine is not None:
+            trace = purchase.latency_trace
+            stage_names = purchase.detection_engine.stage_names
+            count = min(trace.transition_count, len(trace.transitions))
+            print(f"🔀 阶段切换 {count} 次:")
+            for stage_index, _, switched in trace.transitions[:count]:
+                index = self.frame_at(switched)
+                frame_name = self.frames[index].name if index >= 0 else '-'
+                print(f"  - +{self.offset_of(switched):.3f}s -> {stage_names[int(stage_index)]} (帧 {index}: {frame_name})")
+
+        print(f"👆 点击 {len(self.taps)} 次:")
+        for tap in self.taps:
+            print(f"  - +{tap.offset:.3f}s ({tap.x}, {tap.y}) 帧 {tap.frame_index}: {tap.frame_name}")
+        print("=" * 60)
+
+
+def main():
+    """用录制的截图序列回放完整抢购流程"""
+    import argparse
+    from fast_multi_thread_purchase import TimedMultiThreadPurchase
+
+    parser = argparse.ArgumentParser(description='离线回放截图序列（不需要手机）')
+    parser.add_argument('source', help='帧目录（PNG / 调试截图目录）或 zip 文件')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放速度（1 实时，0 尽快回放：每帧检测完再前进）')
+    parser.add_argument('--max-gap', type=float, default=REPLAY_MAX_GAP, help='相邻帧最大间隔（秒）')
+    parser.add_argument('--capture-mode', default=CAPTURE_MODE_RAW,
+                        choices=(CAPTURE_MODE_RAW, CAPTURE_MODE_PNG, CAPTURE_MODE_ROWS), help='截图传输模式')
+    parser.add_argument('--initial-stage', default=None, help='初始阶段')
+    parser.add_argument('--linger', type=float, default=1.0, help='回放结束后继续运行的时间（秒）')
+    args = parser.parse_args()
+
+    auto = ReplayAutomation(args.source, args.speed, args.max_gap)
+    if not auto.connect(capture_mode=args.capture_mode):
+        return
+
+    purchase = TimedMultiThreadPurchase(auto, capture_backend='screencap')
+
+    def stop_when_finished():
+        auto.finished.wait()
+        time.sleep(args.linger)
+        purchase.running.clear()
+
+    threading.Thread(target=stop_when_finished, daemon=True).start()
+    purchase.run_timed_purchase(datetime.now(), initial_stage=args.initial_stage)
+    auto.print_report(purchase)
+    auto.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""
+H.264 视频流截图后端
+通过一条长连接的 screenrecord 输出 H.264 裸流，在主机端持续解码，
+始终保留"最新一帧"，避免每帧一次 screencap 请求/响应往返
+
+screenrecord 只在画面变化时输出新帧：静止画面没有新帧，不代表截图卡住。
+解码器已追上数据流（收到的数据都已解码，正在等待新数据）时，最新一帧就是当前画面，
+current_as_of() 据此给出"最新一帧至少在这个时刻仍是当前画面"的时间，供帧龄守卫刷新时间戳
+
+用法（用录制好的 .h264 文件代替真机测试）：
+    python adb_stream_capture.py recording.h264 --fps 30
+"""
+import threading
+import time
+from typing import Optional, Callable, Any
+
+try:
+    import av  # PyAV：FFmpeg 的 H.264 解码器
+    AV_AVAILABLE = True
+except ImportError:
+    AV_AVAILABLE = False
+
+STREAM_READ_SIZE = 65536       # 每次从流读取的字节数
+STREAM_RECONNECT_DELAY = 0.2   # 流断开后的重连间隔（秒），screenrecord 有 3 分钟时长限制
+
+
+class H264FileSource:
+    """
+    H.264 文件流（代替真机的 screenrecord 输出，用于测试和基准）
+
+    接口与 ShellStream 一致：read(size) / close()
+    """
+
+    def __init__(self, path: str, chunk_interval: float = 0.0):
+        """
+        Args:
+            path: .h264 裸流文件路径
+            chunk_interval: 每读一块后的等待时间（秒），模拟 USB 传输节奏，0 表示尽快读取
+        """
+        self.file = open(path, 'rb')
+        self.chunk_interval = chunk_interval
+
+    def read(self, size: int = STREAM_READ_SIZE) -> bytes:
+        """读取最多 size 字节，文件结束返回 b''"""
+        if self.chunk_interval > 0:
+            time.sleep(self.chunk_interval)
+        return self.file.read(size)
+
+    def close(self):
+        """关闭文件"""
+        self.file.close()
+
+
+class H264StreamCapture:
+    """
+    H.264 流解码器：后台线程持续读取 + 解码，发布最新一帧
+
+    每解码出一帧调用一次 on_frame(frame, 'BGR', capture_time)，调用方负责发布
+    （TimedMultiThreadPurchase 接入现有的 latest_frame / latest_slim_frame / frame_id）
+    """
+
+    def __init__(
+        self,
+        open_stream: Callable[[], Any],
+        on_frame: Callable,
+        reconnect: bool = True,
+        pace_fps: Optional[float] = None
+    ):
+        """
+        Args:
+            open_stream: 打开数据流的工厂函数，返回带 read(size)/close() 的对象，失败返回 None
+            on_frame: 新帧回调 on_frame(frame: np.ndarray, frame_format: str, capture_time: float)
+            reconnect: 流结束后是否重新打开（真机 screenrecord 需要；文件回放设为 False）
+            pace_fps: 按指定帧率发布（文件回放时模拟真机节奏），None 表示解码多快就发布多快
+        """
+        self.open_stream = open_stream
+        self.on_frame = on_frame
+        self.reconnect = reconnect
+        self.pace_fps = pace_fps
+
+        self.running = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.stream = None
+
+        # 统计信息
+        self.frames_decoded = 0
+        self.bytes_received = 0
+        self.reconnects = 0
+        self.last_frame_time = 0.0
+        self.start_time = 0.0
+        # 解码器追上数据流的时刻：流已连接、收到的数据都已解码后开始等待新数据（perf_counter）
+        self._caught_up_since: Optional[float] = None
+        self._waiting = False  # 是否正阻塞在 read 上等待新数据
+
+    @classmethod
+    def from_file(cls, path: str, on_frame: Callable, pace_fps: Optional[float] = 30.0) -> 'H264StreamCapture':
+        """用录制好的 .h264 文件代替真机（离线测试）"""
+        return cls(lambda: H264FileSource(path), on_frame, reconnect=False, pace_fps=pace_fps)
+
+    def start(self) -> bool:
+        """启动后台解码线程"""
+        if not AV_AVAILABLE:
+            print("⚠️  PyAV 未安装，无法使用视频流截图")
+            print("   安装命令: pip install av")
+            return False
+        self.running.set()
+        self.start_time = time.perf_counter()
+        self.thread = threading.Thread(target=self._decode_loop, daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        """停止解码线程并关闭流"""
+        self.running.clear()
+        if self.stream is not None:
+            self.stream.close()
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+
+    def current_as_of(self) -> Optional[float]:
+        """
+        最新一帧至少在这个时刻仍是当前画面（perf_counter）
+
+        Returns:
+            正在等待新数据时为现在；正在解码时为开始读取这块数据的时刻；
+            流未连接（重连中）或还没有帧时返回 None
+        """
+        caught_up = self._caught_up_since
+        if caught_up is None or not self.frames_decoded:
+            return None
+        return time.perf_counter() if self._waiting else caught_up
+
+    def get_fps(self) -> float:
+        """平均解码帧率"""
+        elapsed = time.perf_counter() - self.start_time
+        return self.frames_decoded / elapsed if elapsed > 0 else 0.0
+
+    def _decode_loop(self):
+        """读取流 -> 切分 NAL -> 解码 -> 回调（流断开时按需重连）"""
+        while self.running.is_set():
+            self.stream = self.open_stream()
+            if self.stream is None:
+                time.sleep(STREAM_RECONNECT_DELAY)
+                continue
+
+            try:
+                self._decode_stream(self.stream)
+            except Exception as e:
+                if self.running.is_set():
+                    print(f"⚠️ 视频流解码错误: {e}")
+            finally:
+                # 流断开：重连前画面变化收不到，最新一帧不再视为当前画面
+                self._waiting = False
+                self._caught_up_since = None
+                self.stream.close()
+
+            if not self.reconnect:
+                break
+            self.reconnects += 1
+            time.sleep(STREAM_RECONNECT_DELAY)
+
+        self.running.clear()
+
+    def _decode_stream(self, stream):
+        """解码一条流直到结束"""
+        # 每条流新建解码器（重连后 SPS/PPS 会重新发送）
+        codec = av.CodecContext.create('h264', 'r')
+        # 只用切片级多线程：帧级多线程会引入 N 帧的解码延迟
+        codec.thread_type = 'SLICE'
+        frame_interval = 1.0 / self.pace_fps if self.pace_fps else 0.0
+
+        while self.running.is_set():
+            self._caught_up_since = time.perf_counter()
+            self._waiting = True
+            chunk = stream.read(STREAM_READ_SIZE)
+            self._waiting = False
+            if not chunk:
+                break
+            self.bytes_received += len(chunk)
+            for packet in codec.parse(chunk):
+                for video_frame in codec.decode(packet):
+                    self._emit(video_frame, frame_interval)
+
+        # 冲刷解码器中剩余的帧
+        for video_frame in codec.decode(None):
+            self._emit(video_frame, frame_interval)
+
+    def _emit(self, video_frame, frame_interval: float):
+        """转换为 BGR numpy 并回调"""
+        if not self.running.is_set():
+            return
+        if frame_interval > 0:
+            wait = self.last_frame_time + frame_interval - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+
+        frame = video_frame.to_ndarray(format='bgr24')
+        capture_time = time.perf_counter()
+        self.last_frame_time = capture_time
+        self.frames_decoded += 1
+        self.on_frame(frame, 'BGR', capture_time)
+
+
+def main():
+    """离线测试：解码 .h264 文件并输出帧率/新鲜度"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='H.264 视频流截图后端离线测试')
+    parser.add_argument('path', help='录制好的 .h264 裸流文件（adb exec-out screenrecord --output-format=h264 - > x.h264）')
+    parser.add_argument('--fps', type=float, default=30.0, help='模拟真机帧率（0 表示尽快解码）')
+    args = parser.parse_args()
+
+    intervals = []
+    state = {'last': None, 'shape': None}
+
+    def on_frame(frame, frame_format, capture_time):
+        if state['last'] is not None:
+            intervals.append(capture_time - state['last'])
+        state['last'] = capture_time
+        state['shape'] = frame.shape
+
+    capture = H264StreamCapture.from_file(args.path, on_frame, pace_fps=args.fps or None)
+    if not capture.start():
+        return
+    capture.thread.join()
+
+    print(f"📊 解码帧数: {capture.frames_decoded}, 平均帧率: {capture.get_fps():.1f} fps")
+    if state['shape'] is not None:
+        print(f"   帧尺寸: {state['shape'][1]}x{state['shape'][0]}")
+    if intervals:
+        intervals.sort()
+        print(f"   帧间隔 p50: {intervals[len(intervals) // 2] * 1000:.1f}ms, "
+              f"最大: {intervals[-1] * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
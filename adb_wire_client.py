@@ -0,0 +1,349 @@
+"""
+ADB 服务端协议客户端（可选，替代 adbutils）
+直接与本机 adb server（默认 127.0.0.1:5037）通信：
+
+- host:transport:<serial>  切换到设备传输（预先完成，放入连接池"预热"）
+- exec:<cmd>               原始输出流（截图，二进制安全）
+- shell,v2,raw:<cmd>       带退出码的 shell（命令通道）
+
+优化点：
+- 每个通道（capture / tap / command）有独立的预热连接池，请求时只需发送服务名
+- recv_into 写入预分配、可复用的 bytearray，截图循环不再为每帧分配新的 bytes
+"""
+import os
+import socket
+import struct
+import threading
+import time
+from collections import deque
+from typing import Optional, Tuple, Dict
+
+ADB_SERVER_HOST = '127.0.0.1'
+ADB_SERVER_PORT = int(os.environ.get('ANDROID_ADB_SERVER_PORT', '5037'))
+
+WIRE_POOL_SIZE = 2          # 每个通道保持的预热连接数
+WIRE_CONNECT_TIMEOUT = 5.0  # 建立连接/切换传输的超时（秒）
+
+# shell v2 数据包类型
+SHELL_V2_STDOUT = 1
+SHELL_V2_STDERR = 2
+SHELL_V2_EXIT = 3
+SHELL_V2_HEADER = struct.Struct('<BI')
+
+
+class AdbWireError(Exception):
+    """adb server 返回 FAIL 或连接异常"""
+
+
+class AdbWireFail(AdbWireError):
+    """adb server / 设备明确返回 FAIL（message 为返回的错误信息）"""
+
+
+def _shell_v2_unsupported(error: Exception) -> bool:
+    """FAIL 信息是否指明设备不支持 shell v2（其他错误不应回退协议）"""
+    if not isinstance(error, AdbWireFail):
+        return False
+    message = str(error).lower()
+    return any(name in message for name in ('shell,v2', 'shell_v2', 'shell v2'))
+
+
+class RecvBuffer:
+    """
+    可复用的接收缓冲区
+
+    数据不够放时换一块两倍大小的新缓冲区（旧缓冲区可能仍被上一帧的 numpy 视图引用，不能原地扩容）
+    """
+
+    def __init__(self, size: int = 4 * 1024 * 1024):
+        self.data = bytearray(size)
+
+    def grow(self, used: int):
+        """扩容并保留已接收的 used 字节"""
+        new_data = bytearray(len(self.data) * 2)
+        new_data[:used] = memoryview(self.data)[:used]
+        self.data = new_data
+
+
+class AdbWireClient:
+    """adb server 协议客户端（带预热连接池）"""
+
+    def __init__(
+        self,
+        serial: str,
+        host: str = ADB_SERVER_HOST,
+        port: Optional[int] = None,
+        pool_size: int = WIRE_POOL_SIZE
+    ):
+        """
+        Args:
+            serial: 设备序列号
+            host: adb server 地址
+            port: adb server 端口（None 时在创建时读取 ANDROID_ADB_SERVER_PORT，与 adb 命令行/adbutils 一致）
+            pool_size: 每个通道的预热连接数
+        """
+        self.serial = serial
+        self.host = host
+        self.port = port if port is not None else int(os.environ.get('ANDROID_ADB_SERVER_PORT', ADB_SERVER_PORT))
+        self.pool_size = pool_size
+        self.shell_v2 = True  # 设备不支持 shell v2 时自动回退到 shell: + 退出码标记
+
+        self._pools: Dict[str, deque] = {}
+        self._pool_cond = threading.Condition()
+        self._running = threading.Event()
+        self._refill_thread: Optional[threading.Thread] = None
+
+    # ---------- 连接池 ----------
+    def start(self, channels: Tuple[str, ...] = ('capture', 'tap', 'command')) -> bool:
+        """
+        预热各通道的连接池，并启动后台补充线程
+
+        Returns:
+            是否能连接到 adb server 并切换到设备
+        """
+        try:
+            sock = self._connect_transport()
+        except (OSError, AdbWireError) as e:
+            print(f"⚠️  adb 协议客户端连接失败: {e}")
+            return False
+
+        with self._pool_cond:
+            for channel in channels:
+                self._pools.setdefault(channel, deque())
+            self._pools[channels[0]].append(sock)
+
+        self._running.set()
+        self._refill_thread = threading.Thread(target=self._refill_loop, daemon=True)
+        self._refill_thread.start()
+        with self._pool_cond:
+            self._pool_cond.notify_all()
+        return True
+
+    def close(self):
+        """关闭所有预热连接"""
+        self._running.clear()
+        with self._pool_cond:
+            self._pool_cond.notify_all()
+            for pool in self._pools.values():
+                while pool:
+                    pool.popleft().close()
+
+    def _refill_loop(self):
+        """后台补充预热连接（请求路径上不做 connect/transport 握手）"""
+        while self._running.is_set():
+            with self._pool_cond:
+                channel = None
+                while self._running.is_set():
+                    channel = next((name for name, pool in self._pools.items()
+                                    if len(pool) < self.pool_size), None)
+                    if channel is not None:
+                        break
+                    self._pool_cond.wait()
+            if channel is None:
+                break
+            try:
+                sock = self._connect_transport()
+            except (OSError, AdbWireError):
+                # 设备断开或 server 重启，稍后重试
+                time.sleep(0.5)
+                continue
+            with self._pool_cond:
+                self._pools[channel].append(sock)
+
+    def _checkout(self, channel: str) -> socket.socket:
+        """取出一个已切换到设备传输的连接（池为空时现场建立）"""
+        with self._pool_cond:
+            pool = self._pools.setdefault(channel, deque())
+            sock = pool.popleft() if pool else None
+            self._pool_cond.notify_all()
+        if sock is None:
+            sock = self._connect_transport()
+        return sock
+
+    # ---------- 协议 ----------
+    def _connect_transport(self) -> socket.socket:
+        """连接 adb server 并切换到设备传输"""
+        sock = socket.create_connection((self.host, self.port), timeout=WIRE_CONNECT_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._send_request(sock, f"host:transport:{self.serial}")
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def _send_request(self, sock: socket.socket, request: str):
+        """发送请求（4 位十六进制长度 + 内容）并检查 OKAY"""
+        payload = request.encode('utf-8')
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = self._recv_exact(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            length = int(self._recv_exact(sock, 4), 16)
+            raise AdbWireFail(self._recv_exact(sock, length).decode('utf-8', errors='replace'))
+        raise AdbWireError(f"意外的响应: {status!r}")
+
+    def _recv_exact(self, sock: socket.socket, size: int) -> bytes:
+        """读取恰好 size 字节"""
+        data = bytearray(size)
+        view = memoryview(data)
+        received = 0
+        while received < size:
+            n = sock.recv_into(view[received:])
+            if n == 0:
+                raise AdbWireError("连接已关闭")
+            received += n
+        return bytes(data)
+
+    def _open_service(
+        self,
+        service: str,
+        channel: str,
+        timeout: Optional[float],
+        fresh: bool = False
+    ) -> socket.socket:
+        """在预热连接上打开设备服务（fresh=True 时不用连接池，现场建立连接）"""
+        sock = self._connect_transport() if fresh else self._checkout(channel)
+        try:
+            sock.settimeout(timeout)
+            self._send_request(sock, service)
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def exec_into(
+        self,
+        command: str,
+        recv_buffer: RecvBuffer,
+        channel: str = 'capture',
+        timeout: Optional[float] = 10.0,
+        timings: Optional[list] = None
+    ) -> memoryview:
+        """
+        【优化】执行 exec:<cmd>，输出直接 recv_into 到可复用缓冲区（零拷贝、无新分配）
+
+        Args:
+            command: 设备端命令
+            recv_buffer: 接收缓冲区（不够大时自动扩容）
+            channel: 使用的连接池通道
+            timeout: 超时（秒）
+            timings: 传入列表时写入 [首字节时间, 末字节时间]（perf_counter，用于延迟追踪）
+
+        Returns:
+            输出数据的 memoryview（指向 recv_buffer.data，下次使用同一缓冲区前有效）
+        """
+        sock = self._open_service(f"exec:{command}", channel, timeout)
+        received = 0
+        first_byte = None
+        try:
+            view = memoryview(recv_buffer.data)
+            while True:
+                if received == len(view):
+                    view.release()
+                    recv_buffer.grow(received)
+                    view = memoryview(recv_buffer.data)
+                n = sock.recv_into(view[received:])
+                if n == 0:
+                    break
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+                received += n
+            view.release()
+        finally:
+            sock.close()
+        if timings is not None and first_byte is not None:
+            timings[:] = [first_byte, time.perf_counter()]
+        return memoryview(recv_buffer.data)[:received]
+
+    def shell(
+        self,
+        command: str,
+        channel: str = 'command',
+        timeout: Optional[float] = 10.0,
+        timings: Optional[list] = None
+    ) -> Tuple[int, bytes]:
+        """
+        执行 shell 命令（shell v2 协议，原生返回退出码）
+
+        Args:
+            timings: 传入列表时写入 [首字节时间, 末字节时间]（perf_counter，仅 shell v2）
+
+        Returns:
+            (退出码, stdout)
+        """
+        if not self.shell_v2:
+            return self._shell_v1(command, channel, timeout)
+        service = f"shell,v2,raw:{command}"
+        try:
+            sock = self._open_service(service, channel, timeout)
+        except TimeoutError:
+            raise
+        except (AdbWireError, OSError) as e:
+            if _shell_v2_unsupported(e):
+                self.shell_v2 = False
+                return self._shell_v1(command, channel, timeout)
+            # 池中连接已失效或临时失败：换一个新连接重试一次（不回退协议，退出码仍然可用）
+            try:
+                sock = self._open_service(service, channel, timeout, fresh=True)
+            except AdbWireError as retry_error:
+                if not _shell_v2_unsupported(retry_error):
+                    raise
+                self.shell_v2 = False
+                return self._shell_v1(command, channel, timeout)
+
+        stdout = bytearray()
+        exit_code = -1
+        first_byte = None
+        try:
+            while True:
+                try:
+                    header = self._recv_exact(sock, SHELL_V2_HEADER.size)
+                except AdbWireError:
+                    # 连接关闭（未收到退出码包）
+                    break
+                if first_byte is None:
+                    first_byte = time.perf_counter()
+                packet_id, length = SHELL_V2_HEADER.unpack(header)
+                data = self._recv_exact(sock, length) if length else b''
+                if packet_id == SHELL_V2_STDOUT:
+                    stdout += data
+                elif packet_id == SHELL_V2_EXIT:
+                    exit_code = data[0] if data else 0
+                    break
+        finally:
+            sock.close()
+        if timings is not None and first_byte is not None:
+            timings[:] = [first_byte, time.perf_counter()]
+        return exit_code, bytes(stdout)
+
+    def _shell_v1(self, command: str, channel: str, timeout: Optional[float]) -> Tuple[int, bytes]:
+        """旧协议 shell:（附加退出码标记解析返回值）"""
+        marker = b'__ADB_EXIT__'
+        # 子 shell 包住命令（换行再闭合括号）：结尾的 & / # 注释 / exit 不影响标记
+        sock = self._open_service(f"shell:( {command}\n); echo {marker.decode()}$?", channel, timeout)
+        chunks = []
+        try:
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        finally:
+            sock.close()
+        output = b''.join(chunks)
+        marker_pos = output.rfind(marker)
+        if marker_pos < 0:
+            return -1, output
+        exit_text = output[marker_pos + len(marker):].strip()
+        return (int(exit_text) if exit_text.isdigit() else -1), output[:marker_pos]
+
+    def open_stream(self, service: str, channel: str = 'tap') -> socket.socket:
+        """
+        打开长连接服务（如 exec:cat > /dev/input/eventX），返回原始 socket
+
+        Args:
+            service: 完整服务名（exec:/shell:）
+            channel: 使用的连接池通道
+        """
+        return self._open_service(service, channel, None)
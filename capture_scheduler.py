@@ -0,0 +1,180 @@
+"""
+自适应截图节奏（按距离目标时间分阶段）
+固定的截图间隔在开售前一小时和开售后关键的一秒里是一样的；按阶段调整截图间隔：
+
+    idle     距离目标时间较远：慢速截图（CAPTURE_IDLE_INTERVAL），降低手机 CPU 占用和发热
+    ramp     目标时间前 CAPTURE_RAMP_WINDOW 秒：间隔线性缩短到 0
+    max      目标时间前 CAPTURE_MAX_LEAD 秒起、阶段切换期间：截图之间不等待（背靠背截图）
+    backoff  最后阶段执行结束后：降速（CAPTURE_BACKOFF_INTERVAL）
+
+截图线程每次截图后调用 record_capture() 并按 next_interval() 等待；
+每个阶段统计截图次数和停留时间，结束时输出各阶段实际帧率
+
+用法：
+    scheduler = CaptureRateScheduler(clock)
+    scheduler.set_target(clock.perf_counter() + seconds_to_target)
+    # 截图循环
+    scheduler.record_capture()
+    clock.sleep(scheduler.next_interval())
+    # 最后阶段结束
+    scheduler.enter_backoff()
+    # 截图线程退出后
+    scheduler.finish()
+    scheduler.print_report()
+"""
+import threading
+from typing import Dict, Optional
+
+from sim_clock import SystemClock, SYSTEM_CLOCK
+
+CAPTURE_IDLE_INTERVAL = 1.0       # idle 阶段截图间隔（秒）
+CAPTURE_RAMP_WINDOW = 5.0         # 目标时间前多少秒开始加速（秒）
+CAPTURE_MAX_LEAD = 1.0            # 目标时间前多少秒进入最高速（秒，需覆盖提前进入时间 PAGE_LOAD_TIME）
+CAPTURE_BACKOFF_INTERVAL = 0.5    # backoff 阶段截图间隔（秒）
+
+CAPTURE_PHASES = ('idle', 'ramp', 'max', 'backoff')
+CAPTURE_PHASE_LABELS = {
+    'idle': '空闲等待',
+    'ramp': '加速',
+    'max': '最高速',
+    'backoff': '降速',
+}
+
+
+class CaptureRateScheduler:
+    """按阶段决定截图间隔，统计各阶段实际帧率（多个截图线程共用，内部加锁）"""
+
+    def __init__(
+        self,
+        clock: SystemClock = SYSTEM_CLOCK,
+        idle_interval: float = CAPTURE_IDLE_INTERVAL,
+        ramp_window: float = CAPTURE_RAMP_WINDOW,
+        max_lead: float = CAPTURE_MAX_LEAD,
+        backoff_interval: float = CAPTURE_BACKOFF_INTERVAL,
+        fixed_interval: Optional[float] = None
+    ):
+        """
+        Args:
+            clock: 时钟（perf_counter 计时）
+            idle_interval: idle 阶段截图间隔（秒）
+            ramp_window: 目标时间前多少秒开始加速
+            max_lead: 目标时间前多少秒进入最高速
+            backoff_interval: backoff 阶段截图间隔（秒）
+            fixed_interval: 不为 None 时所有阶段都用这个固定间隔（关闭自适应，只统计帧率）
+        """
+        self.clock = clock
+        self.idle_interval = idle_interval
+        self.ramp_window = max(ramp_window, max_lead)
+        self.max_lead = max_lead
+        self.backoff_interval = backoff_interval
+        self.fixed_interval = fixed_interval
+
+        self.target: Optional[float] = None  # 目标时间（perf_counter）
+        self.backoff = False
+        self.finished = False
+        self._lock = threading.Lock()
+        self._phase: Optional[str] = None
+        self._phase_since = 0.0
+        self.durations: Dict[str, float] = {phase: 0.0 for phase in CAPTURE_PHASES}
+        self.captures: Dict[str, int] = {phase: 0 for phase in CAPTURE_PHASES}
+
+    def set_target(self, target: float):
+        """设置/修正目标时间（perf_counter，设备时钟重新估计后会修正）"""
+        self.target = target
+
+    def enter_backoff(self):
+        """最后阶段结束：之后都按 backoff 间隔截图"""
+        if not self.backoff:
+            self.backoff = True
+            self._phase_at(self.clock.perf_counter())
+
+    def phase(self, now: Optional[float] = None) -> str:
+        """当前阶段"""
+        if now is None:
+            now = self.clock.perf_counter()
+        if self.backoff:
+            return 'backoff'
+        if self.target is None:
+            return 'idle'
+        remaining = self.target - now
+        if remaining <= self.max_lead:
+            return 'max'
+        if remaining <= self.ramp_window:
+            return 'ramp'
+        return 'idle'
+
+    def _phase_at(self, now: float) -> str:
+        """确定当前阶段并累计阶段停留时间"""
+        phase = self.phase(now)
+        with self._lock:
+            if phase != self._phase and not self.finished:
+                if self._phase is not None:
+                    self.durations[self._phase] += now - self._phase_since
+                self._phase = phase
+                self._phase_since = now
+        return phase
+
+    def finish(self):
+        """截图停止：结束阶段计时（之后的报告不再累计停留时间）"""
+        now = self.clock.perf_counter()
+        with self._lock:
+            if self._phase is not None and not self.finished:
+                self.durations[self._phase] += now - self._phase_since
+            self.finished = True
+
+    def interval(self, now: Optional[float] = None) -> float:
+        """当前阶段的截图间隔（秒，不计入阶段统计）"""
+        if now is None:
+            now = self.clock.perf_counter()
+        if self.fixed_interval is not None:
+            return self.fixed_interval
+        phase = self.phase(now)
+        if phase == 'idle':
+            return self.idle_interval
+        if phase == 'ramp':
+            # 线性缩短：进入 ramp 时为 idle 间隔，到 max 阶段时为 0（不睡过 max 阶段的起点）
+            until_max = self.target - self.max_lead - now
+            return min(self.idle_interval * until_max / (self.ramp_window - self.max_lead), until_max)
+        if phase == 'backoff':
+            return self.backoff_interval
+        return 0.0
+
+    def next_interval(self) -> float:
+        """本次截图后应等待的时间（秒）"""
+        now = self.clock.perf_counter()
+        self._phase_at(now)
+        return self.interval(now)
+
+    def record_capture(self):
+        """记录一次截图（计入当前阶段）"""
+        phase = self._phase_at(self.clock.perf_counter())
+        with self._lock:
+            self.captures[phase] += 1
+
+    def get_report(self) -> Dict[str, dict]:
+        """各阶段 {停留时间, 截图次数, 帧率}"""
+        now = self.clock.perf_counter()
+        with self._lock:
+            durations = dict(self.durations)
+            if self._phase is not None and not self.finished:
+                durations[self._phase] += now - self._phase_since
+            captures = dict(self.captures)
+        report = {}
+        for phase in CAPTURE_PHASES:
+            if durations[phase] > 0 or captures[phase]:
+                report[phase] = {
+                    'duration': durations[phase],
+                    'captures': captures[phase],
+                    'fps': captures[phase] / durations[phase] if durations[phase] > 0 else 0.0,
+                }
+        return report
+
+    def print_report(self):
+        """输出各阶段实际帧率"""
+        report = self.get_report()
+        if not report:
+            return
+        print("📸 截图节奏（各阶段实际帧率）:")
+        for phase, item in report.items():
+            print(f"   {CAPTURE_PHASE_LABELS[phase]:<6} ({phase:<7}): {item['duration']:7.2f}秒, "
+                  f"{item['captures']:5d} 次截图, {item['fps']:6.1f} fps")
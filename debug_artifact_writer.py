@@ -0,0 +1,190 @@
+"""
+调试文件异步写入器
+截图线程、检测线程只把 (数据, 名字) 放进有界队列就返回，磁盘 I/O 全部在一个专用后台线程完成：
+
+- 队列满时直接丢弃新任务（计数），从不阻塞截图/检测
+- 同一 coalesce_key 的待写任务只保留最新的一个（例如周期性调试截图）
+- 按内容寻址存储：objects/<sha1 前两位>/<sha1>.png，相同画面只写一次；
+  index.jsonl 记录每个名字对应的对象（时间、名字、对象路径、大小、是否新写入）
+
+数据可以是 bytes，也可以是返回 bytes 的函数（例如 raw 帧的 PNG 编码），函数在后台线程中执行；
+需要在调用线程先做的准备（例如复制复用缓冲区上的帧）用 prepare 传入，只在任务确定入队时执行
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Union, Callable
+
+DEBUG_WRITER_QUEUE_SIZE = 16  # 最多积压的待写任务数
+
+ArtifactData = Union[bytes, bytearray, memoryview, Callable[[], Optional[bytes]]]
+
+
+class DebugArtifactWriter:
+    """后台调试文件写入器（一个专用线程）"""
+
+    def __init__(self, root_dir: str, max_pending: int = DEBUG_WRITER_QUEUE_SIZE, extension: str = '.png'):
+        """
+        Args:
+            root_dir: 输出目录
+            max_pending: 最多积压的待写任务数，超过时丢弃新任务
+            extension: 对象文件扩展名
+        """
+        self.root_dir = root_dir
+        self.objects_dir = os.path.join(root_dir, 'objects')
+        self.index_path = os.path.join(root_dir, 'index.jsonl')
+        self.max_pending = max_pending
+        self.extension = extension
+
+        self._pending: 'OrderedDict[object, tuple]' = OrderedDict()  # {任务键: (名字, 数据, 提交时间)}
+        self._cond = threading.Condition()
+        self._running = False
+        self._job_counter = 0
+        self.thread: Optional[threading.Thread] = None
+
+        # 统计信息
+        self.submitted = 0
+        self.written = 0       # 新写入的对象文件数
+        self.deduplicated = 0  # 内容已存在、只记录索引的次数
+        self.coalesced = 0     # 被同键新任务替换掉的待写任务数
+        self.dropped = 0       # 队列满被丢弃的任务数
+        self.failed = 0        # 编码/写入失败次数
+
+    def start(self) -> 'DebugArtifactWriter':
+        """启动后台写入线程"""
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._running = True
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def submit(
+        self,
+        data: Optional[ArtifactData],
+        name: str,
+        coalesce_key: Optional[str] = None,
+        prepare: Optional[Callable[[], ArtifactData]] = None
+    ) -> bool:
+        """
+        提交一个写入任务（不做任何 I/O，立即返回）
+
+        Args:
+            data: 文件内容，或在后台线程中生成内容的函数（prepare 不为 None 时忽略）
+            name: 记录在索引中的名字（例如 detected_stage2_20250122_090000_123）
+            coalesce_key: 合并键，相同键的待写任务只保留最新的一个
+            prepare: 在调用线程生成 data 的函数，确认队列有空位（或可以合并）后才调用，
+                     被丢弃的任务不做这一步（例如复制复用缓冲区上的帧）
+
+        Returns:
+            是否已加入队列（队列满或写入器未启动时返回 False）
+        """
+        if prepare is not None:
+            with self._cond:
+                if not self._running:
+                    return False
+                if not self._can_accept(coalesce_key):
+                    self.submitted += 1
+                    self.dropped += 1
+                    return False
+            # 准备工作在锁外进行，不阻塞写入线程和其他提交者
+            data = prepare()
+
+        with self._cond:
+            if not self._running:
+                return False
+            self.submitted += 1
+            if coalesce_key is not None and coalesce_key in self._pending:
+                del self._pending[coalesce_key]
+                self.coalesced += 1
+            elif len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            if coalesce_key is None:
+                self._job_counter += 1
+                key = self._job_counter
+            else:
+                key = coalesce_key
+            self._pending[key] = (name, data, time.time())
+            self._cond.notify()
+        return True
+
+    def _can_accept(self, coalesce_key: Optional[str]) -> bool:
+        """任务现在提交能否入队（可以合并掉同键任务，或队列未满；调用方持有锁）"""
+        return (coalesce_key is not None and coalesce_key in self._pending) or len(self._pending) < self.max_pending
+
+    def close(self, timeout: float = 2.0):
+        """写完积压的任务后停止后台线程"""
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+
+    def get_stats(self) -> dict:
+        """统计信息"""
+        with self._cond:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'deduplicated': self.deduplicated,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'pending': len(self._pending),
+            }
+
+    def _write_loop(self):
+        """后台线程：取任务 -> 生成内容 -> 按内容寻址写入 -> 追加索引"""
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                _, (name, data, submit_time) = self._pending.popitem(last=False)
+
+            try:
+                if callable(data):
+                    data = data()
+                if not data:
+                    raise ValueError("空数据")
+                self._store(name, bytes(data), submit_time)
+            except Exception as e:
+                with self._cond:
+                    self.failed += 1
+                print(f"⚠️ 调试文件写入失败 ({name}): {e}")
+
+    def _store(self, name: str, data: bytes, submit_time: float):
+        """写入对象文件（已存在则跳过）并追加索引"""
+        digest = hashlib.sha1(data).hexdigest()
+        relative = os.path.join('objects', digest[:2], digest + self.extension)
+        path = os.path.join(self.root_dir, relative)
+        is_new = not os.path.exists(path)
+        if is_new:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+
+        record = {
+            'time': datetime.fromtimestamp(submit_time).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+            'name': name,
+            'object': relative.replace(os.sep, '/'),
+            'size': len(data),
+            'new': is_new,
+        }
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        with self._cond:
+            if is_new:
+                self.written += 1
+            else:
+                self.deduplicated += 1
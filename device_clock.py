@@ -0,0 +1,250 @@
+"""
+主机 / 设备时钟偏差估计（NTP 式最小往返时间过滤）
+页面上显示和小程序判断的开售时间是手机的时钟，主机 datetime.now() 与手机可能差几十到几百毫秒：
+
+- 采样：adb shell 读取设备时间（echo $EPOCHREALTIME，微秒精度；不支持时用 date +%s.%N），
+  记录主机发出/收到时间。设备读数一定落在 [发出, 收到] 之间，所以每个样本给出偏差的一个区间
+- 估计：所有样本区间取交集（往返时间最短的样本决定上下界，往返慢的样本自动被过滤），
+  取交集中点为偏差、半宽为误差界；同时估计最短样本的上下行不对称（上行 - 下行）
+- 漂移：长时间等待期间定期重新估计，按历史偏差线性拟合漂移（ppm），
+  两次估计之间的偏差按漂移外推，误差界按 DEVICE_CLOCK_DRIFT_MARGIN 随外推时长放宽；
+  新估计超出预测的误差范围时视为设备时钟跳变（NTP 校时），清空历史重新拟合
+- 调度：host_time_for(设备时间) 返回对应的主机时间和误差界，按设备时钟定时
+- 时间预算：每个样本的超时不超过 DEVICE_CLOCK_SAMPLE_TIMEOUT；sync(budget=...) 到预算用完时
+  用已有样本估计，sync_budget() 按上次估计的实际耗时给出所需预算，调用方据此决定是否来得及重新估计
+
+用法：
+    python device_clock.py                        # 估计一次偏差
+    python device_clock.py --duration 60          # 每 10 秒估计一次，输出漂移
+    python device_clock.py --samples 16 --wire    # 内置 adb 协议客户端（往返更短，误差界更小）
+
+    # 代码中
+    sync = DeviceClockSync(auto)
+    sync.sync()
+    host_time, bound = sync.host_time_for(target_time.timestamp())
+"""
+import argparse
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional, Tuple, List, NamedTuple
+
+DEVICE_CLOCK_SAMPLES = 8               # 每次估计的采样次数
+DEVICE_CLOCK_HISTORY = 32              # 用于拟合漂移的历史估计个数
+DEVICE_CLOCK_MIN_DRIFT_SPAN = 5.0      # 历史估计跨度超过这么多秒才拟合漂移
+DEVICE_CLOCK_DRIFT_MARGIN = 500e-6     # 外推时误差界的放宽速率（秒/秒，Linux 校时最大调整速率 500ppm）
+DEVICE_CLOCK_RESYNC_INTERVAL = 10.0    # 长时间等待期间重新估计的间隔（秒）
+DEVICE_CLOCK_SAMPLE_TIMEOUT = 1.0      # 单个样本（一次 adb shell 往返）的超时（秒）
+DEVICE_CLOCK_BUDGET_MARGIN = 1.5       # 所需预算 = 上次估计的实际耗时 × 这个系数
+DEVICE_TIME_COMMAND = 'echo ${EPOCHREALTIME:-$(date +%s.%N)}'
+
+
+class ClockOffset(NamedTuple):
+    """一次偏差估计（时间都是秒，主机时间为 time.time()）"""
+    offset: float        # 设备时间 - 主机时间
+    error_bound: float   # |真实偏差 - offset| 的上界
+    rtt: float           # 最短往返时间
+    asymmetry: float     # 最短样本的上行 - 下行耗时（按估计的偏差计算）
+    host_time: float     # 最短样本的主机中点时间（外推漂移的起点）
+    samples: int         # 有效样本数
+    resolution: float    # 设备时间读数分辨率
+
+
+def parse_device_time(output: str) -> Optional[Tuple[float, float]]:
+    """
+    解析设备时间读数
+
+    Returns:
+        (设备时间, 分辨率)，无法解析返回 None（date 不支持 %N 时只有整数秒，分辨率 1 秒）
+    """
+    text = output.strip().split()
+    if not text:
+        return None
+    whole, _, fraction = text[-1].replace(',', '.').partition('.')
+    if not whole.isdigit():
+        return None
+    if not fraction.isdigit():
+        return float(whole), 1.0
+    return float(f"{whole}.{fraction}"), 10.0 ** -len(fraction)
+
+
+def estimate_offset(samples: List[Tuple[float, float, float]], resolution: float) -> Optional[ClockOffset]:
+    """
+    由采样估计偏差
+
+    Args:
+        samples: [(主机发出时间, 设备读数, 主机收到时间)]
+        resolution: 设备读数分辨率（读数截断，真实设备时间在 [读数, 读数 + 分辨率)）
+
+    Returns:
+        偏差估计，没有样本返回 None
+    """
+    if not samples:
+        return None
+    # 每个样本：发出 <= 设备时间 - 偏差 <= 收到  =>  偏差 ∈ [读数 - 收到, 读数 + 分辨率 - 发出]
+    lower = max(device - recv for _, device, recv in samples)
+    upper = min(device + resolution - send for send, device, _ in samples)
+    send, device, recv = min(samples, key=lambda s: s[2] - s[0])
+    rtt = recv - send
+    if lower <= upper:
+        offset = (lower + upper) / 2
+        bound = (upper - lower) / 2
+    else:
+        # 区间不相交（采样期间设备时钟跳变）：只用往返最短的样本
+        offset = device + resolution / 2 - (send + recv) / 2
+        bound = rtt / 2 + resolution / 2
+    device_host = device + resolution / 2 - offset  # 设备读数对应的主机时间
+    asymmetry = (device_host - send) - (recv - device_host)
+    return ClockOffset(offset, bound, rtt, asymmetry, (send + recv) / 2, len(samples), resolution)
+
+
+class DeviceClockSync:
+    """跟踪设备时钟偏差和漂移（auto 需提供 estimate_clock_offset，即 ADBAutomation）"""
+
+    def __init__(self, auto, samples: int = DEVICE_CLOCK_SAMPLES):
+        """
+        Args:
+            auto: ADBAutomation 实例
+            samples: 每次估计的采样次数
+        """
+        self.auto = auto
+        self.samples = samples
+        self.history: deque = deque(maxlen=DEVICE_CLOCK_HISTORY)
+        self.latest: Optional[ClockOffset] = None
+        self.drift = 0.0  # 漂移（秒/秒，设备比主机每秒快多少）
+        self.steps = 0    # 检测到的设备时钟跳变次数
+        self.last_duration: Optional[float] = None  # 上次估计的实际耗时（秒）
+
+    def expected_duration(self) -> float:
+        """一次完整估计预计的耗时（秒，还没有估计过时按每个样本都超时计算）"""
+        if self.last_duration is None:
+            return self.samples * DEVICE_CLOCK_SAMPLE_TIMEOUT
+        return self.last_duration
+
+    def sync_budget(self) -> float:
+        """为一次完整估计预留的时间（秒，预计耗时另加余量）"""
+        return self.expected_duration() * DEVICE_CLOCK_BUDGET_MARGIN
+
+    def sync(self, budget: Optional[float] = None) -> Optional[ClockOffset]:
+        """
+        重新估计偏差（失败时保留上一次的估计，返回 None）
+
+        Args:
+            budget: 时间预算（秒），用完时停止采样、用已有样本估计；None 表示不限
+        """
+        started = time.perf_counter()
+        estimate = self.auto.estimate_clock_offset(self.samples, budget=budget)
+        duration = time.perf_counter() - started
+        if estimate is None:
+            return None
+        # 预算不足提前停止时耗时偏短，不用于下次的预算
+        if estimate.samples >= self.samples or self.last_duration is None:
+            self.last_duration = duration
+        if self.latest is not None:
+            predicted, predicted_bound = self.offset_at(estimate.host_time)
+            jump = estimate.offset - predicted
+            if abs(jump) > predicted_bound + estimate.error_bound:
+                self.steps += 1
+                print(f"⚠️  设备时钟跳变 {jump * 1000:+.1f}ms（超出预测误差范围），重新拟合漂移")
+                self.history.clear()
+                self.drift = 0.0
+        self.history.append(estimate)
+        self.latest = estimate
+        self._fit_drift()
+        return estimate
+
+    def _fit_drift(self):
+        """按历史估计线性拟合漂移（按误差界加权的最小二乘）"""
+        if len(self.history) < 2 or self.history[-1].host_time - self.history[0].host_time < DEVICE_CLOCK_MIN_DRIFT_SPAN:
+            return
+        weights = [1.0 / max(e.error_bound, 1e-6) ** 2 for e in self.history]
+        total = sum(weights)
+        mean_t = sum(w * e.host_time for w, e in zip(weights, self.history)) / total
+        mean_o = sum(w * e.offset for w, e in zip(weights, self.history)) / total
+        var = sum(w * (e.host_time - mean_t) ** 2 for w, e in zip(weights, self.history))
+        if var > 0:
+            self.drift = sum(w * (e.host_time - mean_t) * (e.offset - mean_o)
+                             for w, e in zip(weights, self.history)) / var
+
+    def offset_at(self, host_time: float) -> Tuple[float, float]:
+        """
+        主机时间 host_time 时的偏差（按漂移外推）
+
+        Returns:
+            (偏差, 误差界)
+        """
+        if self.latest is None:
+            raise RuntimeError("还没有设备时钟偏差估计，先调用 sync()")
+        elapsed = abs(host_time - self.latest.host_time)
+        offset = self.latest.offset + self.drift * (host_time - self.latest.host_time)
+        return offset, self.latest.error_bound + elapsed * DEVICE_CLOCK_DRIFT_MARGIN
+
+    def device_now(self) -> Tuple[float, float]:
+        """当前设备时间（估计值，误差界）"""
+        now = time.time()
+        offset, bound = self.offset_at(now)
+        return now + offset, bound
+
+    def host_time_for(self, device_time: float) -> Tuple[float, float]:
+        """
+        设备时间 device_time 对应的主机时间（time.time()），用于按设备时钟调度
+
+        Returns:
+            (主机时间, 误差界)
+        """
+        host_time = device_time - self.latest.offset if self.latest is not None else device_time
+        offset, bound = self.offset_at(host_time)
+        # 漂移很小，迭代一次即可
+        offset, bound = self.offset_at(device_time - offset)
+        return device_time - offset, bound
+
+    def print_report(self):
+        """输出当前偏差、误差界和漂移"""
+        if self.latest is None:
+            print("📱 设备时钟: 未估计")
+            return
+        e = self.latest
+        print(f"📱 设备时钟偏差: {e.offset * 1000:+.3f}ms (±{e.error_bound * 1000:.3f}ms) | "
+              f"最短往返 {e.rtt * 1000:.2f}ms | 上下行不对称 {e.asymmetry * 1000:+.2f}ms | "
+              f"样本 {e.samples} | 分辨率 {e.resolution * 1e6:.0f}µs")
+        if len(self.history) >= 2:
+            print(f"   漂移: {self.drift * 1e6:+.1f}ppm（{len(self.history)} 次估计"
+                  f"，跨度 {self.history[-1].host_time - self.history[0].host_time:.0f}秒"
+                  f"，跳变 {self.steps} 次）")
+
+
+def main():
+    from adb_automation import ADBAutomation
+
+    parser = argparse.ArgumentParser(description='估计主机/设备时钟偏差和漂移')
+    parser.add_argument('--device', default=None, help='设备 ID（默认第一个设备）')
+    parser.add_argument('--samples', type=int, default=DEVICE_CLOCK_SAMPLES, help='每次估计的采样次数')
+    parser.add_argument('--duration', type=float, default=0.0, help='持续跟踪的时长（秒），0 表示只估计一次')
+    parser.add_argument('--interval', type=float, default=DEVICE_CLOCK_RESYNC_INTERVAL, help='重新估计的间隔（秒）')
+    parser.add_argument('--wire', action='store_true', help='使用内置 adb 协议客户端')
+    args = parser.parse_args()
+
+    auto = ADBAutomation(args.device)
+    if not auto.connect(use_wire_client=args.wire):
+        print("❌ 设备连接失败")
+        return
+    try:
+        sync = DeviceClockSync(auto, args.samples)
+        end = time.perf_counter() + args.duration
+        while True:
+            if sync.sync() is None:
+                print("❌ 无法读取设备时间")
+                return
+            device_time, bound = sync.device_now()
+            print(f"🕒 主机 {datetime.now().strftime('%H:%M:%S.%f')[:-3]} | "
+                  f"设备 {datetime.fromtimestamp(device_time).strftime('%H:%M:%S.%f')[:-3]} (±{bound * 1000:.2f}ms)")
+            sync.print_report()
+            if time.perf_counter() + args.interval > end:
+                break
+            time.sleep(args.interval)
+    finally:
+        auto.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+结构化、限流的事件日志（替代热路径中的 print）
+检测/点击线程调用 emit() 只做：规则查找 + 采样/限流判断 + 一次 deque.append（GIL 下原子，无锁）。
+消息模板的格式化、控制台输出、JSONL 写入都在后台刷新线程完成；被过滤掉的事件完全不做格式化。
+
+用法：
+    log = EventLog('temp_logs/events.jsonl', rules={'detection_point': {'sample_every': 10, 'max_per_second': 20}})
+    log.start()
+    log.emit('detection_point', "点({x},{y}) 实际RGB{rgb}", x=x, y=y, rgb=rgb)
+    # 参数本身计算代价高时，先判断再记录：
+    if log.should_log('detection_point'):
+        log.record('detection_point', "...", **expensive_fields())
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Optional, Dict, Any
+
+EVENT_LOG_CAPACITY = 8192         # 内存环形缓冲容量（条），写满后丢弃最旧的记录
+EVENT_LOG_FLUSH_INTERVAL = 0.2    # 后台刷新间隔（秒）
+
+# 规则字段：sample_every（每 N 条取 1 条）、max_per_second（每秒最多条数，None 不限）、console（是否输出到控制台）
+DEFAULT_RULE = {'sample_every': 1, 'max_per_second': None, 'console': True}
+
+
+class _EventState:
+    """单个事件类型的采样/限流状态（多线程下为近似计数，不加锁）"""
+    __slots__ = ('sample_every', 'max_per_second', 'console', 'seen', 'tokens', 'last_refill', 'emitted', 'filtered')
+
+    def __init__(self, rule: dict):
+        self.sample_every = max(1, rule.get('sample_every', 1))
+        self.max_per_second = rule.get('max_per_second')
+        self.console = rule.get('console', True)
+        self.seen = 0
+        self.tokens = float(self.max_per_second or 0)
+        self.last_refill = time.perf_counter()
+        self.emitted = 0
+        self.filtered = 0
+
+
+class EventLog:
+    """结构化事件日志：无锁环形缓冲 + 后台刷新线程（JSONL 文件 + 控制台）"""
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        rules: Optional[Dict[str, dict]] = None,
+        console: bool = True,
+        capacity: int = EVENT_LOG_CAPACITY,
+        flush_interval: float = EVENT_LOG_FLUSH_INTERVAL
+    ):
+        """
+        Args:
+            path: JSONL 文件路径，None 表示不写文件
+            rules: {事件类型: 规则}，未配置的事件类型使用 DEFAULT_RULE
+            console: 是否输出到控制台（总开关，规则中的 console 可单独关闭）
+            capacity: 环形缓冲容量
+            flush_interval: 刷新间隔（秒）
+        """
+        self.path = path
+        self.rules = rules or {}
+        self.console = console
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+
+        self._ring = deque(maxlen=capacity)
+        self._states: Dict[str, _EventState] = {}
+        self._stop = threading.Event()
+        self._file = None
+        self.thread: Optional[threading.Thread] = None
+        self.overflow = 0  # 刷新不及时被环形缓冲挤掉的记录数（近似）
+
+    def start(self) -> 'EventLog':
+        """打开日志文件并启动后台刷新线程"""
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self.thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self.thread.start()
+        return self
+
+    def close(self):
+        """停止刷新线程（先写完缓冲中的记录）"""
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+        self._flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    # ---------- 热路径 ----------
+    def should_log(self, event: str) -> bool:
+        """
+        采样 + 限流判断（通过时消耗一个配额）
+
+        参数计算本身代价高时先调用它，通过后再用 record() 记录
+        """
+        state = self._states.get(event)
+        if state is None:
+            state = self._states.setdefault(event, _EventState(self.rules.get(event, DEFAULT_RULE)))
+
+        state.seen += 1
+        if state.seen % state.sample_every:
+            state.filtered += 1
+            return False
+
+        if state.max_per_second:
+            now = time.perf_counter()
+            state.tokens = min(float(state.max_per_second),
+                               state.tokens + (now - state.last_refill) * state.max_per_second)
+            state.last_refill = now
+            if state.tokens < 1.0:
+                state.filtered += 1
+                return False
+            state.tokens -= 1.0
+
+        state.emitted += 1
+        return True
+
+    def record(self, event: str, template: str, **fields: Any):
+        """记录一条事件（不做过滤、不格式化；模板在刷新线程中用 fields 格式化）"""
+        if len(self._ring) >= self.capacity:
+            self.overflow += 1
+        self._ring.append((time.time(), event, template, fields))
+
+    def emit(self, event: str, template: str, **fields: Any) -> bool:
+        """
+        过滤后记录一条事件
+
+        Args:
+            event: 事件类型（决定采样/限流规则）
+            template: 消息模板（str.format 语法，引用 fields 中的字段）
+            **fields: 结构化字段（同时写入 JSONL）
+
+        Returns:
+            是否已记录
+        """
+        if not self.should_log(event):
+            return False
+        self.record(event, template, **fields)
+        return True
+
+    # ---------- 后台刷新 ----------
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """各事件类型的记录/过滤条数"""
+        return {event: {'emitted': state.emitted, 'filtered': state.filtered}
+                for event, state in list(self._states.items())}
+
+    def _flush_loop(self):
+        """定期把环形缓冲中的记录格式化并输出"""
+        while not self._stop.wait(self.flush_interval):
+            self._flush()
+
+    def _flush(self):
+        """取出当前缓冲中的全部记录：格式化 -> 控制台 + JSONL"""
+        lines = []
+        while True:
+            try:
+                timestamp, event, template, fields = self._ring.popleft()
+            except IndexError:
+                break
+            try:
+                message = template.format(**fields)
+            except (KeyError, IndexError, ValueError) as e:
+                message = f"{template} (格式化失败: {e})"
+
+            state = self._states.get(event)
+            if self.console and (state is None or state.console):
+                print(message)
+            if self._file is not None:
+                record = {
+                    'time': datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3],
+                    'event': event,
+                    'message': message,
+                }
+                record.update(fields)
+                lines.append(json.dumps(record, ensure_ascii=False, default=str))
+
+        if lines and self._file is not None:
+            self._file.write('\n'.join(lines) + '\n')
+            self._file.flush()
@@ -0,0 +1,594 @@
+"""
+本地模拟设备（假 adb server，用于不接手机的端到端基准测试 / 回归测试）
+在本机端口上实现 adb server 协议中本项目用到的部分，ADBAutomation.connect()、截图、点击路径原样运行：
+
+- host 服务：host:version、host:devices[-l]、host:features、host-serial:<serial>:features/get-state、
+  host:transport[:<serial>|-any]、host:tport:serial:<serial>（adb 命令行、adbutils、内置协议客户端都能连接）
+- 设备服务：exec:<cmd>、shell:<cmd>、shell,v2,raw:<cmd>
+- 设备端命令：wm size、screencap（raw）、screencap -p、行提取 dd 脚本、input tap、getevent -pl、
+  getprop、test -w、cat > /dev/input/eventX（常驻输入通道，解析 input_event 还原点击坐标）、
+  echo $EPOCHREALTIME / date +%s.%N（设备时钟带固定偏差和漂移，用于验证时钟偏差估计）
+
+屏幕内容来自录制的截图序列（与 adb_replay 相同的帧来源：截图目录 / zip / 帧归档），
+按回放时钟推进；截图按配置的设备端耗时和传输带宽延迟返回，收到的点击带时间戳记录
+
+用法：
+    # 终端 1：启动模拟设备（端口与 ANDROID_ADB_SERVER_PORT 一致，adb 命令行/adbutils/内置客户端都读这个变量）
+    ANDROID_ADB_SERVER_PORT=15037 python fake_adb_server.py temp_screenshots --speed 1
+    # 终端 2：完整流程原样运行
+    ANDROID_ADB_SERVER_PORT=15037 python fast_multi_thread_purchase.py
+
+    # 或在同一进程中启动模拟设备并运行一次完整抢购流程（CI 基准测试）
+    python fake_adb_server.py temp_screenshots --port 15037 --run --capture-mode raw --wire
+"""
+import json
+import os
+import re
+import socket
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple, List, NamedTuple
+
+from adb_automation import (
+    CAPTURE_MODE_PNG, CAPTURE_MODE_RAW, CAPTURE_MODE_ROWS,
+    EV_ABS, EV_SYN, SYN_REPORT, ABS_MT_POSITION_X, ABS_MT_POSITION_Y, ABS_MT_TRACKING_ID,
+)
+from adb_replay import ReplayAutomation, REPLAY_MAX_GAP
+from adb_wire_client import ADB_SERVER_HOST, ADB_SERVER_PORT, SHELL_V2_HEADER, SHELL_V2_STDOUT, SHELL_V2_STDERR, SHELL_V2_EXIT
+
+FAKE_DEVICE_SERIAL = 'fake-device-0001'
+FAKE_SERVER_VERSION = 41              # 与 platform-tools 的 adb 命令行一致，版本不符时客户端会重启 server
+FAKE_DEVICE_FEATURES = 'shell_v2,cmd,stat_v2,ls_v2,fixed_push_mkdir,apex,abb,abb_exec'
+FAKE_CPU_ABI = 'arm64-v8a'            # 决定输入通道的 input_event 结构（64 位 24 字节）
+FAKE_TOUCH_DEVICE = '/dev/input/event2'
+
+# ========== 设备端耗时模型（秒）==========
+FAKE_SHELL_LATENCY = 0.005            # 每条 shell/exec 命令的启动开销
+FAKE_SCREENCAP_LATENCY = 0.03         # screencap 读取帧缓冲
+FAKE_PNG_ENCODE_LATENCY = 0.15        # screencap -p 额外的 PNG 编码耗时
+FAKE_INPUT_TAP_LATENCY = 0.15         # input tap（启动 input 工具）
+FAKE_TRANSFER_BANDWIDTH = 40e6        # 传输带宽（字节/秒，USB 2.0 实测约 35-40MB/s），0 表示不限速
+FAKE_SEND_CHUNK = 64 * 1024           # 限速发送的分块大小
+FAKE_CLOCK_OFFSET = 0.25              # 设备时钟比主机快多少（秒），用于验证时钟偏差估计
+FAKE_CLOCK_DRIFT = 30e-6              # 设备时钟漂移（秒/秒）
+
+INPUT_EVENT_FORMAT = struct.Struct('<qqHHi')  # 64 位用户态 input_event
+TPORT_ID = struct.Struct('<Q')
+# shell v2 客户端发往设备的数据包类型
+SHELL_V2_STDIN = 0
+SHELL_V2_CLOSE_STDIN = 3
+
+
+class FakeTap(NamedTuple):
+    """模拟设备收到的一次点击"""
+    time: float         # 收到时间（time.time()）
+    offset: float       # 回放时间（秒）
+    x: int
+    y: int
+    via: str            # 'input'（input tap 命令）或 'event'（常驻输入通道）
+    frame_index: int    # 当时屏幕上的帧（-1 表示还没截过图）
+    frame_name: str
+
+
+def _shell_v2_packet(packet_id: int, data: bytes = b'') -> bytes:
+    return SHELL_V2_HEADER.pack(packet_id, len(data)) + data
+
+
+class FakeAdbDevice:
+    """模拟设备：回放帧序列作为屏幕内容，解释本项目用到的设备端命令"""
+
+    def __init__(
+        self,
+        source: str,
+        speed: float = 1.0,
+        max_gap: float = REPLAY_MAX_GAP,
+        serial: str = FAKE_DEVICE_SERIAL,
+        screencap_latency: float = FAKE_SCREENCAP_LATENCY,
+        png_encode_latency: float = FAKE_PNG_ENCODE_LATENCY,
+        input_tap_latency: float = FAKE_INPUT_TAP_LATENCY,
+        bandwidth: float = FAKE_TRANSFER_BANDWIDTH,
+        tap_log: Optional[str] = None,
+        clock_offset: float = FAKE_CLOCK_OFFSET,
+        clock_drift: float = FAKE_CLOCK_DRIFT
+    ):
+        """
+        Args:
+            source: 帧来源（截图目录 / zip / 帧归档 .tkarc）
+            speed: 回放速度（1 为实时，0 为每次截图前进一帧）
+            max_gap: 相邻帧最大间隔（秒）
+            serial: 设备序列号
+            screencap_latency: screencap 读取帧缓冲耗时（秒）
+            png_encode_latency: PNG 编码额外耗时（秒）
+            input_tap_latency: input tap 命令耗时（秒）
+            bandwidth: 传输带宽（字节/秒），0 表示不限速
+            tap_log: 点击记录 JSONL 文件路径，None 表示不写文件
+            clock_offset: 设备时钟偏差（秒，设备 - 主机）
+            clock_drift: 设备时钟漂移（秒/秒）
+        """
+        self.serial = serial
+        # 客户端通过 adb 协议截图，没有逐帧确认：尽快回放时每次截图直接前进一帧
+        self.screen = ReplayAutomation(source, speed, max_gap, lockstep=False)
+        self.screencap_latency = screencap_latency
+        self.png_encode_latency = png_encode_latency
+        self.input_tap_latency = input_tap_latency
+        self.bandwidth = bandwidth
+        self.tap_log = tap_log
+        self.clock_offset = clock_offset
+        self.clock_drift = clock_drift
+        self._clock_start = time.time()
+
+        self.taps: List[FakeTap] = []
+        self.commands = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        self._tap_file = None
+
+    def open(self) -> bool:
+        """载入帧来源（确定屏幕尺寸）"""
+        if not self.screen.connect(capture_mode=CAPTURE_MODE_RAW):
+            return False
+        if self.tap_log:
+            directory = os.path.dirname(self.tap_log)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._tap_file = open(self.tap_log, 'a', encoding='utf-8')
+        return True
+
+    def close(self):
+        self.screen.close()
+        if self._tap_file is not None:
+            self._tap_file.close()
+            self._tap_file = None
+
+    # ---------- 屏幕 ----------
+    def _raw_frame(self) -> bytes:
+        """screencap 原始输出：width, height, format(RGBA_8888), colorspace + 像素"""
+        width, height, _, pixels = self.screen.get_raw_screenshot()
+        time.sleep(self.screencap_latency)
+        return struct.pack('<IIII', width, height, 1, 0) + pixels.tobytes()
+
+    def _png_frame(self) -> bytes:
+        data = self.screen.get_screenshot_data() or b''
+        time.sleep(self.screencap_latency + self.png_encode_latency)
+        return data
+
+    # ---------- 点击 ----------
+    def record_tap(self, x: int, y: int, via: str):
+        """记录点击（时间戳 + 当时屏幕上的帧）"""
+        now = time.perf_counter()
+        index = self.screen.frame_at(now)
+        frame_name = self.screen.frames[index].name if index >= 0 else ''
+        tap = FakeTap(time.time(), self.screen.offset_of(now), x, y, via, index, frame_name)
+        with self._lock:
+            self.taps.append(tap)
+            if self._tap_file is not None:
+                self._tap_file.write(json.dumps(tap._asdict(), ensure_ascii=False) + '\n')
+                self._tap_file.flush()
+        stamp = datetime.fromtimestamp(tap.time).strftime('%H:%M:%S.%f')[:-3]
+        print(f"👆 [{stamp}] 点击 ({x}, {y}) via {via}, 帧 {index}: {frame_name}")
+
+    # ---------- 设备端命令 ----------
+    def device_time(self) -> float:
+        """设备时钟（主机时间 + 偏差 + 漂移）"""
+        now = time.time()
+        return now + self.clock_offset + (now - self._clock_start) * self.clock_drift
+
+    def _getevent_output(self) -> bytes:
+        width, height = self.screen.get_screen_size()
+        abs_line = "{name:<22}: value 0, min {low}, max {high}, fuzz 0, flat 0, resolution 0"
+        axes = [('ABS_MT_SLOT', 0, 9), ('ABS_MT_TOUCH_MAJOR', 0, 255),
+                ('ABS_MT_POSITION_X', 0, width - 1), ('ABS_MT_POSITION_Y', 0, height - 1),
+                ('ABS_MT_TRACKING_ID', 0, 65535), ('ABS_MT_PRESSURE', 0, 255)]
+        lines = [
+            "add device 1: /dev/input/event0",
+            '  name:     "gpio-keys"',
+            "  events:",
+            "    KEY (0001): KEY_VOLUMEDOWN        KEY_VOLUMEUP          KEY_POWER",
+            f"add device 2: {FAKE_TOUCH_DEVICE}",
+            '  name:     "fake_touchscreen"',
+            "  events:",
+            "    KEY (0001): BTN_TOUCH",
+        ]
+        for i, (name, low, high) in enumerate(axes):
+            prefix = "    ABS (0003): " if i == 0 else " " * 16
+            lines.append(prefix + abs_line.format(name=name, low=low, high=high))
+        lines += ["  input props:", "    INPUT_PROP_DIRECT"]
+        return ('\n'.join(lines) + '\n').encode()
+
+    def run(self, command: str) -> Tuple[int, bytes, bytes]:
+        """
+        执行设备端命令
+
+        Returns:
+            (退出码, stdout, stderr)
+        """
+        with self._lock:
+            self.commands += 1
+        time.sleep(FAKE_SHELL_LATENCY)
+        return self._execute(command)
+
+    def _execute(self, command: str) -> Tuple[int, bytes, bytes]:
+        # adbutils / 旧协议 shell 附加的退出码标记："( <cmd>\n); echo <marker>$?"
+        marker = re.fullmatch(r'\( (.*)\n\); echo (\S+)\$\?', command, re.S)
+        if marker:
+            code, stdout, stderr = self._execute(marker.group(1))
+            return 0, stdout + f"{marker.group(2)}{code}\n".encode(), stderr
+
+        # 行提取脚本：screencap 写临时文件，dd 按块切出检测行
+        if 'screencap $f' in command:
+            raw = self._raw_frame()
+            parts = []
+            for block, skip, count in re.findall(r'dd if=\$f bs=(\d+) skip=(\d+) count=(\d+)', command):
+                start = int(block) * int(skip)
+                parts.append(raw[start:start + int(block) * int(count)])
+            return 0, b''.join(parts), b''
+
+        # 设备时间：echo $EPOCHREALTIME / date +%s.%N
+        if 'EPOCHREALTIME' in command or command.startswith('date +%s'):
+            return 0, f"{self.device_time():.6f}\n".encode(), b''
+
+        args = command.split()
+        if not args:
+            return 0, b'', b''
+        if args[0] == 'screencap':
+            if '-p' in args:
+                data = self._png_frame()
+                # screencap -p <文件>：写到设备文件，没有输出（模拟设备不提供文件传输）
+                return (0, b'', b'') if args[-1] != '-p' else (0, data, b'')
+            return 0, self._raw_frame(), b''
+        if args[:2] == ['wm', 'size']:
+            width, height = self.screen.get_screen_size()
+            return 0, f"Physical size: {width}x{height}\n".encode(), b''
+        if args[:2] == ['input', 'tap'] and len(args) >= 4:
+            time.sleep(self.input_tap_latency)
+            self.record_tap(int(float(args[2])), int(float(args[3])), 'input')
+            return 0, b'', b''
+        if args[:2] == ['getevent', '-pl']:
+            return 0, self._getevent_output(), b''
+        if args[0] == 'getprop':
+            props = {'ro.product.cpu.abi': FAKE_CPU_ABI, 'ro.build.version.sdk': '34',
+                     'ro.product.model': 'FakeDevice'}
+            value = props.get(args[1], '') if len(args) > 1 else ''
+            return 0, (value + '\n').encode(), b''
+        if args[:2] == ['test', '-w'] and len(args) >= 3:
+            if args[2] != FAKE_TOUCH_DEVICE:
+                return 1, b'', b''
+            return 0, (b'ok\n' if 'echo ok' in command else b''), b''
+        if args[0] in ('rm', 'true', 'echo'):
+            return 0, (' '.join(args[1:]) + '\n').encode() if args[0] == 'echo' else b'', b''
+        return 127, b'', f"/system/bin/sh: {args[0]}: inaccessible or not found\n".encode()
+
+    def is_input_stream(self, command: str) -> bool:
+        """是否是常驻输入通道命令（cat > /dev/input/eventX）"""
+        return re.fullmatch(r'cat\s*>\s*' + re.escape(FAKE_TOUCH_DEVICE), command.strip()) is not None
+
+    def consume_input_events(self, data: bytearray, state: dict):
+        """解析写入输入设备的 input_event，按下（tracking id 从 -1 变为有效值）时记录一次点击"""
+        size = INPUT_EVENT_FORMAT.size
+        usable = len(data) - len(data) % size
+        for offset in range(0, usable, size):
+            _, _, event_type, code, value = INPUT_EVENT_FORMAT.unpack_from(data, offset)
+            if event_type == EV_ABS:
+                if code == ABS_MT_POSITION_X:
+                    state['x'] = value
+                elif code == ABS_MT_POSITION_Y:
+                    state['y'] = value
+                elif code == ABS_MT_TRACKING_ID:
+                    state['pending'] = value
+            elif event_type == EV_SYN and code == SYN_REPORT:
+                pending = state.pop('pending', None)
+                if pending is not None:
+                    if pending >= 0 and state.get('tracking', -1) < 0:
+                        self.record_tap(state.get('x', 0), state.get('y', 0), 'event')
+                    state['tracking'] = pending
+        del data[:usable]
+
+    def send(self, sock: socket.socket, data: bytes, packet_id: Optional[int] = None):
+        """按带宽限速发送（packet_id 不为 None 时按 shell v2 数据包分块）"""
+        start = time.perf_counter()
+        view = memoryview(data)
+        sent = 0
+        while sent < len(data):
+            chunk = view[sent:sent + FAKE_SEND_CHUNK]
+            if packet_id is None:
+                sock.sendall(chunk)
+            else:
+                sock.sendall(SHELL_V2_HEADER.pack(packet_id, len(chunk)) + chunk)
+            sent += len(chunk)
+            if self.bandwidth > 0:
+                delay = start + sent / self.bandwidth - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+        with self._lock:
+            self.bytes_sent += sent
+
+    def print_report(self):
+        print("\n" + "=" * 60)
+        print("📱 模拟设备报告")
+        print("=" * 60)
+        served = len(set(self.screen._served_indexes))
+        print(f"📸 截图 {self.screen.captures} 次, 覆盖 {served}/{len(self.screen.frames)} 帧, "
+              f"命令 {self.commands} 条, 发送 {self.bytes_sent / 1e6:.1f}MB")
+        print(f"👆 点击 {len(self.taps)} 次:")
+        for tap in self.taps:
+            stamp = datetime.fromtimestamp(tap.time).strftime('%H:%M:%S.%f')[:-3]
+            print(f"  - [{stamp}] +{tap.offset:.3f}s ({tap.x}, {tap.y}) via {tap.via}, "
+                  f"帧 {tap.frame_index}: {tap.frame_name}")
+        print("=" * 60)
+
+
+class FakeAdbServer:
+    """假 adb server：监听本机端口，每个连接一个线程"""
+
+    def __init__(self, device: FakeAdbDevice, host: str = ADB_SERVER_HOST, port: int = ADB_SERVER_PORT):
+        """
+        Args:
+            device: 模拟设备
+            host: 监听地址
+            port: 监听端口（默认与 ANDROID_ADB_SERVER_PORT 一致）
+        """
+        self.device = device
+        self.host = host
+        self.port = port
+        self.running = threading.Event()
+        self._listener: Optional[socket.socket] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> 'FakeAdbServer':
+        """开始监听（端口为 0 时自动分配，实际端口写回 self.port）"""
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((self.host, self.port))
+        listener.listen(64)
+        self.port = listener.getsockname()[1]
+        self._listener = listener
+        self.running.set()
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self.thread.start()
+        print(f"✅ 模拟设备 {self.device.serial} 已启动: {self.host}:{self.port}")
+        return self
+
+    def close(self):
+        self.running.clear()
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except OSError:
+                pass
+            self._listener = None
+
+    def _accept_loop(self):
+        while self.running.is_set():
+            try:
+                sock, _ = self._listener.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve_connection, args=(sock,), daemon=True).start()
+
+    # ---------- 协议 ----------
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("连接已关闭")
+            data += chunk
+        return bytes(data)
+
+    def _read_request(self, sock: socket.socket) -> str:
+        length = int(self._recv_exact(sock, 4), 16)
+        return self._recv_exact(sock, length).decode('utf-8', errors='replace')
+
+    @staticmethod
+    def _reply(sock: socket.socket, payload: Optional[str] = None):
+        """OKAY（可带一个长度前缀的字符串）"""
+        if payload is None:
+            sock.sendall(b'OKAY')
+        else:
+            data = payload.encode()
+            sock.sendall(b'OKAY' + b'%04x' % len(data) + data)
+
+    @staticmethod
+    def _fail(sock: socket.socket, message: str):
+        data = message.encode()
+        sock.sendall(b'FAIL' + b'%04x' % len(data) + data)
+
+    def _serve_connection(self, sock: socket.socket):
+        try:
+            while True:
+                request = self._read_request(sock)
+                if request.startswith(('host:', 'host-serial:', 'host-transport-id:')):
+                    if not self._serve_host(sock, request):
+                        break
+                else:
+                    self._serve_device(sock, request)
+                    break
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _serve_host(self, sock: socket.socket, request: str) -> bool:
+        """
+        处理 host 服务
+
+        Returns:
+            连接是否继续（切换到设备传输后，下一个请求是设备服务）
+        """
+        serial = self.device.serial
+        # host-serial:<serial>:<command>
+        match = re.fullmatch(r'host-serial:(.+):([\w-]+)', request)
+        if match:
+            if match.group(1) != serial:
+                self._fail(sock, f"device '{match.group(1)}' not found")
+                return False
+            request = 'host:' + match.group(2)
+
+        if request == 'host:version':
+            self._reply(sock, '%04x' % FAKE_SERVER_VERSION)
+        elif request in ('host:devices', 'host:devices-l'):
+            line = f"{serial}\tdevice"
+            if request.endswith('-l'):
+                line += " product:fake model:FakeDevice device:fake transport_id:1"
+            self._reply(sock, line + '\n')
+        elif request in ('host:features', 'host:host-features'):
+            self._reply(sock, FAKE_DEVICE_FEATURES)
+        elif request == 'host:get-state':
+            self._reply(sock, 'device')
+        elif request == 'host:get-serialno':
+            self._reply(sock, serial)
+        elif request == 'host:kill':
+            self._reply(sock)
+        elif request in ('host:transport-any', 'host:transport-usb', f'host:transport:{serial}',
+                         'host:transport-id:1'):
+            self._reply(sock)
+            return True
+        elif request in ('host:tport:any', 'host:tport:usb', f'host:tport:serial:{serial}'):
+            sock.sendall(b'OKAY' + TPORT_ID.pack(1))
+            return True
+        elif request.startswith(('host:transport', 'host:tport')):
+            self._fail(sock, f"device '{request.rsplit(':', 1)[-1]}' not found")
+        else:
+            self._fail(sock, f"unknown host service: {request}")
+        return False
+
+    def _serve_device(self, sock: socket.socket, request: str):
+        """处理设备服务（exec: / shell: / shell,v2,...:）"""
+        service, _, command = request.partition(':')
+        shell_v2 = service.startswith('shell,v2')
+        if service not in ('exec', 'shell') and not shell_v2:
+            self._fail(sock, f"unsupported service: {service}")
+            return
+        self._reply(sock)
+
+        if self.device.is_input_stream(command):
+            self._serve_input_stream(sock, shell_v2)
+            return
+
+        code, stdout, stderr = self.device.run(command)
+        if shell_v2:
+            self.device.send(sock, stdout, SHELL_V2_STDOUT)
+            if stderr:
+                sock.sendall(_shell_v2_packet(SHELL_V2_STDERR, stderr))
+            sock.sendall(_shell_v2_packet(SHELL_V2_EXIT, bytes([code & 0xff])))
+        else:
+            self.device.send(sock, stdout + stderr if service == 'shell' else stdout)
+
+    def _serve_input_stream(self, sock: socket.socket, shell_v2: bool):
+        """常驻输入通道：持续读取写入的 input_event 直到连接关闭"""
+        sock.settimeout(None)
+        state = {}
+        pending = bytearray()
+        events = bytearray()
+        stdin_closed = False
+        while self.running.is_set():
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            if not shell_v2:
+                events += chunk
+            else:
+                # shell v2：stdin 数据包 id 0，关闭 stdin 包 id 3（cat 随之退出）
+                pending += chunk
+                while len(pending) >= SHELL_V2_HEADER.size:
+                    packet_id, length = SHELL_V2_HEADER.unpack_from(pending, 0)
+                    if len(pending) < SHELL_V2_HEADER.size + length:
+                        break
+                    if packet_id == SHELL_V2_STDIN:
+                        events += pending[SHELL_V2_HEADER.size:SHELL_V2_HEADER.size + length]
+                    elif packet_id == SHELL_V2_CLOSE_STDIN:
+                        stdin_closed = True
+                    del pending[:SHELL_V2_HEADER.size + length]
+            self.device.consume_input_events(events, state)
+            if stdin_closed:
+                break
+        if shell_v2:
+            try:
+                sock.sendall(_shell_v2_packet(SHELL_V2_EXIT, b'\x00'))
+            except OSError:
+                pass
+
+
+def main():
+    """启动模拟设备（可选：同一进程中运行一次完整抢购流程）"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地模拟设备（假 adb server）')
+    parser.add_argument('source', help='帧来源：截图目录 / zip / 帧归档 .tkarc')
+    parser.add_argument('--host', default=ADB_SERVER_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=ADB_SERVER_PORT, help='监听端口（默认 ANDROID_ADB_SERVER_PORT）')
+    parser.add_argument('--serial', default=FAKE_DEVICE_SERIAL, help='设备序列号')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放速度（1 实时，0 每次截图前进一帧）')
+    parser.add_argument('--max-gap', type=float, default=REPLAY_MAX_GAP, help='相邻帧最大间隔（秒）')
+    parser.add_argument('--screencap-latency', type=float, default=FAKE_SCREENCAP_LATENCY, help='screencap 耗时（秒）')
+    parser.add_argument('--png-latency', type=float, default=FAKE_PNG_ENCODE_LATENCY, help='PNG 编码额外耗时（秒）')
+    parser.add_argument('--tap-latency', type=float, default=FAKE_INPUT_TAP_LATENCY, help='input tap 耗时（秒）')
+    parser.add_argument('--bandwidth', type=float, default=FAKE_TRANSFER_BANDWIDTH, help='传输带宽（字节/秒，0 不限速）')
+    parser.add_argument('--tap-log', default=None, help='点击记录 JSONL 文件')
+    parser.add_argument('--clock-offset', type=float, default=FAKE_CLOCK_OFFSET, help='设备时钟偏差（秒，设备 - 主机）')
+    parser.add_argument('--clock-drift', type=float, default=FAKE_CLOCK_DRIFT, help='设备时钟漂移（秒/秒）')
+    parser.add_argument('--run', action='store_true', help='在同一进程中运行一次完整抢购流程')
+    parser.add_argument('--capture-mode', default=CAPTURE_MODE_RAW,
+                        choices=(CAPTURE_MODE_RAW, CAPTURE_MODE_PNG, CAPTURE_MODE_ROWS), help='截图传输模式（--run）')
+    parser.add_argument('--wire', action='store_true', help='使用内置 adb 协议客户端（--run）')
+    parser.add_argument('--input-channel', action='store_true', help='使用常驻输入通道点击（--run）')
+    parser.add_argument('--initial-stage', default=None, help='初始阶段（--run）')
+    parser.add_argument('--start-in', type=float, default=0.0, help='目标时间为 N 秒后（--run，验证定时等待）')
+    parser.add_argument('--linger', type=float, default=1.0, help='回放结束后继续运行的时间（秒，--run）')
+    args = parser.parse_args()
+
+    device = FakeAdbDevice(
+        args.source, args.speed, args.max_gap, serial=args.serial,
+        screencap_latency=args.screencap_latency, png_encode_latency=args.png_latency,
+        input_tap_latency=args.tap_latency, bandwidth=args.bandwidth, tap_log=args.tap_log,
+        clock_offset=args.clock_offset, clock_drift=args.clock_drift
+    )
+    if not device.open():
+        return
+    server = FakeAdbServer(device, args.host, args.port).start()
+
+    if not args.run:
+        if server.port != 5037:
+            print(f"💡 客户端需设置: export ANDROID_ADB_SERVER_PORT={server.port}")
+        print("按 Ctrl+C 停止")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+    else:
+        # adb 命令行、adbutils、内置协议客户端都在连接时读取这个变量
+        os.environ['ANDROID_ADB_SERVER_PORT'] = str(server.port)
+        from adb_automation import ADBAutomation
+        from fast_multi_thread_purchase import TimedMultiThreadPurchase
+
+        auto = ADBAutomation(args.serial)
+        if auto.connect(capture_mode=args.capture_mode, use_wire_client=args.wire):
+            if args.input_channel:
+                auto.open_input_channel()
+            purchase = TimedMultiThreadPurchase(auto, capture_backend='screencap')
+
+            def stop_when_finished():
+                device.screen.finished.wait()
+                time.sleep(args.linger)
+                purchase.running.clear()
+
+            threading.Thread(target=stop_when_finished, daemon=True).start()
+            target_time = datetime.now() + timedelta(seconds=args.start_in)
+            purchase.run_timed_purchase(target_time, initial_stage=args.initial_stage)
+            auto.close()
+
+    server.close()
+    device.print_report()
+    device.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -15,7 +15,19 @@
 - 检测到阶段后自动执行任务，无需手动控制
 - 随机点击延迟，模拟人类操作
 """
-from adb_automation import ADBAutomation
+from adb_automation import ADBAutomation, CAPTURE_MODE_PNG, CAPTURE_MODE_RAW, CAPTURE_MODE_ROWS
+from adb_stream_capture import H264StreamCapture, AV_AVAILABLE
+from png_row_decoder import PngRowDecoder
+from frame_ring import FrameRing, FrameSnapshot, FRAME_RING_SIZE
+from mp_capture_pipeline import CaptureProcess
+from debug_artifact_writer import DebugArtifactWriter
+from event_log import EventLog
+from latency_trace import LatencyTrace
+from frame_archive import FrameArchiveWriter
+from sim_clock import SystemClock, SYSTEM_CLOCK
+from device_clock import DeviceClockSync, DEVICE_CLOCK_RESYNC_INTERVAL
+from capture_scheduler import CaptureRateScheduler
+from frame_age_guard import FrameAgeGuard, FRAME_WATCHDOG_INTERVAL, FRAME_STALE_RECHECK
 import time
 import threading
 import random
@@ -24,6 +36,7 @@ from typing import Optional, Tuple, List
 from datetime import datetime, timedelta
 import os
 import copy
+import zlib
 from collections import deque
 
 # 【优化】优先使用 OpenCV（解码速度 5-9ms vs PIL 12-25ms）
@@ -116,6 +129,9 @@ STAGE_CONFIGS = {
 
 # ========== 定时抢购配置 ==========
 PAGE_LOAD_TIME = 0.2  # 页面加载时间（秒），提前进入时间
+SCHEDULE_ON_DEVICE_CLOCK = False  # 【优化】True 时目标时间按手机时钟解释（小程序按手机时间开售）：估计主机/设备时钟偏差后换算，
+                                  # 长时间等待期间定期重新估计跟踪漂移；设备时间读取失败时按主机时间。
+                                  # 默认 False：目标时间仍是主机时间（打开后已有的定时会按时钟偏差整体平移）
 
 # ========== 点击配置（防脚本检测）==========
 CLICK_INTERVAL_MIN = 0.2   # 最小点击间隔（秒）
@@ -126,7 +142,23 @@ CLICK_BACKOFF_FACTOR = 1.1  # 点击退避因子（每次点击后延迟递增
 
 # ========== 性能优化配置 ==========
 SCREENSHOT_INTERVAL = 0.20   # 截图间隔（秒），根据实际硬件能力调整（adb screencap通常需要80-150ms）
+FRAME_AGE_GUARD = True        # 【优化】帧龄守卫：过旧的帧（截图卡住）不用于阶段切换和点击，看门狗告警（见 frame_age_guard.py）
+ADAPTIVE_CAPTURE_RATE = True  # 【优化】自适应截图节奏：等待期间慢速截图，目标时间前加速到背靠背截图，
+                              # 最后阶段结束后降速（见 capture_scheduler.py）；False 时固定按 SCREENSHOT_INTERVAL
 DETECTION_INTERVAL = 0.004   # 【优化】检测间隔（秒），降到 4ms（从 100ms 优化），页面变化立即检测
+CAPTURE_MODE = CAPTURE_MODE_RAW  # 【优化】截图传输模式：raw 跳过设备端 PNG 编码和主机端解码，不支持时自动回退到 PNG
+                                 # rows 只传回检测行（几十 KB/帧），但没有完整帧（调试截图不可用）
+PARTIAL_PNG_DECODE = True        # 【优化】PNG 模式只解码检测需要的行（解压到最大行即停止），完整帧仅在调试读取时按需解码；
+                                 # 反滤波段太长（比整帧解码慢）时回退整帧解码，之后一段时间直接整帧解码（见 png_row_decoder.py）
+CAPTURE_BACKEND = 'screencap'    # 截图后端：'screencap'（逐帧请求）、'stream'（screenrecord H.264 视频流，30-60fps）
+                                 # 或 'process'（截图+解码在独立进程，经共享内存交给检测，避免与检测/点击争抢 GIL）
+STREAM_BIT_RATE = 8000000        # 视频流码率（bps），码率越高画面越接近原图，颜色检测越准
+CAPTURE_PIPELINE_DEPTH = 1       # 【优化】流水线截图：同时在途的截图请求数（>1 时设备编码、传输、主机解码重叠进行）
+USE_WIRE_CLIENT = False          # 【可选】内置 adb 协议客户端：预热连接池 + recv_into 复用缓冲区（替代 adbutils）
+USE_INPUT_CHANNEL = True         # 【优化】常驻输入通道：直接写触摸事件（<5ms），不可用时回退到 input tap（100-300ms）
+SKIP_UNCHANGED_FRAMES = True     # 【优化】截图数据指纹与已发布帧相同时跳过解码/发布（开售前静止页面大部分帧相同）
+DISPATCH_WAIT_TIMEOUT = 0.5      # 检测线程等待新帧/阶段变化的最长时间（秒），仅用于定期检查停止标志
+PRECISE_WAIT_HANDOFF = 1.0       # 【优化】定时等待剩余这么多秒时交给精确等待（clock.sleep_until），之前按 1 秒步长睡眠并输出状态
 
 # ========== 阶段执行配置 ==========
 STAGE_EXECUTION_TIMEOUT = 4.0  # 非最后阶段的执行超时时间（秒），超时后自动进入下一阶段
@@ -138,6 +170,21 @@ DEBUG_MODE = True           # 是否启用调试模式（显示详细检测信
 DEBUG_SAVE_SCREENSHOTS = True # 是否保存截图用于调试（保存在 temp_screenshots 目录）
 DEBUG_DETECTION_LOG = True   # 是否输出检测日志（避免刷屏）
 DEBUG_CHECK_ONCE = True      # 是否只在启动时检查一次检测点（性能优化）
+RECORD_SESSION = False       # 是否录制会话：每帧的检测行 + 定期关键帧 + 点击写入一个内存映射归档（可用 adb_replay.py 回放）
+SESSION_ARCHIVE_DIR = "temp_recordings"  # 会话归档目录
+
+# ========== 事件日志配置 ==========
+# 【优化】热路径（检测/点击线程）不直接 print：事件先按类型采样/限流，通过的放入内存环形缓冲，
+# 由后台线程格式化后输出到控制台并追加到 JSONL 文件；被过滤的事件不做任何字符串格式化
+EVENT_LOG_ENABLED = True     # 是否启动事件日志（可按实例关闭：截图进程、延迟基准不需要）
+EVENT_LOG_FILE = os.path.join("temp_logs", "events.jsonl")  # 事件日志文件（None 表示只输出到控制台）
+EVENT_LOG_RULES = {
+    # 事件类型: sample_every（每 N 条取 1 条）、max_per_second（每秒最多条数）、console（是否输出到控制台）
+    'detection_point': {'sample_every': 1, 'max_per_second': 40, 'console': True},   # 采样点实际颜色 vs 目标颜色
+    'detection_missing': {'max_per_second': 1},                                      # 检测行不存在
+    'click': {'max_per_second': 20, 'console': False},                               # 每次点击（只写文件）
+    'click_mistake': {'max_per_second': 5},                                          # 小失误：重复点击
+}
 
 
 # ========== 真人点击节奏系统 ==========
@@ -155,22 +202,24 @@ class HumanClickRhythm:
     5. 小失误模型：偶发重复点击（2%概率），模拟真人的"没必要但真实"的错
     """
     
-    def __init__(self, stage_name: str, session_persona: Optional[dict] = None):
+    def __init__(self, stage_name: str, session_persona: Optional[dict] = None, clock: SystemClock = SYSTEM_CLOCK):
         """
         初始化真人点击节奏系统
         
         Args:
             stage_name: 阶段名称（用于获取阶段人格配置）
             session_persona: 会话级人格（用于避免"太稳定地像人"），如果为None则使用默认
+            clock: 时钟（仿真时传入 VirtualClock）
         """
         self.stage_name = stage_name
+        self.clock = clock
         
         # 【策略2】操作惯性：当前节奏状态
         self.current_rhythm = 0.25  # 当前节奏（秒），会惯性变化
         self.rhythm_momentum = 0.0  # 节奏动量（加速/减速趋势）
         
         # 【策略1】节奏曲线：阶段内的时间上下文
-        self.stage_start_time = time.perf_counter()
+        self.stage_start_time = self.clock.perf_counter()
         self.click_count_in_stage = 0
         
         # 【策略3】反直觉停顿：偶发长延迟
@@ -268,7 +317,7 @@ class HumanClickRhythm:
         personality = self.stage_personality
         
         # 计算阶段已执行时间
-        stage_elapsed = time.perf_counter() - self.stage_start_time
+        stage_elapsed = self.clock.perf_counter() - self.stage_start_time
         
         # 【策略1】节奏曲线：根据阶段内时间和点击次数调整目标节奏
         # 使用内部状态 self.click_count_in_stage（单一真相源）
@@ -284,7 +333,7 @@ class HumanClickRhythm:
         # 【策略3】反直觉停顿：偶发长延迟（300-800ms）
         if self._should_take_long_pause(personality, stage_elapsed):
             pause_duration = random.uniform(0.3, 0.8)
-            self.last_long_pause_time = time.perf_counter()
+            self.last_long_pause_time = self.clock.perf_counter()
             # 长停顿后，节奏会变慢（惯性）
             self.current_rhythm *= 1.3
             return pause_duration
@@ -359,7 +408,7 @@ class HumanClickRhythm:
         真人的"反直觉停顿"：连续点了几次后突然停一下
         """
         # 冷却检查
-        if time.perf_counter() - self.last_long_pause_time < self.long_pause_cooldown:
+        if self.clock.perf_counter() - self.last_long_pause_time < self.long_pause_cooldown:
             return False
         
         # 基于停顿频率
@@ -406,42 +455,222 @@ class HumanClickRhythm:
     
     def on_stage_changed(self):
         """阶段变化时重置状态"""
-        self.stage_start_time = time.perf_counter()
+        self.stage_start_time = self.clock.perf_counter()
         self.click_count_in_stage = 0
         # 阶段切换时，节奏可能突变（但仍有惯性）
         self.current_rhythm = self.stage_personality['base_rhythm']
         self.rhythm_momentum = 0.0
 
 
+class CompiledDetectionEngine:
+    """
+    编译后的检测引擎：把 STAGE_CONFIGS 展开为扁平的 numpy 索引数组（ys, xs, 目标色, 容差, 阶段编号），
+    每帧只做一次 fancy-index 取像素 + 一次向量化比较，同时得到所有阶段的匹配结果
+    
+    检测耗时与阶段数、采样点数基本无关（十几个点的 gather 在微秒级）
+    
+    同一帧的结果由调用方按帧ID缓存（_get_stage_matches）；数据未变化的帧不会发布，
+    检测行未变化的帧（画面其他位置变化，如倒计时）沿用帧ID，也不会重新检测
+    """
+    
+    # 各帧格式下 R, G, B 所在的通道
+    CHANNEL_ORDER = {
+        'BGR': [2, 1, 0],
+        'RGBA': [0, 1, 2],
+        'RGB': [0, 1, 2],
+    }
+    
+    def __init__(self, stage_configs: dict):
+        """
+        Args:
+            stage_configs: 阶段配置（STAGE_CONFIGS）
+        """
+        self.stage_names = list(stage_configs.keys())
+        self.stage_index = {name: i for i, name in enumerate(self.stage_names)}
+        
+        ys, xs, targets, tols, stage_ids = [], [], [], [], []
+        for stage_id, stage_name in enumerate(self.stage_names):
+            for (x, y), target, tol in stage_configs[stage_name].get('detectors', []):
+                ys.append(y)
+                xs.append(x)
+                targets.append(target[:3])
+                tols.append(tol)
+                stage_ids.append(stage_id)
+        
+        self.ys = np.array(ys, dtype=np.intp)
+        self.xs = np.array(xs, dtype=np.intp)
+        self.targets = np.array(targets, dtype=np.int16).reshape(-1, 3)  # RGB，int16 避免 uint8 相减溢出
+        self.tols = np.array(tols, dtype=np.int16).reshape(-1, 1)
+        self.stage_ids = np.array(stage_ids, dtype=np.intp)
+        self.detector_counts = np.bincount(self.stage_ids, minlength=len(self.stage_names))
+        
+        # 瘦身版 frame 的行：按升序堆叠后，每个采样点对应的行下标
+        self.rows = sorted(set(ys))
+        self.row_positions = np.searchsorted(np.array(self.rows, dtype=np.intp), self.ys)
+        self.max_x = int(self.xs.max()) if len(xs) else -1
+        self.max_y = int(self.ys.max()) if len(ys) else -1
+    
+    def gather(self, frame_data, frame_format: str) -> Optional[np.ndarray]:
+        """
+        一次取出所有采样点的像素
+        
+        Args:
+            frame_data: 完整 frame (numpy array) 或瘦身 frame (dict: {y: row_data})
+            frame_format: 帧格式（'BGR' / 'RGBA' / 'RGB'）
+        
+        Returns:
+            (N, 3) uint8 RGB 数组，行缺失或越界返回 None
+        """
+        if not len(self.ys):
+            return None
+        order = self.CHANNEL_ORDER.get(frame_format, [0, 1, 2])
+        if isinstance(frame_data, dict):
+            try:
+                block = np.stack([frame_data[y] for y in self.rows])
+            except KeyError:
+                return None
+            if self.max_x >= block.shape[1]:
+                return None
+            pixels = block[self.row_positions, self.xs]
+        else:
+            if self.max_y >= frame_data.shape[0] or self.max_x >= frame_data.shape[1]:
+                return None
+            pixels = frame_data[self.ys, self.xs]
+        return pixels[:, order]
+    
+    def gather_rows(self, rows_block: np.ndarray, frame_format: str) -> Optional[np.ndarray]:
+        """
+        【优化】从帧快照的检测行缓冲 (行数, 宽度, 通道数) 取像素（行顺序与 self.rows 一致，无需 np.stack）
+        """
+        if not len(self.ys) or rows_block.shape[0] != len(self.rows) or self.max_x >= rows_block.shape[1]:
+            return None
+        order = self.CHANNEL_ORDER.get(frame_format, [0, 1, 2])
+        return rows_block[self.row_positions, self.xs][:, order]
+    
+    def evaluate(
+        self,
+        frame_data,
+        frame_format: str,
+        rows_block: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """
+        向量化检测所有阶段
+        
+        Args:
+            frame_data: 完整 frame 或瘦身 frame（rows_block 不为 None 时忽略）
+            frame_format: 帧格式
+            rows_block: 帧快照的检测行缓冲（优先使用）
+        
+        Returns:
+            (每个阶段是否匹配的布尔数组（按 stage_names 顺序）, 采样点像素（用于调试日志，失败为 None）)
+        """
+        if rows_block is not None:
+            pixels = self.gather_rows(rows_block, frame_format)
+        else:
+            pixels = self.gather(frame_data, frame_format)
+        if pixels is None:
+            return np.zeros(len(self.stage_names), dtype=bool), None
+        
+        point_match = (np.abs(pixels.astype(np.int16) - self.targets) <= self.tols).all(axis=1)
+        misses = np.bincount(self.stage_ids[~point_match], minlength=len(self.stage_names))
+        return (misses == 0) & (self.detector_counts > 0), pixels
+
+
 class TimedMultiThreadPurchase:
     """定时多线程快速抢票类"""
     
-    def __init__(self, auto: ADBAutomation):
+    def __init__(
+        self,
+        auto: ADBAutomation,
+        capture_backend: str = CAPTURE_BACKEND,
+        stream_source=None,
+        pipeline_depth: int = CAPTURE_PIPELINE_DEPTH,
+        record_session: bool = RECORD_SESSION,
+        clock: SystemClock = SYSTEM_CLOCK,
+        debug_artifacts: bool = True,
+        event_log: bool = EVENT_LOG_ENABLED
+    ):
+        """
+        Args:
+            auto: ADB 自动化实例
+            capture_backend: 截图后端（'screencap'、'stream' 或 'process'）
+            pipeline_depth: 流水线截图的在途请求数（仅 screencap 后端，1 表示串行）
+            record_session: 是否把每一帧和点击录制到会话归档
+            debug_artifacts: 是否启动调试截图写入器（DEBUG_SAVE_SCREENSHOTS 时；截图进程中关闭）
+            event_log: 是否启动事件日志（后台刷新线程 + JSONL 文件；关闭时事件只在内存中丢弃）
+            stream_source: 视频流工厂函数（返回带 read/close 的对象），None 使用设备 screenrecord；
+                           测试时可传入 lambda: H264FileSource(path) 用录制文件代替真机
+            clock: 时钟（所有计时/等待/线程创建都经过它；传入 VirtualClock 时在虚拟时间中运行，
+                   需配合 ReplayAutomation 和 screencap 后端）
+        """
         self.auto = auto
+        self.clock = clock
+        self.capture_backend = capture_backend
+        self.stream_source = stream_source
+        self.pipeline_depth = max(1, pipeline_depth)
         
         # 屏幕尺寸（初始化时获取一次，避免重复调用）
         print("📱 获取屏幕尺寸...")
         self.screen_width, self.screen_height = self.auto.get_screen_size()
         print(f"✅ 屏幕尺寸: {self.screen_width}x{self.screen_height}")
         
-        # 内存截图系统（使用锁保护）
-        self.frame_lock = threading.Lock()
-        self.latest_frame: Optional[np.ndarray] = None  # 最新截图帧（完整版，用于调试）
-        self.latest_slim_frame: Optional[dict] = None   # 【优化】瘦身版：只包含 detector 需要的行 {y: row_data}
-        self.latest_png_data: Optional[bytes] = None    # 最新PNG数据（用于保存截图）
-        self.frame_id = 0  # 【修复问题3】帧ID，用于避免空转检测
-        self.frame_format = 'BGR'  # 【优化1】帧格式：'BGR'（OpenCV）或'RGBA'（PIL），用于正确读取RGB
+        # 【优化】内存截图系统：不可变帧快照，发布时一次属性赋值替换，读者直接读取 self.snapshot，无需加锁
+        # （帧 / 瘦身版 / 格式 / 帧ID / 时间戳始终来自同一帧；检测行在帧环槽位中，检测时钉住槽位再读取）
+        self.snapshot: Optional[FrameSnapshot] = None
+        self.frame_lock = threading.Lock()  # 只在发布端使用：分配帧ID、流水线按请求编号丢弃旧帧
+        self.frame_id = 0  # 【修复问题3】最近发布的帧ID
+        self._decoded_frame = (0, None)  # PNG 部分解码模式下按需整帧解码的缓存 (frame_id, frame)
+        self._snapshot_capture_buffer = None  # 最新快照的 raw 完整帧所在的接收缓冲区（快照被替换时归还）
+        
+        # 【优化】事件驱动分发：发布新帧 / 阶段变化时唤醒检测线程，没有变化时检测线程完全空闲
+        self.dispatch_cond = threading.Condition()
+        self.dispatch_version = 0  # 每次发布新帧或阶段变化 +1
+        self.dispatch_waiters = 0  # 正在等待分发的检测线程数（发布新帧时会被唤醒的线程）
+        
+        # 【优化】流水线截图状态：请求按开始时间编号，只发布比已发布帧更新的帧
+        self.pipeline_lock = threading.Lock()
+        self.capture_seq = 0  # 最近一次预约的请求编号
+        self.last_published_seq = 0  # 最近一次发布的帧对应的请求编号
+        self.next_capture_start = 0.0  # 下一个请求的最早开始时间（perf_counter）
+        self.capture_latency_ema = SCREENSHOT_INTERVAL  # 单次截图耗时的滑动平均（秒）
+        # 【优化】截图节奏：按距离目标时间分阶段决定截图间隔，统计各阶段实际帧率
+        self.capture_scheduler = CaptureRateScheduler(
+            self.clock, fixed_interval=None if ADAPTIVE_CAPTURE_RATE else SCREENSHOT_INTERVAL
+        )
+        # 【优化】帧龄守卫：检测/点击前检查快照帧龄，看门狗告警，记录帧龄直方图
+        self.frame_age_guard = FrameAgeGuard(self.clock)
         
         # 【优化】预计算每个阶段需要的行（用于瘦身优化）
         self.detector_rows_cache = {}  # {stage_name: set(y坐标)}
-        # 【优化3】预编译detectors为(x, y, tr, tg, tb, tol)结构，减少tuple unpack开销
-        self.compiled_detectors_cache = {}  # {stage_name: [(x, y, tr, tg, tb, tol), ...]}
+        # 【优化】编译后的检测引擎：所有阶段的采样点一次 gather + 一次向量化比较
+        self.detection_engine: Optional[CompiledDetectionEngine] = None
+        self._stage_match_cache = (-1, None)  # (frame_id, 各阶段匹配结果)，同一帧只检测一次
+        self.all_needed_rows: Tuple[int, ...] = ()  # 所有阶段需要的行（升序，截图线程/设备端行提取共用）
         self._precompute_detector_rows()
         
+        # 【优化】预分配帧槽位：检测行直接复制进槽位缓冲，稳态下截图循环不再分配行数据
+        self.frame_ring = FrameRing(self.all_needed_rows, max(FRAME_RING_SIZE, self.pipeline_depth + 2))
+        
         # 调试相关
         self.debug_screenshot_dir = "temp_screenshots"
-        if DEBUG_SAVE_SCREENSHOTS:
-            os.makedirs(self.debug_screenshot_dir, exist_ok=True)
+        # 【优化】调试截图交给后台线程写入（有界队列 + 按内容寻址），截图/检测线程不做磁盘 I/O
+        self.debug_writer: Optional[DebugArtifactWriter] = None
+        if DEBUG_SAVE_SCREENSHOTS and debug_artifacts:
+            self.debug_writer = DebugArtifactWriter(self.debug_screenshot_dir).start()
+        # 【优化】热路径事件日志（采样/限流 + 后台输出）；关闭时不写文件、不启动刷新线程
+        if event_log:
+            self.event_log = EventLog(EVENT_LOG_FILE, EVENT_LOG_RULES).start()
+        else:
+            self.event_log = EventLog(None, EVENT_LOG_RULES, console=False)
+        # 会话录制（检测行直接 memcpy 进内存映射文件，关键帧按时间间隔写入）
+        self.recorder: Optional[FrameArchiveWriter] = None
+        if record_session:
+            archive_path = os.path.join(
+                SESSION_ARCHIVE_DIR, f"session_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]}.tkarc"
+            )
+            self.recorder = FrameArchiveWriter(archive_path, self.all_needed_rows,
+                                               self.screen_width, self.screen_height)
+            print(f"🎞️  会话录制: {archive_path}")
         
         # 阶段状态管理
         self.current_stage: Optional[str] = None  # 当前阶段名称（只有detect线程能修改）
@@ -461,11 +690,21 @@ class TimedMultiThreadPurchase:
         
         # 统计信息
         self.stats = {
-            'screenshots': 0,
+            'screenshots': 0,        # 完成的截图（含下面跳过 / 丢弃的帧）
+            'frames_published': 0,   # 发布的新帧（帧ID递增、唤醒检测线程）
             'stage_detections': {},  # 每个阶段的检测次数
             'stage_actions': {},     # 每个阶段的执行次数
+            'frames_dropped': 0,     # 流水线截图中因更新的帧先完成而丢弃的旧帧
+            'decodes_skipped': 0,    # 数据指纹未变化而跳过解码/发布的帧
+            'detections_skipped': 0, # 因此省去的检测线程唤醒次数（每帧按当时等待分发的线程数计）
+            'rows_unchanged': 0,     # 画面有变化但检测行未变化（沿用帧ID、不唤醒检测线程）的帧
         }
         self.stats_lock = threading.Lock()  # 【修复问题4】统计信息锁
+        # 【优化】端到端延迟追踪：每帧（请求/首字节/末字节/解码/发布/检测/阶段切换）和每次点击的时间点，
+        # 写入预分配数组，结束时按环节输出 p50/p90/p99
+        self.latency_trace = LatencyTrace()
+        self.entry_error: Optional[float] = None  # 定时等待实际到达进入时间的误差（秒，正数为晚到）
+        self.device_clock: Optional[DeviceClockSync] = None  # 设备时钟偏差跟踪（按设备时钟定时时使用）
     
     def _generate_session_persona(self) -> dict:
         """
@@ -534,24 +773,48 @@ class TimedMultiThreadPurchase:
             return copy.deepcopy(self.stats)
     
     def _precompute_detector_rows(self):
-        """【优化】预计算每个阶段需要的行（用于瘦身优化）+ 预编译detectors"""
+        """【优化】预计算每个阶段需要的行（用于瘦身优化）+ 编译检测引擎"""
         for stage_name, config in STAGE_CONFIGS.items():
             rows = set()
-            compiled = []
             for (x, y), target, tol in config.get('detectors', []):
                 rows.add(y)
-                # 【优化3】预编译为(x, y, tr, tg, tb, tol)结构，减少tuple unpack开销
-                tr, tg, tb = target[0], target[1], target[2]
-                compiled.append((x, y, tr, tg, tb, tol))
             self.detector_rows_cache[stage_name] = rows
-            self.compiled_detectors_cache[stage_name] = compiled
+        if NUMPY_AVAILABLE:
+            self.detection_engine = CompiledDetectionEngine(STAGE_CONFIGS)
+        all_rows = set()
+        for rows in self.detector_rows_cache.values():
+            all_rows.update(rows)
+        self.all_needed_rows = tuple(sorted(all_rows))
+        self.png_row_decoder = PngRowDecoder(self.all_needed_rows)
     
     # ---------- 基础工具方法 ----------
-    def _tap(self, x: int, y: int):
+    def _tap(self, x: int, y: int, stage_name: Optional[str] = None):
         """点击坐标（带随机偏移）"""
         offset_x = random.randint(-CLICK_COORD_OFFSET, CLICK_COORD_OFFSET)
         offset_y = random.randint(-CLICK_COORD_OFFSET, CLICK_COORD_OFFSET)
-        self.auto._run_adb_command(['shell', 'input', 'tap', str(x + offset_x), str(y + offset_y)])
+        # 【优化】ADBAutomation.tap 优先走常驻输入通道，不可用时回退到 input tap
+        issued = self.clock.perf_counter()
+        self.auto.tap(x + offset_x, y + offset_y)
+        returned = self.clock.perf_counter()
+        stage_index = -1
+        if self.detection_engine is not None and stage_name in self.detection_engine.stage_index:
+            stage_index = self.detection_engine.stage_index[stage_name]
+            self.latency_trace.record_tap(stage_index, issued, returned)
+        if self.recorder is not None:
+            self.recorder.record_tap(issued, returned, x + offset_x, y + offset_y, stage_index)
+        self.event_log.emit('click', "👆 点击 ({x}, {y})", x=x + offset_x, y=y + offset_y)
+    
+    def _frame_is_fresh(self, kind: str, snapshot: Optional[FrameSnapshot]) -> bool:
+        """【优化】帧龄守卫：快照是否足够新（允许额外的当前截图间隔和截图耗时；守卫关闭或还没有帧时不拦截）"""
+        if not FRAME_AGE_GUARD or snapshot is None:
+            return True
+        return self.frame_age_guard.check(kind, snapshot, self.capture_scheduler.interval())
+    
+    def thread_frame_watchdog(self):
+        """【优化】帧龄看门狗：定期检查最新快照的帧龄，超过阈值时告警"""
+        while self.running.is_set():
+            self.frame_age_guard.watch(self.snapshot, self.capture_scheduler.interval())
+            self.clock.sleep(FRAME_WATCHDOG_INTERVAL)
     
     def _png_bytes_to_numpy(self, png_data: bytes) -> Tuple[Optional[np.ndarray], str]:
         """
@@ -606,19 +869,240 @@ class TimedMultiThreadPurchase:
             print(f"❌ PNG 解码失败: {e}")
             return None, ''
     
+    def _raw_screenshot_to_numpy(self) -> Tuple[Optional[np.ndarray], str]:
+        """
+        【优化】获取原始帧缓冲并直接转换为 numpy array（无解码步骤）
+        
+        Returns:
+            (numpy array, format): (height, width, 4) RGBA 视图（只读，不复制），失败返回 (None, '')
+        """
+        if not NUMPY_AVAILABLE:
+            return None, ''
+        
+        parsed = self.auto.get_raw_screenshot()
+        if parsed is None:
+            return None, ''
+        
+        width, height, frame_format, pixels = parsed
+        # 直接把像素数据当作 (h, w, c) 视图，不做任何解码/复制
+        frame = np.frombuffer(pixels, np.uint8).reshape(height, width, -1)
+        return frame, frame_format
+    
+    def _rows_screenshot_to_slim(self) -> Tuple[Optional[dict], str]:
+        """
+        【优化】设备端行提取：直接得到瘦身版 frame（只有检测需要的行，没有完整帧）
+        
+        Returns:
+            (slim_frame, format): {y: (width, channels) 行视图}，失败返回 (None, '')
+        """
+        if not NUMPY_AVAILABLE or not self.all_needed_rows:
+            return None, ''
+        
+        result = self.auto.get_screenshot_rows(self.all_needed_rows)
+        if result is None:
+            return None, ''
+        
+        width, frame_format, rows = result
+        if width != self.screen_width:
+            print(f"⚠️ 截图宽度不匹配: 期望 {self.screen_width}, 实际 {width}")
+            return None, ''
+        # 每行直接视为 (width, channels)，不复制（行数据来自本次请求独占的 bytes，不会被复用）
+        slim_frame = {y: np.frombuffer(row, np.uint8).reshape(width, -1) for y, row in rows.items()}
+        return slim_frame, frame_format
+    
+    def _rows_fingerprint(self, rows) -> int:
+        """检测行数据的指纹（按 all_needed_rows 顺序串联 crc32，十几行只需微秒级）"""
+        crc = 0
+        for row in rows:
+            crc = zlib.crc32(row, crc)
+        return crc
+    
+    def _take_capture_buffer(self):
+        """取走本线程截图使用的接收缓冲区（回放等没有缓冲区管理的 auto 返回 None）"""
+        take = getattr(self.auto, 'take_capture_buffer', None)
+        return take() if take is not None else None
+    
+    def _release_capture_buffer(self, recv_buffer=None):
+        """归还接收缓冲区（None 时归还本线程截图使用的缓冲区）"""
+        release = getattr(self.auto, 'release_capture_buffer', None)
+        if release is not None:
+            release(recv_buffer)
+    
+    def _acknowledge_frame(self, snapshot: Optional[FrameSnapshot] = None):
+        """
+        最近一次截图的帧已处理完（回放尽快模式据此前进到下一帧，其他 auto 没有该方法）
+        
+        Args:
+            snapshot: 已处理的快照；已有更新的帧发布时不再确认（那一帧还没处理）
+        """
+        acknowledge = getattr(self.auto, 'acknowledge_frame', None)
+        if acknowledge is None:
+            return
+        if snapshot is not None and snapshot is not self.snapshot:
+            latest = self.snapshot
+            if latest is None or latest.frame_id != snapshot.frame_id:
+                return
+        acknowledge()
+    
+    def _is_unchanged(self, fingerprint: int) -> bool:
+        """指纹是否与已发布的最新帧相同"""
+        if not SKIP_UNCHANGED_FRAMES:
+            return False
+        snapshot = self.snapshot
+        return snapshot is not None and snapshot.fingerprint == fingerprint
+    
+    def _capture_frame(self) -> Tuple[Optional[np.ndarray], str, Optional[bytes], Optional[dict], Optional[int]]:
+        """
+        获取一帧截图（按 ADBAutomation.capture_mode 选择 rows、raw 或 PNG 传输）
+        
+        【优化】先计算截图数据指纹，与已发布帧相同时不再解码（PNG 对整个压缩数据做 crc32，
+        raw / rows 只对检测行做 crc32，它们没有解码步骤，整帧哈希反而比跳过的工作更贵）
+        
+        Returns:
+            (numpy array, format, png_data, slim_frame, fingerprint):
+                - raw 模式下 png_data 为 None
+                - rows 模式下只有 slim_frame，frame 为 None
+                - PNG 部分解码时 frame 为 None（读取完整帧时由 png_data 按需解码）
+                - 其他模式 slim_frame 为 None（发布时从完整帧生成）
+                - 数据未变化时 frame 和 slim_frame 都为 None，fingerprint 不为 None
+                - 失败返回 (None, '', None, None, None)
+        """
+        if self.auto.capture_mode == CAPTURE_MODE_ROWS:
+            slim_frame, frame_format = self._rows_screenshot_to_slim()
+            if slim_frame is None:
+                return None, '', None, None, None
+            fingerprint = self._rows_fingerprint(slim_frame[y] for y in self.all_needed_rows if y in slim_frame)
+            if self._is_unchanged(fingerprint):
+                return None, frame_format, None, None, fingerprint
+            return None, frame_format, None, slim_frame, fingerprint
+        
+        if self.auto.capture_mode == CAPTURE_MODE_RAW:
+            frame, frame_format = self._raw_screenshot_to_numpy()
+            if frame is None:
+                return None, '', None, None, None
+            fingerprint = self._rows_fingerprint(frame[y] for y in self.all_needed_rows if y < frame.shape[0])
+            if self._is_unchanged(fingerprint):
+                return None, frame_format, None, None, fingerprint
+            return frame, frame_format, None, None, fingerprint
+        
+        # 获取原始 PNG 数据（直接从 ADB 获取，不经过文件）
+        png_data = self.auto.get_screenshot_data()
+        if not png_data:
+            return None, '', None, None, None
+        
+        # 【优化】压缩数据未变化：跳过解码（约 200KB 的 crc32 < 0.1ms，解码需要 5-20ms）
+        fingerprint = zlib.crc32(png_data)
+        if self._is_unchanged(fingerprint):
+            return None, self.snapshot.frame_format, None, None, fingerprint
+        
+        # 【优化】部分解码：只解出检测行，完整帧等调试代码读取时再解码
+        if PARTIAL_PNG_DECODE and self.all_needed_rows:
+            decoded = self.png_row_decoder.decode(png_data)
+            if decoded is not None:
+                slim_frame, frame_format, width, height = decoded
+                if width == self.screen_width and height == self.screen_height:
+                    return None, frame_format, png_data, slim_frame, fingerprint
+                print(f"⚠️ 截图尺寸不匹配: 期望 {self.screen_width}x{self.screen_height}, "
+                      f"实际 {width}x{height}")
+                return None, '', None, None, None
+        
+        # 转换为 numpy array（BGR 或 RGBA 格式）
+        frame, frame_format = self._png_bytes_to_numpy(png_data)
+        if frame is None:
+            print("⚠️ PNG 解码失败")
+            return None, '', None, None, None
+        return frame, frame_format, png_data, None, fingerprint
+    
+    def _encode_png(self, frame: np.ndarray, frame_format: str) -> Optional[bytes]:
+        """
+        将 numpy 帧编码为 PNG（仅调试保存 raw 模式截图时使用）
+        
+        Args:
+            frame: numpy array
+            frame_format: 帧格式（'BGR' / 'RGBA' / 'RGB'）
+        """
+        try:
+            if OPENCV_AVAILABLE:
+                if frame_format == 'RGBA':
+                    frame = cv2.cvtColor(frame, cv2.COLOR_RGBA2BGR)
+                elif frame_format == 'RGB':
+                    frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+                ok, buf = cv2.imencode('.png', frame)
+                return buf.tobytes() if ok else None
+            if PIL_AVAILABLE:
+                if frame_format == 'BGR':
+                    frame = frame[:, :, ::-1]
+                output = BytesIO()
+                Image.fromarray(np.ascontiguousarray(frame)).save(output, format='PNG')
+                return output.getvalue()
+        except Exception as e:
+            print(f"⚠️ PNG 编码失败: {e}")
+        return None
+    
+    def _submit_debug_frame(
+        self,
+        frame: Optional[np.ndarray],
+        frame_format: str,
+        png_data: Optional[bytes],
+        name: str,
+        coalesce_key: Optional[str] = None
+    ) -> bool:
+        """
+        【优化】调试截图交给后台写入器（raw 帧的 PNG 编码也在后台线程完成，rows 模式没有完整帧，不保存）
+        
+        Args:
+            frame: 完整帧（png_data 为 None 时在后台编码）
+            frame_format: 帧格式
+            png_data: 原始 PNG 数据
+            name: 索引中记录的名字前缀（自动追加时间戳）
+            coalesce_key: 合并键，相同键的待写任务只保留最新的一个
+        
+        Returns:
+            是否已加入写入队列
+        """
+        if self.debug_writer is None:
+            return False
+        timestamp = self.clock.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
+        if png_data is not None:
+            return self.debug_writer.submit(png_data, f"{name}_{timestamp}", coalesce_key)
+        if frame is None:
+            return False
+        
+        def prepare():
+            # raw 帧可能是复用接收缓冲区上的视图：确定入队后才在本线程复制（被合并/丢弃的任务不复制），编码在后台
+            copied = frame.copy()
+            return lambda: self._encode_png(copied, frame_format)
+        return self.debug_writer.submit(None, f"{name}_{timestamp}", coalesce_key, prepare=prepare)
+    
     def _get_latest_frame(self, slim: bool = True):
         """
-        获取最新截图帧（线程安全，优化版：支持瘦身版）
+        获取最新截图帧（无锁：读取不可变快照，支持瘦身版；不钉住槽位，只用于状态输出/调试）
         
         Args:
             slim: 是否返回瘦身版（只包含 detector 需要的行），默认 True
         """
-        with self.frame_lock:
-            if slim and self.latest_slim_frame is not None:
-                # 返回瘦身版（用于检测，减少内存和 cache miss）
-                return self.latest_slim_frame
-            # 返回完整版（用于调试）
-            return self.latest_frame
+        snapshot = self.snapshot
+        if snapshot is None:
+            return None
+        if slim and snapshot.slim is not None:
+            # 返回瘦身版（用于检测，减少内存和 cache miss）
+            return snapshot.slim
+        # 返回完整版（用于调试）
+        if snapshot.frame is not None:
+            return snapshot.frame
+        # rows 模式没有完整帧，退回瘦身版
+        if snapshot.png_data is None:
+            return snapshot.slim
+        
+        # 【优化】PNG 部分解码模式：调试代码需要完整帧时才整帧解码（结果按帧ID缓存）
+        cached_id, cached_frame = self._decoded_frame
+        if cached_id == snapshot.frame_id:
+            return cached_frame
+        frame, _ = self._png_bytes_to_numpy(snapshot.png_data)
+        if frame is None:
+            return snapshot.slim
+        self._decoded_frame = (snapshot.frame_id, frame)
+        return frame
     
     def debug_check_detection_points(self):
         """
@@ -649,19 +1133,25 @@ class TimedMultiThreadPurchase:
                 continue
             
             # 【优化1】获取帧格式，用于正确读取RGB
-            with self.frame_lock:
-                frame_format = self.frame_format
+            frame_format = self.snapshot.frame_format
             is_bgr = (frame_format == 'BGR')
             
             for i, ((x, y), target, tol) in enumerate(detectors, 1):
-                # 边界检查
-                if y >= frame.shape[0] or x >= frame.shape[1]:
+                # 边界检查（瘦身版按行查找）
+                if isinstance(frame, dict):
+                    row = frame.get(y)
+                    if row is None or x >= row.shape[0]:
+                        print(f"  检测点{i}: ({x}, {y}) ❌ 超出截图范围")
+                        continue
+                    pixel = row[x]
+                elif y >= frame.shape[0] or x >= frame.shape[1]:
                     print(f"  检测点{i}: ({x}, {y}) ❌ 超出截图范围")
                     continue
+                else:
+                    pixel = frame[y, x]
                 
                 # 获取实际颜色
                 # 【优化1】根据格式正确读取RGB（BGR格式需要反转）
-                pixel = frame[y, x]
                 if is_bgr:
                     # BGR格式：pixel = [B, G, R]
                     r, g, b = pixel[2], pixel[1], pixel[0]
@@ -685,98 +1175,97 @@ class TimedMultiThreadPurchase:
         
         print("=" * 60)
         
-        # 保存当前截图
-        if DEBUG_SAVE_SCREENSHOTS:
-            try:
-                with self.frame_lock:
-                    png_data = self.latest_png_data
-                if png_data:
-                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
-                    filename = os.path.join(self.debug_screenshot_dir, f"debug_check_{timestamp}.png")
-                    with open(filename, 'wb') as f:
-                        f.write(png_data)
-                    print(f"💾 当前截图已保存: {filename}")
-            except Exception as e:
-                print(f"⚠️ 保存截图失败: {e}")
+        # 保存当前截图（后台写入）
+        snapshot = self.snapshot
+        if DEBUG_SAVE_SCREENSHOTS and snapshot is not None:
+            if self._submit_debug_frame(snapshot.frame, snapshot.frame_format, snapshot.png_data, "debug_check"):
+                print(f"💾 当前截图已加入写入队列: {self.debug_writer.index_path}")
     
     def _color_close(self, c1: Tuple[int, int, int], c2: Tuple[int, int, int], tolerance: int) -> bool:
         """判断两个颜色是否接近"""
         return all(abs(c1[i] - c2[i]) <= tolerance for i in range(3))
     
-    def _detect_stage(self, frame_data, stage_name: str) -> bool:
+    def _log_detection(self, stage_name: str, pixels: Optional[np.ndarray]):
+        """调试：输出某阶段每个采样点的实际颜色与目标颜色"""
+        engine = self.detection_engine
+        log = self.event_log
+        if pixels is None:
+            log.emit('detection_missing', "⚠️ [{stage}] 检测点行不存在或超出范围", stage=stage_name)
+            return
+        for i in np.flatnonzero(engine.stage_ids == engine.stage_index[stage_name]):
+            # 【优化】先过采样/限流，被过滤的点不做颜色差值计算和格式化
+            if not log.should_log('detection_point'):
+                continue
+            rgb = tuple(int(v) for v in pixels[i])
+            target = tuple(int(v) for v in engine.targets[i])
+            tol = int(engine.tols[i, 0])
+            max_diff = max(abs(a - t) for a, t in zip(rgb, target))
+            log.record(
+                'detection_point',
+                "🔍 [{stage}] 点({x},{y}): 实际RGB{rgb} vs 目标RGB{target} 容差={tol} 最大差值={max_diff} {status}",
+                stage=stage_name, x=int(engine.xs[i]), y=int(engine.ys[i]), rgb=rgb, target=target,
+                tol=tol, max_diff=max_diff, status="✅" if max_diff <= tol else "❌"
+            )
+    
+    def _get_stage_matches(self, snapshot: FrameSnapshot, acknowledge: bool = True) -> Optional[np.ndarray]:
         """
-        检测阶段（优化版：支持瘦身 frame + inline 颜色检测 + 预编译detectors + BGR支持）
+        【优化】一次检测所有阶段（同一帧只计算一次，各阶段检测线程共享结果）
+        
+        Args:
+            snapshot: 帧快照（直接使用其检测行缓冲，读取期间钉住槽位）
+            acknowledge: 检测完成后是否立即确认该帧已处理（检测线程在阶段切换之后再确认）
+        
+        Returns:
+            各阶段是否匹配的布尔数组（按 detection_engine.stage_names 顺序），
+            快照的槽位已被新帧复用时返回 None（调用方改用最新快照）
+        """
+        cached_id, cached_matches = self._stage_match_cache
+        if cached_id == snapshot.frame_id:
+            return cached_matches
+        
+        ring = snapshot.ring
+        if ring is not None and not ring.pin(snapshot):
+            return None
+        try:
+            matches, pixels = self.detection_engine.evaluate(
+                snapshot.slim, snapshot.frame_format, rows_block=snapshot.rows
+            )
+        finally:
+            if ring is not None:
+                ring.unpin(snapshot)
+        if DEBUG_DETECTION_LOG and DEBUG_MODE:
+            for stage_name in self.detection_engine.stage_names:
+                self._log_detection(stage_name, pixels)
+        # 单次元组赋值是原子的，读者无需加锁
+        self._stage_match_cache = (snapshot.frame_id, matches)
+        if acknowledge:
+            self._acknowledge_frame(snapshot)
+        return matches
+    
+    def _detect_stage(self, frame_data, stage_name: str, frame_format: Optional[str] = None) -> bool:
+        """
+        检测阶段（向量化版：编译检测引擎一次计算所有采样点）
         
         Args:
             frame_data: 可以是完整 frame (numpy array) 或瘦身 frame (dict: {y: row_data})
             stage_name: 阶段名称
+            frame_format: 帧格式（BGR或RGBA），None 时读取最新帧的格式
             
         Returns:
             bool: 是否匹配该阶段
         """
-        # 【优化3】使用预编译的detectors（(x, y, tr, tg, tb, tol)结构）
-        compiled_detectors = self.compiled_detectors_cache.get(stage_name, [])
-        if not compiled_detectors:
+        engine = self.detection_engine
+        if engine is None or stage_name not in engine.stage_index:
             return False
         
-        # 判断是完整 frame 还是瘦身 frame
-        is_slim = isinstance(frame_data, dict)
+        if frame_format is None:
+            snapshot = self.snapshot
+            frame_format = snapshot.frame_format if snapshot is not None else 'BGR'
         
-        # 【优化1】获取帧格式（BGR或RGBA），用于正确读取RGB
-        with self.frame_lock:
-            frame_format = self.frame_format
-        
-        # 【优化1】根据格式确定RGB通道索引
-        # BGR格式：pixel = [B, G, R]，需要读取pixel[2], pixel[1], pixel[0]
-        # RGBA格式：pixel = [R, G, B, A]，需要读取pixel[0], pixel[1], pixel[2]
-        is_bgr = (frame_format == 'BGR')
-        
-        # 【优化3】使用预编译结构，减少tuple unpack开销
-        for x, y, tr, tg, tb, tol in compiled_detectors:
-            # 获取像素值
-            if is_slim:
-                # 瘦身版：从 dict 中取行
-                if y not in frame_data:
-                    if DEBUG_DETECTION_LOG:
-                        print(f"⚠️ 检测点行不存在: ({x}, {y})")
-                    return False
-                row = frame_data[y]
-                if x >= row.shape[0]:
-                    if DEBUG_DETECTION_LOG:
-                        print(f"⚠️ 检测点超出范围: ({x}, {y}), 行宽度: {row.shape[0]}")
-                    return False
-                pixel = row[x]
-            else:
-                # 完整版：原有逻辑
-                if y >= frame_data.shape[0] or x >= frame_data.shape[1]:
-                    if DEBUG_DETECTION_LOG:
-                        print(f"⚠️ 检测点超出范围: ({x}, {y}), 截图尺寸: {frame_data.shape[1]}x{frame_data.shape[0]}")
-                    return False
-                pixel = frame_data[y, x]
-            
-            # 【优化1】根据格式正确读取RGB（BGR格式需要反转）
-            if is_bgr:
-                # BGR格式：pixel = [B, G, R]
-                r, g, b = pixel[2], pixel[1], pixel[0]
-            else:
-                # RGBA格式：pixel = [R, G, B, A]
-                r, g, b = pixel[0], pixel[1], pixel[2]
-            
-            # 【优化】inline 颜色检测（避免函数调用开销，节省 1-2ms）
-            if not (abs(r - tr) <= tol and abs(g - tg) <= tol and abs(b - tb) <= tol):
-                if DEBUG_DETECTION_LOG and DEBUG_MODE:
-                    diff = [abs(r - tr), abs(g - tg), abs(b - tb)]
-                    max_diff = max(diff)
-                    print(f"🔍 [{stage_name}] 点({x},{y}): 实际RGB({r},{g},{b}) vs 目标RGB({tr},{tg},{tb}) "
-                          f"容差={tol} 最大差值={max_diff} ❌")
-                return False
-            elif DEBUG_DETECTION_LOG and DEBUG_MODE:
-                diff = [abs(r - tr), abs(g - tg), abs(b - tb)]
-                max_diff = max(diff)
-                print(f"🔍 [{stage_name}] 点({x},{y}): 实际RGB({r},{g},{b}) vs 目标RGB({tr},{tg},{tb}) "
-                      f"容差={tol} 最大差值={max_diff} ✅")
-
-        return True
+        matches, pixels = engine.evaluate(frame_data, frame_format)
+        if DEBUG_DETECTION_LOG and DEBUG_MODE:
+            self._log_detection(stage_name, pixels)
+        return bool(matches[engine.stage_index[stage_name]])
 
     def _execute_stage_action(self, stage_name: str):
         """
@@ -812,10 +1301,10 @@ class TimedMultiThreadPurchase:
             
             # 循环点击直到进入下一阶段、超时或停止
             click_count = 0
-            execution_start = time.perf_counter()
+            execution_start = self.clock.perf_counter()
             
             # 【核心改进】创建真人节奏系统（传入会话级 persona）
-            rhythm = HumanClickRhythm(stage_name, self.session_persona)
+            rhythm = HumanClickRhythm(stage_name, self.session_persona, self.clock)
             print(f"🎭 使用节奏人格: {rhythm.stage_personality['name']} "
                   f"(基础节奏: {rhythm.stage_personality['base_rhythm']:.2f}s, "
                   f"紧张度: {rhythm.stage_personality['tension_level']:.1f})")
@@ -831,7 +1320,7 @@ class TimedMultiThreadPurchase:
                 STAGE_DISAPPEAR_THRESHOLD = 3  # 连续失败3次才认为阶段消失
                 
                 while self.running.is_set():
-                    elapsed = time.perf_counter() - execution_start
+                    elapsed = self.clock.perf_counter() - execution_start
                     
                     # 检查是否已经进入下一阶段（理论上不应该发生，因为这是最后阶段）
                     with self.stage_lock:
@@ -843,11 +1332,15 @@ class TimedMultiThreadPurchase:
                     # 【修复问题5】注意：如果UI有动画fade、按钮disable变灰、半透明overlay等，
                     # 连续3次失败 ≠ 阶段完成。建议后续加"完成信号detector"（如成功toast、页面标题变化等）
                     if elapsed >= min_execution_time:
-                        # 检测阶段是否消失需要使用完整版 frame
-                        frame = self._get_latest_frame(slim=False)
-                        if frame is not None:
+                        # 检测阶段是否消失只需要检测行（读取快照的检测行缓冲，与检测线程共享同一帧的结果）
+                        snapshot = self.snapshot
+                        # 【优化】过旧的帧不计入阶段消失/存在的判断
+                        # 读取期间槽位被新帧复用时 stage_matches 为 None，本轮不计
+                        stage_matches = (self._get_stage_matches(snapshot)
+                                         if snapshot is not None and self._frame_is_fresh('detect', snapshot) else None)
+                        if stage_matches is not None:
                             # 检测阶段是否还存在（如果检测失败，说明页面已变化，可能已完成）
-                            still_in_stage = self._detect_stage(frame, stage_name)
+                            still_in_stage = bool(stage_matches[self.detection_engine.stage_index[stage_name]])
                             if not still_in_stage:
                                 fail_count += 1
                                 if fail_count >= STAGE_DISAPPEAR_THRESHOLD:
@@ -868,20 +1361,25 @@ class TimedMultiThreadPurchase:
                         print(f"⚠️ 达到最大点击次数限制 ({MAX_CLICKS_PER_STAGE})，停止点击")
                         break
                     
+                    # 【优化】帧龄守卫：截图卡住时暂停点击（页面可能已经变化），等新帧
+                    if not self._frame_is_fresh('action', self.snapshot):
+                        self.clock.sleep(FRAME_STALE_RECHECK)
+                        continue
+                    
                     # 【策略5】小失误模型：偶发重复点击
                     if rhythm.should_make_mistake() and click_count > 0:
                         # 失误：快速再点一次（50-150ms）
                         mistake_delay = random.uniform(0.05, 0.15)
-                        time.sleep(mistake_delay)
-                        self._tap(x, y)
+                        self.clock.sleep(mistake_delay)
+                        self._tap(x, y, stage_name)
                         click_count += 1
                         rhythm.on_click_executed()
                         self.update_stats('stage_actions', 1, stage_name)
                         if DEBUG_MODE:
-                            print(f"  [失误] 重复点击一次")
+                            self.event_log.emit('click_mistake', "  [失误] 重复点击一次", stage=stage_name)
                     
                     # 执行点击
-                    self._tap(x, y)
+                    self._tap(x, y, stage_name)
                     click_count += 1
                     rhythm.on_click_executed()
                     self.update_stats('stage_actions', 1, stage_name)
@@ -889,13 +1387,16 @@ class TimedMultiThreadPurchase:
                     # 【核心改进】使用真人节奏系统获取延迟
                     # 【修复问题1】不再传入 click_count，完全基于内部状态
                     delay = rhythm.get_next_delay()
-                    time.sleep(delay)
+                    self.clock.sleep(delay)
+                
+                # 【优化】最后阶段执行结束：截图降速
+                self.capture_scheduler.enter_backoff()
             else:
                 # 非最后阶段：持续点击，最多STAGE_EXECUTION_TIMEOUT秒，超时后设置推进标志
                 print(f"⏱️  非最后阶段将持续点击，最多 {STAGE_EXECUTION_TIMEOUT} 秒后请求推进")
                 
                 while self.running.is_set():
-                    elapsed = time.perf_counter() - execution_start
+                    elapsed = self.clock.perf_counter() - execution_start
                     
                     # 检查是否已经进入下一阶段
                     with self.stage_lock:
@@ -912,6 +1413,7 @@ class TimedMultiThreadPurchase:
                         with self.stage_lock:
                             if expected_next_stage and self.current_stage == stage_name:
                                 self.force_advance_queue.append((stage_name, expected_next_stage))
+                                self._notify_dispatch()
                         break
                     
                     # 检查是否超时
@@ -922,22 +1424,28 @@ class TimedMultiThreadPurchase:
                             # 再次确认当前阶段
                             if self.current_stage == stage_name and expected_next_stage:
                                 self.force_advance_queue.append((stage_name, expected_next_stage))
+                                self._notify_dispatch()
                         break
                     
+                    # 【优化】帧龄守卫：截图卡住时暂停点击（页面可能已经变化），等新帧
+                    if not self._frame_is_fresh('action', self.snapshot):
+                        self.clock.sleep(FRAME_STALE_RECHECK)
+                        continue
+                    
                     # 【策略5】小失误模型：偶发重复点击
                     if rhythm.should_make_mistake() and click_count > 0:
                         # 失误：快速再点一次（50-150ms）
                         mistake_delay = random.uniform(0.05, 0.15)
-                        time.sleep(mistake_delay)
-                        self._tap(x, y)
+                        self.clock.sleep(mistake_delay)
+                        self._tap(x, y, stage_name)
                         click_count += 1
                         rhythm.on_click_executed()
                         self.update_stats('stage_actions', 1, stage_name)
                         if DEBUG_MODE:
-                            print(f"  [失误] 重复点击一次")
+                            self.event_log.emit('click_mistake', "  [失误] 重复点击一次", stage=stage_name)
                     
                     # 执行点击
-                    self._tap(x, y)
+                    self._tap(x, y, stage_name)
                     click_count += 1
                     rhythm.on_click_executed()
                     self.update_stats('stage_actions', 1, stage_name)
@@ -945,7 +1453,7 @@ class TimedMultiThreadPurchase:
                     # 【核心改进】使用真人节奏系统获取延迟
                     # 【修复问题1】不再传入 click_count，完全基于内部状态
                     delay = rhythm.get_next_delay()
-                    time.sleep(delay)
+                    self.clock.sleep(delay)
             
             # 清理活跃状态
             with self.stage_lock:
@@ -960,6 +1468,496 @@ class TimedMultiThreadPurchase:
         # elif action_type == 'wait':
         #     ...
     
+    def _notify_dispatch(self):
+        """唤醒所有检测线程（发布新帧、阶段变化、推进请求时调用）"""
+        with self.dispatch_cond:
+            self.dispatch_version += 1
+            self.clock.notify_all(self.dispatch_cond)
+    
+    def _wait_for_dispatch(self, seen_version: int, timeout: float) -> int:
+        """
+        【优化】等待新帧或阶段变化（Condition 阻塞，发布后立即唤醒，替代固定 sleep 轮询）
+        
+        Args:
+            seen_version: 调用方已处理过的分发版本
+            timeout: 最长等待时间（秒）
+        
+        Returns:
+            当前分发版本（等于 seen_version 表示超时，没有新事件）
+        """
+        with self.dispatch_cond:
+            if self.dispatch_version == seen_version:
+                self.dispatch_waiters += 1
+                try:
+                    self.clock.wait(self.dispatch_cond, timeout)
+                finally:
+                    self.dispatch_waiters -= 1
+            return self.dispatch_version
+    
+    def _record_dispatch_latency(self, snapshot: FrameSnapshot):
+        """记录帧的检测完成时间（同一帧只记录最先完成的检测线程）"""
+        self.latency_trace.mark(snapshot.frame_id, 'evaluated', self.clock.perf_counter())
+    
+    def _record_transition(self, stage_name: str, frame_id: int, timestamp: float):
+        """记录阶段切换（延迟追踪：检测完成 -> 切换 -> 首次点击）"""
+        if self.detection_engine is not None:
+            self.latency_trace.record_transition(self.detection_engine.stage_index[stage_name], frame_id, timestamp)
+    
+    def get_latency_report(self) -> dict:
+        """
+        各环节延迟统计
+        
+        Returns:
+            {环节: (p50, p90, p99, 最大值, 样本数)}（秒），没有样本的环节不出现
+        """
+        return self.latency_trace.summary()
+    
+    def _publish_frame(
+        self,
+        frame: Optional[np.ndarray],
+        frame_format: str,
+        png_data: Optional[bytes] = None,
+        slim_frame: Optional[dict] = None,
+        capture_seq: Optional[int] = None,
+        capture_start: Optional[float] = None,
+        fingerprint: Optional[int] = None,
+        capture_end: Optional[float] = None,
+        transfer: Optional[Tuple[float, float]] = None
+    ) -> bool:
+        """
+        发布一帧：检测行写入预分配槽位，再以不可变快照一次性替换 self.snapshot（截图后端共用）
+        
+        Args:
+            frame: 完整帧（rows 模式为 None）
+            frame_format: 帧格式（'BGR' / 'RGBA' / 'RGB'）
+            png_data: 原始 PNG 数据（用于调试保存，raw/视频流为 None）
+            slim_frame: 已提取好的瘦身版（rows 模式 / PNG 部分解码），None 时从完整帧提取
+            capture_seq: 流水线截图的请求编号（按请求开始时间递增），旧于已发布帧时丢弃
+            capture_start: 截图请求开始时间（perf_counter），None 表示与发布时间相同
+            fingerprint: 截图数据指纹（用于之后跳过相同的帧）
+            capture_end: 截图解码完成时间，None 表示与发布时间相同
+            transfer: 截图传输的 (首字节, 末字节) 时间（延迟追踪，未知为 None）
+        
+        Returns:
+            是否已发布（尺寸不匹配或已有更新的帧时返回 False）
+        """
+        with self.stats_lock:
+            self.stats['screenshots'] += 1
+        if slim_frame is None:
+            # 验证尺寸（防止尺寸不匹配）
+            if frame.shape[0] != self.screen_height or frame.shape[1] != self.screen_width:
+                print(f"⚠️ 截图尺寸不匹配: 期望 {self.screen_width}x{self.screen_height}, "
+                    f"实际 {frame.shape[1]}x{frame.shape[0]}")
+                self._release_capture_buffer()
+                self._acknowledge_frame()
+                return False
+        
+        slot = self.frame_ring.acquire()
+        published = False
+        try:
+            # 【优化】瘦身：检测行直接复制进槽位的预分配缓冲（不再每帧新建行副本和字典）
+            # 复制而不是引用，避免 raw 模式复用的接收缓冲区被下一帧覆盖
+            if slim_frame is None:
+                slim_frame = slot.fill_rows_from_frame(frame)
+            elif slim_frame is not slot.slim:
+                slim_frame = slot.fill_rows_from_dict(slim_frame)
+            if slim_frame is None:
+                return False
+            published = self._commit_snapshot(frame, slim_frame, slot.rows, frame_format, png_data,
+                                              capture_seq, capture_start, capture_end, fingerprint, transfer,
+                                              ring=self.frame_ring, slot=slot.index, slot_generation=slot.generation)
+        finally:
+            self.frame_ring.release(slot, published)
+            if not published:
+                # 检测行已复制进槽位（或帧被丢弃），raw 接收缓冲区不再需要
+                self._release_capture_buffer()
+                self._acknowledge_frame()
+        return published
+    
+    def _commit_snapshot(
+        self,
+        frame: Optional[np.ndarray],
+        slim_frame: dict,
+        rows: np.ndarray,
+        frame_format: str,
+        png_data: Optional[bytes],
+        capture_seq: Optional[int],
+        capture_start: Optional[float],
+        capture_end: Optional[float],
+        fingerprint: Optional[int],
+        transfer: Optional[Tuple[float, float]] = None,
+        ring=None,
+        slot: int = -1,
+        slot_generation: int = 0
+    ) -> bool:
+        """
+        以不可变快照发布一帧并唤醒检测线程（检测行已在槽位 / 共享内存中）
+        
+        Args:
+            capture_start / capture_end: 截图开始 / 完成时间，None 表示与发布时间相同
+            ring / slot / slot_generation: 检测行所在的环（FrameRing 或 CaptureProcess）、槽位和槽位代数（读者据此钉住槽位）
+            其他参数见 _publish_frame
+        
+        Returns:
+            是否已发布（流水线中已有更新的帧时返回 False）
+        """
+        # 【优化】检测行指纹：每个后端（PNG 整帧指纹、视频流没有指纹）都在这里按检测行判断，
+        # 画面其他位置变化（倒计时、动画）但检测行不变时沿用帧ID，不唤醒检测线程、不重新检测
+        rows_fingerprint = zlib.crc32(np.ascontiguousarray(rows)) if SKIP_UNCHANGED_FRAMES else None
+        with self.frame_lock:
+            # 【优化】流水线截图：更晚发起的请求已先完成，旧帧直接丢弃（保证按时间顺序发布）
+            if capture_seq is not None:
+                if capture_seq <= self.last_published_seq:
+                    with self.stats_lock:
+                        self.stats['frames_dropped'] += 1
+                    return False
+                self.last_published_seq = capture_seq
+            latest = self.snapshot
+            rows_unchanged = (rows_fingerprint is not None and latest is not None
+                              and latest.rows_fingerprint == rows_fingerprint
+                              and latest.frame_format == frame_format)
+            if not rows_unchanged:
+                self.frame_id += 1  # 【修复问题3】更新帧ID
+            frame_id = self.frame_id
+            publish_time = self.clock.perf_counter()
+            capture_start = capture_start if capture_start is not None else publish_time
+            capture_end = capture_end if capture_end is not None else publish_time
+            if not rows_unchanged:
+                # 延迟追踪记录要先于快照可见（检测线程随后在同一行标记检测完成时间）
+                first_byte, last_byte = transfer if transfer is not None else (float('nan'), float('nan'))
+                self.latency_trace.record_frame(frame_id, capture_start, first_byte, last_byte, capture_end,
+                                                publish_time)
+            self.frame_age_guard.record_capture(capture_end - capture_start)
+            # raw 完整帧是接收缓冲区上的视图：缓冲区随快照保留，被下一帧替换时才归还
+            previous_buffer = self._snapshot_capture_buffer
+            self._snapshot_capture_buffer = self._take_capture_buffer() if frame is not None else None
+            # 一次属性赋值完成发布（读者看到的帧 / 行 / 格式 / 帧ID 始终一致）
+            self.snapshot = FrameSnapshot(
+                frame_id=frame_id,
+                frame=frame,
+                slim=slim_frame,
+                rows=rows,
+                frame_format=frame_format,
+                png_data=png_data,
+                capture_start=capture_start,
+                capture_end=capture_end,
+                fingerprint=fingerprint,
+                publish_time=publish_time,
+                ring=ring,
+                slot=slot,
+                slot_generation=slot_generation,
+                rows_fingerprint=rows_fingerprint,
+            )
+        
+        if rows_unchanged:
+            # 检测行未变化：快照换成新数据（槽位、时间戳），帧ID不变，检测结果沿用，不唤醒检测线程
+            with self.dispatch_cond:
+                waiters = self.dispatch_waiters
+            with self.stats_lock:
+                self.stats['rows_unchanged'] += 1
+                self.stats['detections_skipped'] += waiters
+            self._acknowledge_frame()
+        else:
+            with self.stats_lock:
+                self.stats['frames_published'] += 1
+            # 【优化】立即唤醒检测线程（不再等检测线程的下一次轮询）
+            self._notify_dispatch()
+        if previous_buffer is not None:
+            self._release_capture_buffer(previous_buffer)
+        
+        # 录制：检测行仍在本线程持有的槽位中，唤醒检测线程之后再复制
+        if self.recorder is not None:
+            if rows_unchanged:
+                self.recorder.record_frame(frame_id, None, frame_format, capture_start, capture_end, fingerprint)
+            else:
+                self.recorder.record_frame(frame_id, rows, frame_format, capture_start, capture_end,
+                                           fingerprint, frame, png_data)
+        return True
+    
+    def _refresh_unchanged_frame(
+        self,
+        capture_start: float,
+        capture_seq: Optional[int] = None,
+        capture_end: Optional[float] = None
+    ) -> bool:
+        """
+        【优化】截图数据与最新帧相同：只刷新快照的时间戳（帧ID不变，不唤醒检测线程）
+        
+        Args:
+            capture_start: 截图请求开始时间（perf_counter）
+            capture_seq: 流水线截图的请求编号，旧于已发布帧时忽略
+            capture_end: 截图完成时间，None 表示现在
+        
+        Returns:
+            是否已刷新
+        """
+        self._release_capture_buffer()  # 未变化的帧不发布，接收缓冲区直接归还
+        self._acknowledge_frame()  # 不唤醒检测线程，该帧已处理完
+        with self.stats_lock:
+            self.stats['screenshots'] += 1
+        with self.frame_lock:
+            if capture_seq is not None:
+                if capture_seq <= self.last_published_seq:
+                    return False
+                self.last_published_seq = capture_seq
+            if self.snapshot is None:
+                return False
+            self.snapshot = self.snapshot._replace(
+                capture_start=capture_start,
+                capture_end=capture_end if capture_end is not None else self.clock.perf_counter()
+            )
+            snapshot = self.snapshot
+            self.frame_age_guard.record_capture(snapshot.capture_end - snapshot.capture_start)
+        
+        if self.recorder is not None:
+            self.recorder.record_frame(snapshot.frame_id, None, snapshot.frame_format,
+                                       snapshot.capture_start, snapshot.capture_end, snapshot.fingerprint)
+        
+        # 发布新帧会唤醒当时所有等待分发的检测线程：按实际等待的线程数计入省去的唤醒
+        with self.dispatch_cond:
+            waiters = self.dispatch_waiters
+        with self.stats_lock:
+            self.stats['decodes_skipped'] += 1
+            self.stats['detections_skipped'] += waiters
+        return True
+    
+    def _capture_thread_target(self):
+        """按截图后端选择截图线程函数（截图线程退出时结束截图节奏计时）"""
+        if self.capture_backend == 'stream':
+            loop = self.thread_stream_capture_loop
+        elif self.capture_backend == 'process':
+            loop = self.thread_process_capture_loop
+        elif self.pipeline_depth > 1:
+            loop = self.thread_pipelined_capture_loop
+        else:
+            loop = self.thread_screenshot_loop
+        
+        def run():
+            try:
+                loop()
+            finally:
+                self.capture_scheduler.finish()
+        return run
+    
+    def thread_process_capture_loop(self):
+        """
+        【优化】多进程截图：截图 + 解码 + 检测行提取在独立进程中完成，检测行写入共享内存，
+        这里只接收定长帧消息并把共享内存视图发布为快照（不复制像素，不在本进程解码）
+        """
+        source = ProcessCaptureSource(
+            self.auto.device_id,
+            self.auto.capture_mode,
+            self.auto.wire_client is not None
+        )
+        capture = CaptureProcess(source, self.all_needed_rows, self.screen_width)
+        if not capture.start():
+            print("⚠️  截图进程启动失败，回退到逐帧截图")
+            self.thread_screenshot_loop()
+            return
+        
+        print("📸 截图进程已启动，等待帧数据...")
+        last_status_time = self.clock.time()
+        while self.running.is_set():
+            shared = capture.receive(DISPATCH_WAIT_TIMEOUT)
+            if shared is None:
+                if not capture.alive:
+                    print("⚠️  截图进程已退出，回退到逐帧截图")
+                    capture.stop()
+                    self.thread_screenshot_loop()
+                    return
+                continue
+            self.capture_scheduler.record_capture()
+            
+            if shared.unchanged:
+                # 与最新帧相同：只刷新时间戳，不唤醒检测线程
+                self._refresh_unchanged_frame(shared.capture_start, capture_end=shared.capture_end)
+            else:
+                with self.stats_lock:
+                    self.stats['screenshots'] += 1
+                # 共享内存槽位由读者钉住，不再是最新帧且没有读者时才归还给截图进程（反压）
+                self._commit_snapshot(None, shared.slim, shared.rows, shared.frame_format, None, None,
+                                      shared.capture_start, shared.capture_end, shared.fingerprint,
+                                      ring=capture, slot=shared.slot, slot_generation=shared.frame_id)
+            
+            # 每10秒输出一次状态（避免刷屏）
+            current_time = self.clock.time()
+            if current_time - last_status_time >= 10.0:
+                print(f"📸 截图进程运行中... 已接收 {capture.frames_received} 帧, "
+                      f"合并积压消息 {capture.messages_coalesced} 条")
+                last_status_time = current_time
+        
+        capture.stop()
+        print(f"📸 截图进程已停止: 共接收 {capture.frames_received} 帧")
+    
+    def thread_stream_capture_loop(self):
+        """
+        视频流截图线程：screenrecord H.264 长连接持续解码，每解码一帧立即发布
+        优化：无逐帧请求往返，也无 SCREENSHOT_INTERVAL 等待，帧新鲜度约 16-33ms
+        """
+        if not AV_AVAILABLE:
+            print("⚠️  PyAV 未安装，视频流不可用，回退到逐帧截图")
+            self.thread_screenshot_loop()
+            return
+        
+        open_stream = self.stream_source or (lambda: self.auto.open_screenrecord_stream(
+            bit_rate=STREAM_BIT_RATE,
+            size=(self.screen_width, self.screen_height)
+        ))
+        def on_frame(frame, frame_format, capture_time):
+            # 视频流帧率由设备决定，只统计各阶段帧率
+            self.capture_scheduler.record_capture()
+            return self._publish_frame(frame, frame_format, capture_start=capture_time)
+        
+        capture = H264StreamCapture(
+            open_stream,
+            on_frame,
+            reconnect=self.stream_source is None
+        )
+        
+        print("📸 视频流截图线程开始运行...")
+        if not capture.start():
+            self.thread_screenshot_loop()
+            return
+        
+        last_status_time = self.clock.time()
+        while self.running.is_set() and capture.running.is_set():
+            self.clock.sleep(0.1)
+            
+            # 【优化】静止画面没有新帧：解码器已追上数据流时刷新最新帧的时间戳，帧龄守卫不会把它当成卡住
+            as_of = capture.current_as_of()
+            if as_of is not None:
+                self._confirm_stream_frame(as_of)
+            
+            # 每10秒输出一次状态（避免刷屏）
+            current_time = self.clock.time()
+            if current_time - last_status_time >= 10.0:
+                print(f"📸 视频流运行中... 已解码 {capture.frames_decoded} 帧 "
+                      f"({capture.get_fps():.1f} fps, 重连 {capture.reconnects} 次)")
+                last_status_time = current_time
+        
+        capture.stop()
+        print(f"📸 视频流已停止: 共解码 {capture.frames_decoded} 帧, 平均 {capture.get_fps():.1f} fps")
+    
+    def _confirm_stream_frame(self, as_of: float):
+        """
+        视频流：最新帧在 as_of 时仍是当前画面，刷新快照时间戳（帧ID不变，不唤醒检测线程，不计入截图耗时）
+        
+        Args:
+            as_of: 确认时刻（perf_counter，早于快照的截图时间时忽略）
+        """
+        with self.frame_lock:
+            snapshot = self.snapshot
+            if snapshot is None or as_of <= snapshot.capture_start:
+                return
+            self.snapshot = snapshot._replace(capture_start=as_of, capture_end=as_of)
+    
+    def _save_debug_screenshot(self, frame: Optional[np.ndarray], frame_format: str, png_data: Optional[bytes]):
+        """调试：周期性保存一张截图（后台写入，积压时只保留最新一张）"""
+        self._submit_debug_frame(frame, frame_format, png_data, "debug", coalesce_key="periodic")
+    
+    def _reserve_capture_slot(self) -> Tuple[int, float]:
+        """
+        【优化】流水线截图：预约下一个请求的编号和开始时间
+        
+        相邻请求间隔 = 单次截图耗时 / 在途请求数，让 N 个请求均匀错开，
+        设备编码、USB 传输、主机解码三段重叠进行；截图节奏要求的间隔更长时（等待期间）按节奏间隔
+        
+        Returns:
+            (请求编号, 开始时间 perf_counter)
+        """
+        with self.pipeline_lock:
+            self.capture_seq += 1
+            start_time = max(self.clock.perf_counter(), self.next_capture_start)
+            interval = self.capture_latency_ema / self.pipeline_depth
+            if ADAPTIVE_CAPTURE_RATE:
+                interval = max(interval, self.capture_scheduler.next_interval())
+            self.next_capture_start = start_time + interval
+            return self.capture_seq, start_time
+    
+    def _capture_worker(self, worker_index: int):
+        """
+        流水线截图工作线程：预约时间片 -> 截图+解码 -> 按请求编号发布
+        
+        Args:
+            worker_index: 工作线程编号（用于日志）
+        """
+        consecutive_failures = 0
+        max_failures = 5
+        
+        while self.running.is_set():
+            try:
+                capture_seq, start_time = self._reserve_capture_slot()
+                wait = start_time - self.clock.perf_counter()
+                if wait > 0:
+                    self.clock.sleep(wait)
+                
+                frame, frame_format, png_data, slim_frame, fingerprint = self._capture_frame()
+                decoded_time = self.clock.perf_counter()
+                if frame is None and slim_frame is None and fingerprint is None:
+                    consecutive_failures += 1
+                    if consecutive_failures >= max_failures:
+                        print(f"⚠️ [截图线程{worker_index}] 连续 {consecutive_failures} 次截图失败，暂停 0.5 秒")
+                        self.clock.sleep(0.5)
+                        consecutive_failures = 0
+                    else:
+                        self.clock.sleep(0.05)
+                    continue
+                consecutive_failures = 0
+                self.capture_scheduler.record_capture()
+                
+                # 更新单次截图耗时（决定请求错开间隔）
+                latency = decoded_time - start_time
+                with self.pipeline_lock:
+                    self.capture_latency_ema = self.capture_latency_ema * 0.8 + latency * 0.2
+                
+                if frame is None and slim_frame is None:
+                    # 【优化】与最新帧相同：不解码、不发布
+                    self._refresh_unchanged_frame(start_time, capture_seq)
+                    continue
+                
+                # 调试保存要在发布之前：发布后 raw 帧所在的接收缓冲区随时可能被其他截图线程的新帧换下归还、复用
+                if DEBUG_SAVE_SCREENSHOTS and capture_seq % 50 == 0:
+                    self._save_debug_screenshot(frame, frame_format, png_data)
+                self._publish_frame(frame, frame_format, png_data, slim_frame, capture_seq=capture_seq,
+                                    capture_start=start_time, fingerprint=fingerprint,
+                                    capture_end=decoded_time, transfer=self.auto.get_transfer_times())
+            
+            except Exception as e:
+                print(f"❌ 截图线程{worker_index}错误: {e}")
+                self.clock.sleep(0.05)
+    
+    def thread_pipelined_capture_loop(self):
+        """
+        【优化】流水线截图线程：pipeline_depth 个截图请求同时在途（各自独立的 adb 连接），
+        设备编码、传输、主机解码重叠进行；帧按请求开始时间顺序发布，更新的帧先完成时丢弃旧帧
+        """
+        print(f"📸 流水线截图开始运行（{self.pipeline_depth} 个请求同时在途）...")
+        self.auto.set_capture_concurrency(self.pipeline_depth)
+        
+        workers = []
+        for i in range(self.pipeline_depth):
+            worker = self.clock.thread(target=self._capture_worker, args=(i,), daemon=True)
+            worker.start()
+            workers.append(worker)
+        
+        start_time = self.clock.perf_counter()
+        last_status_time = self.clock.time()
+        while self.running.is_set():
+            self.clock.sleep(0.1)
+            
+            # 每10秒输出一次状态（避免刷屏）
+            current_time = self.clock.time()
+            if current_time - last_status_time >= 10.0:
+                stats = self.get_stats()
+                elapsed = self.clock.perf_counter() - start_time
+                print(f"📸 流水线截图运行中... 已截图 {stats['screenshots']} 帧 "
+                      f"({stats['screenshots'] / elapsed:.1f} fps), 发布新帧 {stats['frames_published']} 帧, 丢弃旧帧 {stats['frames_dropped']} 帧, "
+                      f"单次耗时 {self.capture_latency_ema * 1000:.0f}ms")
+                last_status_time = current_time
+        
+        for worker in workers:
+            self.clock.join(worker, timeout=1.0)
+    
     def thread_screenshot_loop(self):
         """
         截图线程：持续获取截图并转换为内存中的 numpy array
@@ -968,97 +1966,63 @@ class TimedMultiThreadPurchase:
         consecutive_failures = 0
         max_failures = 5
         screenshot_count = 0
-        last_status_time = time.time()
+        last_status_time = self.clock.time()
         
         print("📸 截图线程开始运行...")
         
         while self.running.is_set():
             try:
-                # 获取原始 PNG 数据（直接从 ADB 获取，不经过文件）
-                png_data = self.auto.get_screenshot_data()
-                if not png_data:
+                # 获取一帧（raw 模式直接得到像素视图，PNG 模式解码为 BGR/RGBA）
+                capture_start = self.clock.perf_counter()
+                frame, frame_format, png_data, slim_frame, fingerprint = self._capture_frame()
+                decoded_time = self.clock.perf_counter()
+                if frame is None and slim_frame is None and fingerprint is None:
                     consecutive_failures += 1
                     if consecutive_failures >= max_failures:
                         print(f"⚠️ 连续 {consecutive_failures} 次截图失败，暂停 0.5 秒")
-                        time.sleep(0.5)
+                        self.clock.sleep(0.5)
                         consecutive_failures = 0
                     else:
-                        time.sleep(0.05)
+                        self.clock.sleep(0.05)
                     continue
                 
                 # 重置失败计数
                 consecutive_failures = 0
+                self.capture_scheduler.record_capture()
                 
-                # 转换为 numpy array（BGR 或 RGBA 格式）
-                frame, frame_format = self._png_bytes_to_numpy(png_data)
-                if frame is None:
-                    print("⚠️ PNG 解码失败")
-                    time.sleep(0.05)
+                if frame is None and slim_frame is None:
+                    # 【优化】与最新帧相同：不解码、不发布，只刷新时间戳
+                    self._refresh_unchanged_frame(capture_start)
+                    self.clock.sleep(self.capture_scheduler.next_interval())
                     continue
                 
-                # 验证尺寸（防止尺寸不匹配）
-                if frame.shape[0] != self.screen_height or frame.shape[1] != self.screen_width:
-                    print(f"⚠️ 截图尺寸不匹配: 期望 {self.screen_width}x{self.screen_height}, "
-                        f"实际 {frame.shape[1]}x{frame.shape[0]}")
-                    time.sleep(0.05)
+                # 发布帧（尺寸不匹配时丢弃）
+                if not self._publish_frame(frame, frame_format, png_data, slim_frame,
+                                           capture_start=capture_start, fingerprint=fingerprint,
+                                           capture_end=decoded_time, transfer=self.auto.get_transfer_times()):
+                    self.clock.sleep(0.05)
                     continue
-                
-                # 【优化】瘦身：只保留 detector 需要的行（大幅减少内存和 cache miss）
-                # 收集所有需要的行
-                all_needed_rows = set()
-                for rows in self.detector_rows_cache.values():
-                    all_needed_rows.update(rows)
-                
-                # 创建瘦身版 frame：只包含需要的行 {y: row_data}
-                # 【修复问题3】改为 copy，避免内存复用导致的竞态（虽然概率极低，但稳妥）
-                # 只 copy 几行，成本极低（<0.5ms），换稳定性
-                slim_frame = {}
-                if all_needed_rows:
-                    for y in all_needed_rows:
-                        if y < frame.shape[0]:
-                            slim_frame[y] = frame[y].copy()  # copy 行数据，避免内存复用竞态
-                
-                # 更新最新帧和PNG数据（线程安全）
-                with self.frame_lock:
-                    self.latest_frame = frame  # 完整版（用于调试）
-                    self.latest_slim_frame = slim_frame if slim_frame else None  # 瘦身版（用于检测）
-                    self.latest_png_data = png_data  # 保存PNG数据用于调试
-                    self.frame_format = frame_format  # 【优化1】保存帧格式（BGR或RGBA）
-                    self.frame_id += 1  # 【修复问题3】更新帧ID
-                
-                # 更新统计
                 screenshot_count += 1
-                with self.stats_lock:
-                    self.stats['screenshots'] += 1
                 
                 # 【修复问题⑤】调试：保存截图（每50张保存一次，降低IO抢占）
                 if DEBUG_SAVE_SCREENSHOTS and screenshot_count % 50 == 0:
-                    try:
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
-                        filename = os.path.join(self.debug_screenshot_dir, f"debug_{timestamp}.png")
-                        with open(filename, 'wb') as f:
-                            f.write(png_data)
-                        if DEBUG_MODE:
-                            print(f"💾 已保存调试截图: {filename}")
-                    except Exception as e:
-                        if DEBUG_MODE:
-                            print(f"⚠️ 保存调试截图失败: {e}")
+                    self._save_debug_screenshot(frame, frame_format, png_data)
                 
                 # 每10秒输出一次状态（避免刷屏）
-                current_time = time.time()
+                current_time = self.clock.time()
                 if current_time - last_status_time >= 10.0:
                     print(f"📸 截图线程运行中... 已获取 {screenshot_count} 张截图")
                     last_status_time = current_time
                 
-                # 按配置的间隔等待
-                time.sleep(SCREENSHOT_INTERVAL)
+                # 【优化】按截图节奏等待（等待期间慢速，目标时间前后不等待）
+                self.clock.sleep(self.capture_scheduler.next_interval())
 
             except Exception as e:
                 print(f"❌ 截图线程错误: {e}")
                 import traceback
                 traceback.print_exc()
                 consecutive_failures += 1
-                time.sleep(0.05)
+                self.clock.sleep(0.05)
 
     def thread_detect_stage(self, stage_name: str):
         """
@@ -1076,11 +2040,24 @@ class TimedMultiThreadPurchase:
         # 【修复问题2+问题⑥】最小驻留时间（秒）
         MIN_STAGE_DURATION = 0.25  # 250ms，保险起见，避免某些App UI更新慢导致的误判
         
-        # 【修复问题3】记录上次检测的帧ID，避免空转
-        last_frame_id = -1
+        # 【优化】事件驱动：阻塞等待新帧/阶段变化，没有变化时不检测、不占锁
+        seen_version = -1
+        wait_timeout = DISPATCH_WAIT_TIMEOUT
+        handled_snapshot = None  # 上一轮检测过的帧：处理完（含阶段切换）才确认，回放尽快模式据此前进
         
         while self.running.is_set():
             try:
+                if handled_snapshot is not None:
+                    self._acknowledge_frame(handled_snapshot)
+                    handled_snapshot = None
+                version = self._wait_for_dispatch(seen_version, wait_timeout)
+                timed_wait = wait_timeout < DISPATCH_WAIT_TIMEOUT
+                wait_timeout = DISPATCH_WAIT_TIMEOUT
+                if version == seen_version and not timed_wait:
+                    # 超时且没有新事件，只是为了检查停止标志
+                    continue
+                seen_version = version
+                
                 # 【修复问题1和问题7】阶段门禁：只允许检测当前阶段或下一个阶段
                 with self.stage_lock:
                     current = self.current_stage
@@ -1088,11 +2065,10 @@ class TimedMultiThreadPurchase:
                     # 【修复问题2】如果当前阶段存在，检查最小驻留时间
                     if current is not None:
                         enter_time = self.stage_enter_time.get(current, 0)
-                        elapsed = time.perf_counter() - enter_time
+                        elapsed = self.clock.perf_counter() - enter_time
                         if elapsed < MIN_STAGE_DURATION:
-                            # 当前阶段驻留时间不足，不允许切换到下一阶段
-                            # 【优化4】自适应sleep：等待到下次截图周期的70%
-                            time.sleep(SCREENSHOT_INTERVAL * 0.7)
+                            # 当前阶段驻留时间不足，驻留期满后用同一帧重新检测（静止画面不会再有新帧唤醒）
+                            wait_timeout = MIN_STAGE_DURATION - elapsed
                             continue
                     
                     # 如果当前阶段为空，只允许检测第一个阶段（stage1）
@@ -1100,63 +2076,41 @@ class TimedMultiThreadPurchase:
                         # 找到第一个阶段（按STAGE_CONFIGS的顺序）
                         first_stage = list(STAGE_CONFIGS.keys())[0]
                         if stage_name != first_stage:
-                            # 【优化4】自适应sleep
-                            time.sleep(SCREENSHOT_INTERVAL * 0.7)
                             continue
                     else:
                         # 只允许检测：当前阶段 或 当前阶段的下一阶段
+                        # 不在允许范围内时跳过，阶段变化时会被重新唤醒
                         expected_next = STAGE_CONFIGS.get(current, {}).get('next_stage')
                         allowed_stages = {current, expected_next}
                         if stage_name not in allowed_stages:
-                            # 不在允许范围内，跳过检测
-                            # 【优化4】自适应sleep
-                            time.sleep(SCREENSHOT_INTERVAL * 0.7)
                             continue
                     
                     # 如果当前已经是这个阶段，跳过检测（避免重复）
                     if current == stage_name:
-                        # 【优化4】自适应sleep
-                        time.sleep(SCREENSHOT_INTERVAL * 0.7)
                         continue
                 
-                # 【优化】获取最新截图帧（使用瘦身版）和帧ID（避免空转）
-                with self.frame_lock:
-                    frame = self.latest_slim_frame  # 使用瘦身版（只包含需要的行）
-                    current_frame_id = self.frame_id
-                
-                if frame is None:
-                    # 截图还未就绪，等待
-                    # 【优化4】自适应sleep：等待到下次截图周期的70%
-                    time.sleep(SCREENSHOT_INTERVAL * 0.7)
+                # 【优化】无锁读取最新帧快照（帧、检测行、格式、帧ID 一致）
+                snapshot = self.snapshot
+                if snapshot is None:
+                    # 截图还未就绪，等待第一帧发布
                     continue
                 
-                # 【优化4】自适应检测间隔：如果帧ID没变，sleep更长时间；如果变了，立即检测
-                if current_frame_id == last_frame_id:
-                    # 帧未更新，sleep到下次截图周期的70%，减少CPU空转和锁竞争
-                    time.sleep(SCREENSHOT_INTERVAL * 0.7)
+                # 【优化】帧龄守卫：截图卡住时不用旧帧切换阶段，稍后重新检查
+                # （未变化的帧只刷新时间戳、不唤醒检测线程，所以这里定时重查而不是等新帧）
+                if not self._frame_is_fresh('detect', snapshot):
+                    wait_timeout = FRAME_STALE_RECHECK
                     continue
                 
-                # 帧已更新，立即检测（不sleep）
-                last_frame_id = current_frame_id
-                
-                # 【优化】检测阶段（使用瘦身版 frame，减少内存访问）
-                detected = self._detect_stage(frame, stage_name)
-                
-                # 调试：如果检测到阶段，保存截图
-                if detected and DEBUG_SAVE_SCREENSHOTS:
-                    try:
-                        with self.frame_lock:
-                            png_data = self.latest_png_data
-                        if png_data:
-                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
-                            filename = os.path.join(self.debug_screenshot_dir, f"detected_{stage_name}_{timestamp}.png")
-                            with open(filename, 'wb') as f:
-                                f.write(png_data)
-                            if DEBUG_MODE:
-                                print(f"💾 检测到阶段，已保存截图: {filename}")
-                    except Exception as e:
-                        if DEBUG_MODE:
-                            print(f"⚠️ 保存检测截图失败: {e}")
+                # 【优化】向量化检测：所有阶段一次计算，同一帧的结果各检测线程共享
+                stage_matches = self._get_stage_matches(snapshot, acknowledge=False)
+                if stage_matches is None:
+                    # 读取期间槽位已被新帧复用：已有更新的帧，下一轮直接检测最新快照
+                    continue
+                handled_snapshot = snapshot
+                detected = bool(stage_matches[self.detection_engine.stage_index[stage_name]])
+                if not timed_wait:
+                    # 驻留期满后的重新检测不计入（延迟来自门禁而非分发）
+                    self._record_dispatch_latency(snapshot)
                 
                 # 【修复问题4】检查是否有action线程请求推进阶段（队列语义，避免覆盖）
                 force_advance_event = None
@@ -1178,7 +2132,9 @@ class TimedMultiThreadPurchase:
                             src_config = STAGE_CONFIGS.get(force_advance_event[0], {})
                             print(f"🔄 响应推进请求: {src_config.get('name', force_advance_event[0])} -> {config['name']} ({stage_name})")
                             self.current_stage = stage_name
-                            self.stage_enter_time[stage_name] = time.perf_counter()
+                            self.stage_enter_time[stage_name] = self.clock.perf_counter()
+                            self._record_transition(stage_name, snapshot.frame_id, self.stage_enter_time[stage_name])
+                            self._notify_dispatch()  # 阶段变化：唤醒下一阶段的检测线程
                             
                             # 更新统计
                             self.update_stats('stage_detections', 1, stage_name)
@@ -1186,7 +2142,7 @@ class TimedMultiThreadPurchase:
                             # 【修复问题1+问题①】统一使用 stage_executed 作为唯一判断，消除竞态窗口
                             if stage_name not in self.stage_executed:
                                 self.stage_executed.add(stage_name)
-                                action_thread = threading.Thread(
+                                action_thread = self.clock.thread(
                                     target=self._execute_stage_action,
                                     args=(stage_name,),
                                     daemon=True
@@ -1203,7 +2159,7 @@ class TimedMultiThreadPurchase:
                         # 再次检查最小驻留时间
                         if current is not None:
                             enter_time = self.stage_enter_time.get(current, 0)
-                            elapsed = time.perf_counter() - enter_time
+                            elapsed = self.clock.perf_counter() - enter_time
                             if elapsed < MIN_STAGE_DURATION:
                                 continue
                         
@@ -1222,7 +2178,9 @@ class TimedMultiThreadPurchase:
                             
                             # 【修复问题1】只有detect线程能修改current_stage（单一真相源）
                             self.current_stage = stage_name
-                            self.stage_enter_time[stage_name] = time.perf_counter()
+                            self.stage_enter_time[stage_name] = self.clock.perf_counter()
+                            self._record_transition(stage_name, snapshot.frame_id, self.stage_enter_time[stage_name])
+                            self._notify_dispatch()  # 阶段变化：唤醒下一阶段的检测线程
                             
                             # 更新统计
                             self.update_stats('stage_detections', 1, stage_name)
@@ -1230,7 +2188,7 @@ class TimedMultiThreadPurchase:
                             # 【修复问题1+问题①】统一使用 stage_executed 作为唯一判断，消除竞态窗口
                             if stage_name not in self.stage_executed:
                                 self.stage_executed.add(stage_name)
-                                action_thread = threading.Thread(
+                                action_thread = self.clock.thread(
                                     target=self._execute_stage_action,
                                     args=(stage_name,),
                                     daemon=True
@@ -1238,26 +2196,132 @@ class TimedMultiThreadPurchase:
                                 action_thread.start()
                                 self.stage_action_active[stage_name] = True
                 
-                # 【优化4】自适应sleep：如果帧未更新，sleep更长时间；如果已更新，立即检测
-                # 这里在循环末尾，如果帧已更新则立即继续（不sleep），否则sleep
-                # 注意：帧ID检查在上面已经处理，这里只是兜底
-                time.sleep(SCREENSHOT_INTERVAL * 0.7)
+                # 调试：如果检测到阶段，保存截图（在阶段切换、唤醒之后才提交，不推迟切换和点击；磁盘 I/O 在后台线程）
+                if detected and DEBUG_SAVE_SCREENSHOTS:
+                    self._submit_debug_frame(snapshot.frame, snapshot.frame_format, snapshot.png_data,
+                                             f"detected_{stage_name}", coalesce_key=f"detected_{stage_name}")
                 
             except Exception as e:
                 print(f"❌ 阶段检测线程错误 ({stage_name}): {e}")
-                time.sleep(0.1)
+                self.clock.sleep(0.1)
+    
+    def print_latency_report(self):
+        """输出各环节延迟（p50 / p90 / p99 / 最大值）"""
+        self.latency_trace.print_summary()
+    
+    def run_latency_benchmark(self, seconds: float, gil_load: bool = False) -> dict:
+        """
+        延迟基准：只运行截图线程 + 一个检测线程（不执行任何点击），用于对比截图后端
+        
+        Args:
+            seconds: 运行时间（秒）
+            gil_load: 是否额外运行一个纯 Python 负载线程（模拟状态输出/调试保存对 GIL 的占用）
+        
+        Returns:
+            get_latency_report() 的结果
+        """
+        def detect_loop():
+            seen_version = -1
+            while self.running.is_set():
+                version = self._wait_for_dispatch(seen_version, DISPATCH_WAIT_TIMEOUT)
+                if version == seen_version:
+                    continue
+                seen_version = version
+                snapshot = self.snapshot
+                if snapshot is not None and self._get_stage_matches(snapshot) is not None:
+                    self._record_dispatch_latency(snapshot)
+        
+        def load_loop():
+            while self.running.is_set():
+                sum(i * i for i in range(20000))
+        
+        threads = [self.clock.thread(target=self._capture_thread_target(), daemon=True),
+                   self.clock.thread(target=detect_loop, daemon=True)]
+        if gil_load:
+            threads.append(threading.Thread(target=load_loop, daemon=True))
+        for thread in threads:
+            thread.start()
+        self.clock.sleep(seconds)
+        self.running.clear()
+        self._notify_dispatch()
+        for thread in threads:
+            self.clock.join(thread, timeout=3.0)
+        
+        self.print_latency_report()
+        return self.get_latency_report()
     
     # ---------- 阶段化执行 ----------
+    def _sync_device_clock(self, budget: Optional[float] = None) -> bool:
+        """
+        估计/更新设备时钟偏差（按设备时钟定时时使用），返回是否有可用的估计
+        
+        Args:
+            budget: 时间预算（秒），None 表示不限
+        """
+        if not SCHEDULE_ON_DEVICE_CLOCK or not hasattr(self.auto, 'estimate_clock_offset'):
+            return False
+        if budget is not None and budget <= 0:
+            # 没有时间采样：不是设备时间读不到，而是来不及估计
+            if self.device_clock is not None and self.device_clock.latest is not None:
+                return True
+            print("⚠️  距进入时间太近，来不及估计设备时钟偏差（已跳过），按主机时间定时")
+            self.device_clock = None
+            return False
+        if self.device_clock is None:
+            self.device_clock = DeviceClockSync(self.auto)
+        if self.device_clock.sync(budget=budget) is None and self.device_clock.latest is None:
+            if budget is not None:
+                print(f"⚠️  {budget:.2f}秒内没有读到设备时间，按主机时间定时")
+            else:
+                print("⚠️  无法读取设备时间，按主机时间定时")
+            self.device_clock = None
+            return False
+        return True
+    
+    def _resync_device_clock(self, enter_time: datetime, budget: float) -> Optional[float]:
+        """
+        等待期间重新估计设备时钟偏差（限时，不占用精确等待的时间）
+        
+        Args:
+            enter_time: 进入时间（设备时间）
+            budget: 可用时间（秒，到交给精确等待为止）；不够一次完整估计的预计耗时时跳过
+        
+        Returns:
+            修正后的截止时间，跳过或失败返回 None
+        """
+        if budget < self.device_clock.expected_duration():
+            return None
+        if self.device_clock.sync(budget=budget) is None:
+            return None
+        deadline = self._entry_deadline(enter_time)
+        self.capture_scheduler.set_target(deadline + PAGE_LOAD_TIME)
+        return deadline
+    
+    def _entry_deadline(self, enter_time: datetime) -> float:
+        """进入时间对应的单调时钟截止时间（按设备时钟定时时先换算到主机时间）"""
+        if self.device_clock is not None:
+            host_time, _ = self.device_clock.host_time_for(enter_time.timestamp())
+        else:
+            host_time = enter_time.timestamp()
+        return self.clock.perf_counter() + host_time - self.clock.time()
+    
     def wait_until_time(self, target_time: datetime):
         """
         等待到指定时间（提前PAGE_LOAD_TIME进入）
         
         Args:
-            target_time: 目标时间（datetime对象）
+            target_time: 目标时间（datetime对象；SCHEDULE_ON_DEVICE_CLOCK 时为手机时间）
         """
-        now = datetime.now()
+        now = self.clock.now()
+        # 首次估计同样不拖进精确等待（按主机时间估算剩余时间，偏差一般远小于 PRECISE_WAIT_HANDOFF；不够时跳过）
+        sync_budget = (target_time - now).total_seconds() - PAGE_LOAD_TIME - PRECISE_WAIT_HANDOFF
+        if self._sync_device_clock(sync_budget):
+            self.device_clock.print_report()
+            device_now, _ = self.device_clock.device_now()
+            now = datetime.fromtimestamp(device_now)
         if target_time <= now:
             print(f"⚠️ 目标时间已过，立即开始")
+            self.capture_scheduler.set_target(self.clock.perf_counter())
             return
         
         # 提前PAGE_LOAD_TIME进入
@@ -1265,39 +2329,71 @@ class TimedMultiThreadPurchase:
         wait_seconds = (enter_time - now).total_seconds()
         
         if wait_seconds > 0:
+            clock_name = "设备时间" if self.device_clock is not None else "当前时间"
             print(f"⏰ 等待到 {target_time.strftime('%H:%M:%S')}（提前{PAGE_LOAD_TIME*1000:.0f}ms进入）")
-            print(f"   当前时间: {now.strftime('%H:%M:%S.%f')[:-3]}")
+            print(f"   {clock_name}: {now.strftime('%H:%M:%S.%f')[:-3]}")
             print(f"   进入时间: {enter_time.strftime('%H:%M:%S.%f')[:-3]}")
             print(f"   等待时长: {wait_seconds:.1f}秒")
             
+            # 【优化】单调时钟截止时间：之后每轮都按它重新计算剩余时间，睡眠唤醒抖动不会累积
+            deadline = self._entry_deadline(enter_time)
+            self.capture_scheduler.set_target(deadline + PAGE_LOAD_TIME)
+            
             # 如果等待时间较长，定期输出状态
-            if wait_seconds > 10:
+            long_wait = wait_seconds > 10
+            if long_wait:
                 print("💡 等待期间，截图和检测线程在后台运行...")
-                last_status_time = time.time()
-                status_interval = 10.0  # 每10秒输出一次
+            last_status_time = self.clock.perf_counter()
+            last_sync_time = last_status_time
+            final_synced = self.device_clock is None
+            status_interval = 10.0  # 每10秒输出一次
+            
+            while True:
+                remaining = deadline - self.clock.perf_counter()
+                # 【优化】交给精确等待前再估计一次设备时钟偏差：在 PRECISE_WAIT_HANDOFF 之前留出一次估计的时间预算，
+                # 估计（多次 adb 往返）不会拖进精确等待；来不及或距上次估计不到 PRECISE_WAIT_HANDOFF 时跳过
+                final_sync_lead = 0.0 if final_synced else self.device_clock.sync_budget()
+                if not final_synced and remaining <= PRECISE_WAIT_HANDOFF + final_sync_lead:
+                    final_synced = True
+                    if self.clock.perf_counter() - last_sync_time > PRECISE_WAIT_HANDOFF:
+                        synced_deadline = self._resync_device_clock(enter_time, remaining - PRECISE_WAIT_HANDOFF)
+                        if synced_deadline is not None:
+                            deadline = synced_deadline
+                    continue
+                if remaining <= PRECISE_WAIT_HANDOFF:
+                    break
+                self.clock.sleep(min(1.0, remaining - PRECISE_WAIT_HANDOFF - final_sync_lead))  # 每次最多睡1秒
                 
-                while wait_seconds > 0:
-                    sleep_time = min(1.0, wait_seconds)  # 每次最多睡1秒
-                    time.sleep(sleep_time)
-                    wait_seconds -= sleep_time
-                    
-                    # 定期输出状态
-                    current_time = time.time()
-                    if current_time - last_status_time >= status_interval:
-                        remaining = wait_seconds
-                        frame = self._get_latest_frame()
-                        frame_status = "✅" if frame is not None else "⏳"
-                        with self.stats_lock:
-                            screenshot_count = self.stats['screenshots']
-                        print(f"   ⏳ 剩余等待: {remaining:.1f}秒 | 截图状态: {frame_status} | 已截图: {screenshot_count} 张")
-                        last_status_time = current_time
-            else:
-                # 等待时间短，直接等待
-                time.sleep(wait_seconds)
+                current_time = self.clock.perf_counter()
+                # 【优化】定期重新估计设备时钟偏差（跟踪漂移），截止时间随之修正；同样限时，不拖进精确等待
+                if not final_synced and current_time - last_sync_time >= DEVICE_CLOCK_RESYNC_INTERVAL:
+                    synced_deadline = self._resync_device_clock(
+                        enter_time, deadline - current_time - PRECISE_WAIT_HANDOFF)
+                    if synced_deadline is not None:
+                        deadline = synced_deadline
+                    last_sync_time = self.clock.perf_counter()
+                
+                # 定期输出状态
+                if long_wait and current_time - last_status_time >= status_interval:
+                    frame = self._get_latest_frame()
+                    frame_status = "✅" if frame is not None else "⏳"
+                    with self.stats_lock:
+                        screenshot_count = self.stats['screenshots']
+                    print(f"   ⏳ 剩余等待: {deadline - current_time:.1f}秒 | 截图状态: {frame_status} | 已截图: {screenshot_count} 张")
+                    last_status_time = current_time
             
-            print(f"✅ 已到达进入时间: {datetime.now().strftime('%H:%M:%S.%f')[:-3]}")
+            # 【优化】最后一段精确等待：短睡眠 + 最后约 1ms 自旋（收尾阶段缩短 GIL 切换间隔，截图/检测线程照常运行）
+            self.entry_error = self.clock.sleep_until(deadline)
+            if self.device_clock is not None:
+                device_now, bound = self.device_clock.device_now()
+                print(f"✅ 已到达进入时间（设备时间）: {datetime.fromtimestamp(device_now).strftime('%H:%M:%S.%f')[:-3]} "
+                      f"(等待误差 {self.entry_error * 1e6:+.0f}µs, 时钟偏差误差界 ±{bound * 1000:.2f}ms)")
+            else:
+                print(f"✅ 已到达进入时间: {self.clock.now().strftime('%H:%M:%S.%f')[:-3]} "
+                      f"(误差 {self.entry_error * 1e6:+.0f}µs)")
         else:
             print(f"⚠️ 进入时间已过，立即开始")
+            self.capture_scheduler.set_target(self.clock.perf_counter() + PAGE_LOAD_TIME)
     
     def run_timed_purchase(self, target_time: datetime, initial_stage: str = None):
         """
@@ -1334,20 +2430,27 @@ class TimedMultiThreadPurchase:
                 print(f"    下一阶段: 无（最后阶段）")
         print("=" * 60)
         
-        overall_start_time = time.perf_counter()
+        overall_start_time = self.clock.perf_counter()
+        # 截图节奏先按主机时间估计目标时间（wait_until_time 按设备时钟修正）
+        self.capture_scheduler.set_target(
+            overall_start_time + (target_time - self.clock.now()).total_seconds()
+        )
         
-        # 启动截图线程
-        screenshot_thread = threading.Thread(target=self.thread_screenshot_loop, daemon=True)
+        # 启动截图线程（逐帧截图、视频流或截图进程）
+        screenshot_thread = self.clock.thread(target=self._capture_thread_target(), daemon=True)
         screenshot_thread.start()
-        print("\n✅ 截图线程已启动")
+        print(f"\n✅ 截图线程已启动 (后端: {self.capture_backend})")
         
         # 等待截图就绪，并验证
         print("⏳ 等待截图就绪...")
         for i in range(10):  # 最多等待2秒
-            time.sleep(0.2)
+            self.clock.sleep(0.2)
             frame = self._get_latest_frame(slim=False)
-            if frame is not None and not isinstance(frame, dict):
-                print(f"✅ 截图已就绪 (尺寸: {frame.shape[1]}x{frame.shape[0]})")
+            if frame is not None:
+                if isinstance(frame, dict):
+                    print(f"✅ 截图已就绪 (瘦身版: {len(frame)} 行)")
+                else:
+                    print(f"✅ 截图已就绪 (尺寸: {frame.shape[1]}x{frame.shape[0]})")
                 # 【修复问题5】调试：只在启动时检查一次检测点颜色（性能优化）
                 if DEBUG_MODE and DEBUG_CHECK_ONCE:
                     print("\n🔍 执行初始检测点检查...")
@@ -1370,13 +2473,13 @@ class TimedMultiThreadPurchase:
             with self.stage_lock:
                 self.current_stage = initial_stage
                 # 【修复问题2】设置初始阶段的进入时间
-                self.stage_enter_time[initial_stage] = time.perf_counter()
+                self.stage_enter_time[initial_stage] = self.clock.perf_counter()
             print(f"📌 初始阶段: {initial_stage}")
         
         # 启动所有阶段的检测线程
         detection_threads = []
         for stage_name in STAGE_CONFIGS.keys():
-            thread = threading.Thread(
+            thread = self.clock.thread(
                 target=self.thread_detect_stage,
                 args=(stage_name,),
                 daemon=True
@@ -1386,6 +2489,12 @@ class TimedMultiThreadPurchase:
         
         print(f"✅ 已启动 {len(detection_threads)} 个阶段检测线程")
         
+        # 【优化】帧龄看门狗
+        watchdog_thread = None
+        if FRAME_AGE_GUARD:
+            watchdog_thread = self.clock.thread(target=self.thread_frame_watchdog, daemon=True)
+            watchdog_thread.start()
+        
         # 等待到指定时间
         self.wait_until_time(target_time)
         
@@ -1396,19 +2505,18 @@ class TimedMultiThreadPurchase:
         try:
             # 持续运行，直到所有阶段完成或手动停止
             # 可以通过检查 current_stage 来判断是否完成
-            last_status_time = time.time()
+            last_status_time = self.clock.time()
             status_interval = 5.0  # 每5秒输出一次状态
             
             while self.running.is_set():
-                time.sleep(0.1)
+                self.clock.sleep(0.1)
                 
                 # 定期输出状态
-                current_time = time.time()
+                current_time = self.clock.time()
                 if current_time - last_status_time >= status_interval:
                     with self.stage_lock:
                         current = self.current_stage
-                    with self.stats_lock:
-                        stats = self.get_stats()
+                    stats = self.get_stats()  # get_stats 自己加锁（stats_lock 不可重入）
                     
                     frame = self._get_latest_frame()
                     frame_status = "✅" if frame is not None else "❌"
@@ -1419,39 +2527,72 @@ class TimedMultiThreadPurchase:
                           f"检测次数={sum(stats['stage_detections'].values())}")
                     last_status_time = current_time
                 
-                # 检查是否完成所有阶段
+                # 检查是否完成所有阶段（等待在锁外进行，不阻塞检测/动作线程读取阶段）
                 with self.stage_lock:
                     current = self.current_stage
-                    if current:
-                        config = STAGE_CONFIGS.get(current)
-                        if config and not config.get('next_stage'):
-                            # 最后一个阶段，等待执行完成（2-5秒）
-                            print(f"\n⏳ 已到达最后阶段，等待执行完成...")
-                            time.sleep(LAST_STAGE_EXECUTION_DURATION_MAX + 1.0)
-                            print(f"✅ 已完成所有阶段，当前在: {config['name']}")
-                            time.sleep(1.0)  # 等待最后操作完成
-                            break
+                config = STAGE_CONFIGS.get(current) if current else None
+                if config and not config.get('next_stage'):
+                    # 最后一个阶段，等待执行完成（2-5秒）
+                    print(f"\n⏳ 已到达最后阶段，等待执行完成...")
+                    self.clock.sleep(LAST_STAGE_EXECUTION_DURATION_MAX + 1.0)
+                    print(f"✅ 已完成所有阶段，当前在: {config['name']}")
+                    self.clock.sleep(1.0)  # 等待最后操作完成
+                    break
         
         except KeyboardInterrupt:
             print("\n\n⚠️ 用户中断，正在停止...")
             self.running.clear()
         
-        # 停止运行
+        # 停止运行（唤醒等待中的检测线程，使其立即退出）
         self.running.clear()
+        self._notify_dispatch()
         
         # 等待线程结束
-        screenshot_thread.join(timeout=1.0)
+        self.clock.join(screenshot_thread, timeout=1.0)
         for thread in detection_threads:
-            thread.join(timeout=1.0)
+            self.clock.join(thread, timeout=1.0)
+        if watchdog_thread is not None:
+            self.clock.join(watchdog_thread, timeout=1.0)
         
-        total_time = time.perf_counter() - overall_start_time
+        total_time = self.clock.perf_counter() - overall_start_time
         stats = self.get_stats()
         
         print("\n" + "=" * 60)
         print("📊 最终统计")
         print("=" * 60)
         print(f"⏱️  总运行时间: {total_time:.2f} 秒")
-        print(f"📸 截图次数: {stats['screenshots']}")
+        if self.entry_error is not None:
+            print(f"⏰ 进入时间误差: {self.entry_error * 1e6:+.0f}µs")
+        if self.device_clock is not None:
+            self.device_clock.print_report()
+        frames_skipped = stats['decodes_skipped'] + stats['rows_unchanged'] + stats['frames_dropped']
+        print(f"📸 截图次数: {stats['screenshots']}（发布新帧 {stats['frames_published']} 帧, "
+              f"跳过 {frames_skipped} 帧）")
+        self.capture_scheduler.print_report()
+        self.frame_age_guard.print_report()
+        if self.pipeline_depth > 1:
+            print(f"   流水线丢弃旧帧: {stats['frames_dropped']} 帧")
+        if stats['decodes_skipped'] or stats['rows_unchanged']:
+            print(f"   画面未变化跳过: 解码 {stats['decodes_skipped']} 次, 检测行未变化 {stats['rows_unchanged']} 帧, "
+                  f"检测线程唤醒 {stats['detections_skipped']} 次")
+        png_rows = self.png_row_decoder
+        if png_rows.decoded or png_rows.fallbacks:
+            print(f"   PNG 部分解码: {png_rows.decoded} 帧, 反滤波段太长回退整帧 {png_rows.fallbacks} 次"
+                  f"（之后直接整帧解码 {png_rows.skipped} 帧）")
+        self.print_latency_report()
+        if self.debug_writer is not None:
+            self.debug_writer.close()
+            writer_stats = self.debug_writer.get_stats()
+            print(f"💾 调试截图: 新写入 {writer_stats['written']} 张, 内容重复 {writer_stats['deduplicated']} 张, "
+                  f"合并 {writer_stats['coalesced']} 张, 队列满丢弃 {writer_stats['dropped']} 张")
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"🎞️  会话录制: {self.recorder.frame_count} 帧 (关键帧 {self.recorder.keyframes}), "
+                  f"{self.recorder.tap_count} 次点击 -> {self.recorder.path}")
+        self.event_log.close()
+        filtered = {event: counts['filtered'] for event, counts in self.event_log.get_stats().items() if counts['filtered']}
+        if filtered or self.event_log.overflow:
+            print(f"📝 事件日志: 采样/限流过滤 {filtered}, 缓冲溢出 {self.event_log.overflow} 条")
         print(f"🔍 阶段检测次数:")
         for stage_name, count in stats['stage_detections'].items():
             config = STAGE_CONFIGS.get(stage_name, {})
@@ -1462,6 +2603,86 @@ class TimedMultiThreadPurchase:
             print(f"  - {config.get('name', stage_name)}: {count} 次")
         print("=" * 60)
 
+class ProcessCaptureSource:
+    """
+    多进程截图后端的帧来源（实例被 pickle 到截图进程，open() 在截图进程中调用）
+    
+    截图进程有自己的 ADB 连接，复用 TimedMultiThreadPurchase 的截图/解码/指纹/行提取逻辑
+    （不启动录制、调试截图写入器和事件日志：这些都由主进程负责，两个进程写同一个文件会互相覆盖）
+    """
+    
+    def __init__(self, device_id: Optional[str], capture_mode: str, use_wire_client: bool):
+        """
+        Args:
+            device_id: 设备 ID
+            capture_mode: 截图传输模式（与主进程协商结果一致）
+            use_wire_client: 是否启用内置 adb 协议客户端
+        """
+        self.device_id = device_id
+        self.capture_mode = capture_mode
+        self.use_wire_client = use_wire_client
+        self.auto: Optional[ADBAutomation] = None
+        self.purchase: Optional[TimedMultiThreadPurchase] = None
+        self.next_capture_time = 0.0
+        self.consecutive_failures = 0
+    
+    def __getstate__(self):
+        # 只传递连接参数，ADB 连接在截图进程中建立
+        return {'device_id': self.device_id, 'capture_mode': self.capture_mode,
+                'use_wire_client': self.use_wire_client}
+    
+    def __setstate__(self, state):
+        self.__init__(state['device_id'], state['capture_mode'], state['use_wire_client'])
+    
+    def open(self) -> bool:
+        """连接设备（在截图进程中调用）"""
+        self.auto = ADBAutomation(self.device_id)
+        if not self.auto.connect(capture_mode=self.capture_mode, use_wire_client=self.use_wire_client):
+            print("❌ 截图进程连接设备失败")
+            return False
+        self.purchase = TimedMultiThreadPurchase(self.auto, record_session=False,
+                                                 debug_artifacts=False, event_log=False)
+        return True
+    
+    def next_frame(self):
+        """
+        截取一帧（按 SCREENSHOT_INTERVAL 节奏）
+        
+        Returns:
+            (检测行 或 None(未变化), 帧格式, 截图开始时间, 指纹)，失败返回 None
+        """
+        wait = self.next_capture_time - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        
+        capture_start = time.perf_counter()
+        purchase = self.purchase
+        frame, frame_format, png_data, slim_frame, fingerprint = purchase._capture_frame()
+        if frame is None and slim_frame is None and fingerprint is None:
+            self.consecutive_failures += 1
+            self.next_capture_time = time.perf_counter() + (0.5 if self.consecutive_failures >= 5 else 0.05)
+            if self.consecutive_failures >= 5:
+                print(f"⚠️ [截图进程] 连续 {self.consecutive_failures} 次截图失败，暂停 0.5 秒")
+                self.consecutive_failures = 0
+            return None
+        self.consecutive_failures = 0
+        self.next_capture_time = capture_start + SCREENSHOT_INTERVAL
+        
+        if frame is None and slim_frame is None:
+            purchase._refresh_unchanged_frame(capture_start)
+            return None, frame_format, capture_start, fingerprint
+        
+        if not purchase._publish_frame(frame, frame_format, png_data, slim_frame,
+                                       capture_start=capture_start, fingerprint=fingerprint):
+            return None
+        return purchase.snapshot.rows, frame_format, capture_start, fingerprint
+    
+    def close(self):
+        """断开连接"""
+        if self.auto is not None:
+            self.auto.close()
+
+
 def main():
     """主函数"""
     # 检查 PIL 是否可用
@@ -1472,10 +2693,13 @@ def main():
     
     auto = ADBAutomation()
     
-    if not auto.connect():
+    if not auto.connect(capture_mode=CAPTURE_MODE, use_wire_client=USE_WIRE_CLIENT):
         print("❌ 设备连接失败")
         return
     
+    if USE_INPUT_CHANNEL:
+        auto.open_input_channel()
+    
     purchase = TimedMultiThreadPurchase(auto)
     
     # 示例：设置9点开抢
@@ -1492,11 +2716,15 @@ def main():
     # 方式3：立即开始（用于测试）
     # target_time = datetime.now()
     
-    print(f"🎯 目标抢购时间: {target_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    if SCHEDULE_ON_DEVICE_CLOCK:
+        print(f"🎯 目标抢购时间: {target_time.strftime('%Y-%m-%d %H:%M:%S')}（手机时间：按估计的主机/手机时钟偏差换算）")
+    else:
+        print(f"🎯 目标抢购时间: {target_time.strftime('%Y-%m-%d %H:%M:%S')}（主机时间）")
     
     # 【修复问题1】如果提前进入详情页等待，应该指定 initial_stage="stage1"
     # 这样即使 stage1 没有 detector，也能正常启动流程
     purchase.run_timed_purchase(target_time, initial_stage="stage1")
+    auto.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,142 @@
+"""
+帧龄守卫（过旧的帧不用于阶段切换/点击 + 看门狗告警 + 帧龄直方图）
+截图卡住（USB 慢、设备忙）时，最新快照可能已经是几百毫秒前的画面，用它切换阶段或继续点击会作用在已经变化的页面上：
+
+- 帧龄 = 现在 - 截图请求开始时间（capture_start）：画面在 [开始, 完成] 之间采样，这是画面年龄的上界；
+  未变化的帧刷新时间戳，静止画面不会被误判为过旧；视频流后端画面不变时没有新帧，
+  解码器追上数据流期间同样刷新（H264StreamCapture.current_as_of），流断开重连时照常变旧
+- 正常节奏下帧龄本来就有：截图耗时（record_capture 记录最近若干次的中位数）+ 截图间隔（等待期间截图本来就慢），
+  阈值都在这之上另加：手机本身截图慢（如 PNG 模式几百毫秒）不会被当成卡住；
+  用中位数而不是滑动平均：偶尔一次卡顿（几秒的截图）不会把阈值抬高、让守卫在之后一段时间里失效
+- check()：检测 / 点击使用快照前检查帧龄，超过 max_age + 截图间隔 + 截图耗时时拒绝
+- watch()：看门狗线程定期调用，帧龄超过 alert_age + 截图间隔 + 截图耗时时告警，恢复后输出告警持续时间
+- 每类使用（detect / action / watchdog）记录帧龄直方图，结束时输出
+
+用法：
+    guard = FrameAgeGuard(clock)
+    guard.record_capture(capture_end - capture_start)  # 每次发布/刷新快照时
+    if not guard.check('detect', snapshot, allowance=scheduler.interval()):
+        ...  # 稍后用新帧重新检测
+    guard.watch(snapshot, allowance=scheduler.interval())  # 看门狗线程中
+    guard.print_report()
+"""
+import threading
+from bisect import bisect_left
+from collections import deque
+from statistics import median
+from typing import Dict, Optional
+
+from sim_clock import SystemClock, SYSTEM_CLOCK
+
+FRAME_MAX_AGE = 0.6             # 检测/点击可接受的最大帧龄（秒，另加当前截图间隔和截图耗时）
+FRAME_AGE_ALERT = 1.5           # 看门狗告警阈值（秒，另加当前截图间隔和截图耗时）
+FRAME_WATCHDOG_INTERVAL = 0.1   # 看门狗检查间隔（秒）
+FRAME_STALE_RECHECK = 0.05      # 帧过旧被拒绝后重新检查的间隔（秒）
+FRAME_LATENCY_WINDOW = 15       # 截图耗时取最近多少次的中位数（单次卡顿不影响阈值）
+FRAME_AGE_BINS_MS = (25, 50, 100, 200, 400, 800, 1600)  # 直方图分桶上界（毫秒），最后一桶为超过 1600ms
+
+FRAME_AGE_KINDS = {
+    'detect': '检测',
+    'action': '点击',
+    'watchdog': '看门狗采样',
+}
+
+
+class FrameAgeGuard:
+    """帧龄检查 + 看门狗 + 直方图（多个检测/动作线程共用，计数加锁）"""
+
+    def __init__(
+        self,
+        clock: SystemClock = SYSTEM_CLOCK,
+        max_age: float = FRAME_MAX_AGE,
+        alert_age: float = FRAME_AGE_ALERT
+    ):
+        """
+        Args:
+            clock: 时钟（perf_counter 计时，与快照时间戳一致）
+            max_age: 检测/点击可接受的最大帧龄（秒）
+            alert_age: 看门狗告警阈值（秒）
+        """
+        self.clock = clock
+        self.max_age = max_age
+        self.alert_age = alert_age
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, list] = {kind: [0] * (len(FRAME_AGE_BINS_MS) + 1) for kind in FRAME_AGE_KINDS}
+        self.rejected: Dict[str, int] = {kind: 0 for kind in FRAME_AGE_KINDS}
+        self.worst_age = 0.0
+        self.capture_latency = 0.0  # 截图耗时（capture_end - capture_start）最近若干次的中位数（秒）
+        self._latencies = deque(maxlen=FRAME_LATENCY_WINDOW)
+        self.alerts = 0
+        self._alert_since: Optional[float] = None
+
+    def record_capture(self, duration: float):
+        """记录一次截图耗时（发布/刷新快照时调用）"""
+        with self._lock:
+            self._latencies.append(duration)
+            self.capture_latency = median(self._latencies)
+
+    def age(self, snapshot, now: Optional[float] = None) -> float:
+        """快照的帧龄（秒）"""
+        if now is None:
+            now = self.clock.perf_counter()
+        return now - snapshot.capture_start
+
+    def _observe(self, kind: str, age: float, rejected: bool = False):
+        index = bisect_left(FRAME_AGE_BINS_MS, age * 1000)
+        with self._lock:
+            self.histograms[kind][index] += 1
+            if rejected:
+                self.rejected[kind] += 1
+            if age > self.worst_age:
+                self.worst_age = age
+
+    def check(self, kind: str, snapshot, allowance: float = 0.0) -> bool:
+        """
+        检测/点击使用快照前检查帧龄
+
+        Args:
+            kind: 'detect' 或 'action'
+            snapshot: 帧快照（FrameSnapshot）
+            allowance: 额外允许的帧龄（秒，一般为当前截图间隔；截图耗时自动加上）
+
+        Returns:
+            帧是否足够新（过旧返回 False，调用方应等待新帧）
+        """
+        age = self.age(snapshot)
+        fresh = age <= self.max_age + allowance + self.capture_latency
+        self._observe(kind, age, rejected=not fresh)
+        return fresh
+
+    def watch(self, snapshot, allowance: float = 0.0):
+        """看门狗：记录帧龄，超过告警阈值时告警（每次卡住只告警一次，恢复时输出持续时间）"""
+        if snapshot is None:
+            return
+        now = self.clock.perf_counter()
+        age = self.age(snapshot, now)
+        self._observe('watchdog', age)
+        limit = self.alert_age + allowance + self.capture_latency
+        if age > limit and self._alert_since is None:
+            self._alert_since = now
+            self.alerts += 1
+            print(f"🚨 帧龄 {age * 1000:.0f}ms 超过告警阈值 {limit * 1000:.0f}ms"
+                  f"（截图可能卡住：USB 慢 / 设备忙），检测和点击暂停使用旧帧")
+        elif age <= limit and self._alert_since is not None:
+            print(f"✅ 帧龄恢复正常 ({age * 1000:.0f}ms)，告警持续 {now - self._alert_since:.2f}秒")
+            self._alert_since = None
+
+    def print_report(self):
+        """输出各类使用的帧龄直方图"""
+        with self._lock:
+            histograms = {kind: list(counts) for kind, counts in self.histograms.items()}
+            rejected = dict(self.rejected)
+        if not any(sum(counts) for counts in histograms.values()):
+            return
+        labels = [f"≤{bound}ms" for bound in FRAME_AGE_BINS_MS] + [f">{FRAME_AGE_BINS_MS[-1]}ms"]
+        print(f"🕰️  帧龄直方图（最大 {self.worst_age * 1000:.0f}ms, 告警 {self.alerts} 次）:")
+        for kind, counts in histograms.items():
+            total = sum(counts)
+            if not total:
+                continue
+            buckets = ' | '.join(f"{label} {count}" for label, count in zip(labels, counts) if count)
+            rejected_text = f", 拒绝过旧帧 {rejected[kind]} 次" if kind != 'watchdog' else ''
+            print(f"   {FRAME_AGE_KINDS[kind]}: {total} 次{rejected_text} | {buckets}")
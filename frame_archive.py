@@ -0,0 +1,406 @@
+"""
+会话录制：内存映射的单文件帧归档
+每一帧都记录（只写检测行，几十 KB），另按时间间隔写入关键帧（完整画面），点击事件也写入同一个文件：
+
+    [文件头 128 字节][检测行号表][帧索引区（定长条目）][点击区（定长条目）][数据区（只追加）]
+
+- 写入端：mmap 上直接切片赋值（一次 memcpy），文件按块预扩展（稀疏文件，未写入部分不占磁盘）；
+  每写完一条再更新文件头中的计数，读者看到的始终是完整的前缀
+- 未变化的帧只写索引条目（长度 0，数据沿用上一帧）
+- 读取端：mmap 只读映射，按下标随机访问任意一帧的检测行 / 重建画面（最近的关键帧 + 检测行覆盖），
+  不需要顺序解码整个文件
+
+用法：
+    python frame_archive.py temp_logs/session.tkarc                  # 概要
+    python frame_archive.py temp_logs/session.tkarc --frame 120 --output f120.png
+"""
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Optional, Tuple, Dict, NamedTuple, Sequence
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+ARCHIVE_MAGIC = b'TKFRARC1'
+ARCHIVE_VERSION = 1
+ARCHIVE_INDEX_CAPACITY = 1 << 18     # 最多记录的帧数（30fps 约 2.4 小时）
+ARCHIVE_TAP_CAPACITY = 1 << 16       # 最多记录的点击数
+ARCHIVE_GROW_SIZE = 64 * 1024 * 1024  # 数据区每次预扩展的大小
+ARCHIVE_KEYFRAME_INTERVAL = 5.0      # 关键帧间隔（秒），0 表示不写关键帧
+
+# 文件头：magic, 版本, 宽, 高, 检测行数, 索引容量, 点击容量, 索引区偏移, 点击区偏移, 数据区偏移,
+#         创建时间(epoch), 创建时的 perf_counter, 数据区末尾, 帧数, 点击数
+HEADER = struct.Struct('<8sIIIIIIQQQddQQQ')
+HEADER_SIZE = 128
+# 帧索引条目：数据偏移, 数据长度, 帧ID, 截图开始, 截图完成, 指纹, 类型, 通道数, 帧格式, 保留
+INDEX_ENTRY = struct.Struct('<QIIddIBBBx')
+# 点击条目：发出, 返回, x, y, 阶段下标（-1 未知）
+TAP_ENTRY = struct.Struct('<ddiii4x')
+
+KIND_ROWS = 1           # 检测行 (行数, 宽, 通道数)
+KIND_UNCHANGED = 2      # 与上一帧相同（无数据）
+KIND_KEYFRAME_RAW = 3   # 检测行 + 完整画面原始像素
+KIND_KEYFRAME_PNG = 4   # 检测行 + 完整画面 PNG
+FRAME_FORMATS = ('BGR', 'RGBA', 'RGB')
+
+
+def _align(value: int, alignment: int = 4096) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+class ArchiveEntry(NamedTuple):
+    """帧索引条目"""
+    offset: int
+    length: int
+    frame_id: int
+    capture_start: float
+    capture_end: float
+    fingerprint: int
+    kind: int
+    channels: int
+    frame_format: str
+
+
+class ArchiveTap(NamedTuple):
+    """点击条目"""
+    issued: float
+    returned: float
+    x: int
+    y: int
+    stage_index: int
+
+
+class FrameArchiveWriter:
+    """帧归档写入端（截图线程写帧、点击线程写点击，内部加锁）"""
+
+    def __init__(
+        self,
+        path: str,
+        rows: Sequence[int],
+        width: int,
+        height: int,
+        keyframe_interval: float = ARCHIVE_KEYFRAME_INTERVAL,
+        index_capacity: int = ARCHIVE_INDEX_CAPACITY,
+        tap_capacity: int = ARCHIVE_TAP_CAPACITY
+    ):
+        """
+        Args:
+            path: 归档文件路径（已存在时覆盖）
+            rows: 检测行（升序，与快照的检测行缓冲顺序一致）
+            width / height: 屏幕尺寸
+            keyframe_interval: 关键帧间隔（秒），0 表示不写关键帧
+            index_capacity / tap_capacity: 帧 / 点击条目容量（写满后不再记录）
+        """
+        self.path = path
+        self.rows = tuple(rows)
+        self.width = width
+        self.height = height
+        self.keyframe_interval = keyframe_interval
+        self.index_capacity = index_capacity
+        self.tap_capacity = tap_capacity
+
+        self.rows_offset = HEADER_SIZE
+        self.index_offset = _align(self.rows_offset + 4 * len(self.rows))
+        self.tap_offset = _align(self.index_offset + INDEX_ENTRY.size * index_capacity)
+        self.data_offset = _align(self.tap_offset + TAP_ENTRY.size * tap_capacity)
+        self.data_end = self.data_offset
+        self.frame_count = 0
+        self.tap_count = 0
+        self.created = time.time()
+        self.perf_origin = time.perf_counter()
+        self._last_keyframe = float('-inf')
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'w+b')
+        self._size = self.data_offset + ARCHIVE_GROW_SIZE
+        self._file.truncate(self._size)
+        self._map = mmap.mmap(self._file.fileno(), self._size)
+        self._map[self.rows_offset:self.rows_offset + 4 * len(self.rows)] = struct.pack(
+            f'<{len(self.rows)}I', *self.rows)
+        self._write_header()
+
+        # 统计信息
+        self.keyframes = 0
+        self.dropped = 0  # 索引/点击区写满后未记录的条数
+
+    def _write_header(self):
+        HEADER.pack_into(
+            self._map, 0, ARCHIVE_MAGIC, ARCHIVE_VERSION, self.width, self.height, len(self.rows),
+            self.index_capacity, self.tap_capacity, self.index_offset, self.tap_offset, self.data_offset,
+            self.created, self.perf_origin, self.data_end, self.frame_count, self.tap_count
+        )
+
+    def _reserve(self, length: int) -> int:
+        """在数据区末尾预留 length 字节（不够时扩展文件并重新映射）"""
+        offset = self.data_end
+        if offset + length > self._size:
+            self._size = _align(offset + length + ARCHIVE_GROW_SIZE, ARCHIVE_GROW_SIZE)
+            self._map.close()
+            self._file.truncate(self._size)
+            self._map = mmap.mmap(self._file.fileno(), self._size)
+        self.data_end = offset + length
+        return offset
+
+    def record_frame(
+        self,
+        frame_id: int,
+        rows_block: Optional['np.ndarray'],
+        frame_format: str,
+        capture_start: float,
+        capture_end: float,
+        fingerprint: Optional[int] = None,
+        frame: Optional['np.ndarray'] = None,
+        png_data: Optional[bytes] = None
+    ) -> bool:
+        """
+        记录一帧
+
+        Args:
+            frame_id: 帧ID
+            rows_block: 检测行 (行数, 宽, 通道数)，None 表示与上一帧相同
+            frame_format: 帧格式
+            capture_start / capture_end: 截图开始 / 完成时间（perf_counter）
+            fingerprint: 截图数据指纹
+            frame / png_data: 完整画面（到关键帧间隔时写入，优先用已有的 PNG 数据）
+
+        Returns:
+            是否已记录
+        """
+        with self._lock:
+            if self._map is None:
+                return False
+            if self.frame_count >= self.index_capacity:
+                self.dropped += 1
+                return False
+
+            kind = KIND_UNCHANGED
+            channels = 0
+            offset = self.data_end
+            length = 0
+            if rows_block is not None:
+                kind = KIND_ROWS
+                channels = rows_block.shape[2]
+                keyframe = None
+                if (self.keyframe_interval > 0 and capture_start - self._last_keyframe >= self.keyframe_interval
+                        and (png_data is not None or frame is not None)):
+                    if png_data is not None:
+                        kind, keyframe = KIND_KEYFRAME_PNG, png_data
+                    else:
+                        kind, keyframe = KIND_KEYFRAME_RAW, frame
+                    self._last_keyframe = capture_start
+                    self.keyframes += 1
+
+                rows_bytes = rows_block.nbytes
+                length = rows_bytes + (len(memoryview(keyframe).cast('B')) if keyframe is not None else 0)
+                offset = self._reserve(length)
+                self._map[offset:offset + rows_bytes] = memoryview(np.ascontiguousarray(rows_block)).cast('B')
+                if keyframe is not None:
+                    self._map[offset + rows_bytes:offset + length] = memoryview(keyframe).cast('B')
+
+            INDEX_ENTRY.pack_into(
+                self._map, self.index_offset + self.frame_count * INDEX_ENTRY.size,
+                offset, length, frame_id & 0xFFFFFFFF, capture_start, capture_end, (fingerprint or 0) & 0xFFFFFFFF,
+                kind, channels, FRAME_FORMATS.index(frame_format) if frame_format in FRAME_FORMATS else 0
+            )
+            self.frame_count += 1
+            self._write_header()
+        return True
+
+    def record_tap(self, issued: float, returned: float, x: int, y: int, stage_index: int = -1) -> bool:
+        """记录一次点击"""
+        with self._lock:
+            if self._map is None:
+                return False
+            if self.tap_count >= self.tap_capacity:
+                self.dropped += 1
+                return False
+            TAP_ENTRY.pack_into(self._map, self.tap_offset + self.tap_count * TAP_ENTRY.size,
+                                issued, returned, x, y, stage_index)
+            self.tap_count += 1
+            self._write_header()
+        return True
+
+    def close(self):
+        """落盘并把文件截断到实际数据末尾"""
+        with self._lock:
+            if self._map is None:
+                return
+            self._write_header()
+            self._map.flush()
+            self._map.close()
+            self._map = None
+            self._file.truncate(self.data_end)
+            self._file.close()
+
+
+class FrameArchiveReader:
+    """帧归档读取端（只读 mmap，随机访问；可以在写入过程中打开，读取已完成的前缀）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.width, self.height, row_count, self.index_capacity, self.tap_capacity,
+         self.index_offset, self.tap_offset, self.data_offset, self.created, self.perf_origin,
+         self.data_end, self.frame_count, self.tap_count) = HEADER.unpack_from(self._map, 0)
+        if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+            raise ValueError(f"不是帧归档文件: {path}")
+        self.rows = struct.unpack_from(f'<{row_count}I', self._map, HEADER_SIZE)
+        self._keyframe_cache: Optional[Tuple[int, 'np.ndarray', str]] = None  # 最近解码的关键帧
+
+    def __len__(self) -> int:
+        return self.frame_count
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def entry(self, index: int) -> ArchiveEntry:
+        """第 index 帧的索引条目"""
+        if not 0 <= index < self.frame_count:
+            raise IndexError(index)
+        values = INDEX_ENTRY.unpack_from(self._map, self.index_offset + index * INDEX_ENTRY.size)
+        return ArchiveEntry(*values[:8], FRAME_FORMATS[values[8]])
+
+    def wall_time(self, timestamp: float) -> float:
+        """perf_counter 时间 -> epoch 秒"""
+        return self.created + (timestamp - self.perf_origin)
+
+    def _data_entry(self, index: int) -> Tuple[int, ArchiveEntry]:
+        """第 index 帧实际数据所在的条目（未变化的帧向前找）"""
+        while index >= 0:
+            entry = self.entry(index)
+            if entry.kind != KIND_UNCHANGED:
+                return index, entry
+            index -= 1
+        raise ValueError("之前没有任何带数据的帧")
+
+    def rows_block(self, index: int) -> 'np.ndarray':
+        """第 index 帧的检测行 (行数, 宽, 通道数)（只读视图，不复制）"""
+        _, entry = self._data_entry(index)
+        return np.ndarray((len(self.rows), self.width, entry.channels), np.uint8,
+                          buffer=self._map, offset=entry.offset)
+
+    def slim(self, index: int) -> Dict[int, 'np.ndarray']:
+        """第 index 帧的 {y: row_data}"""
+        block = self.rows_block(index)
+        return {y: block[i] for i, y in enumerate(self.rows)}
+
+    def keyframe(self, index: int) -> Optional[Tuple[int, 'np.ndarray', str]]:
+        """
+        第 index 帧及之前最近的关键帧
+
+        Returns:
+            (关键帧下标, 画面, 帧格式)，没有关键帧返回 None
+        """
+        while index >= 0:
+            entry = self.entry(index)
+            if entry.kind in (KIND_KEYFRAME_RAW, KIND_KEYFRAME_PNG):
+                cached = self._keyframe_cache
+                if cached is not None and cached[0] == index:
+                    return cached
+                start = entry.offset + len(self.rows) * self.width * entry.channels
+                data = self._map[start:entry.offset + entry.length]
+                if entry.kind == KIND_KEYFRAME_PNG:
+                    if not OPENCV_AVAILABLE:
+                        return None
+                    frame, frame_format = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), 'BGR'
+                else:
+                    frame = np.frombuffer(data, np.uint8).reshape(self.height, self.width, -1)
+                    frame_format = entry.frame_format
+                self._keyframe_cache = (index, frame, frame_format)
+                return self._keyframe_cache
+            index -= 1
+        return None
+
+    def reconstruct(self, index: int) -> Tuple['np.ndarray', str]:
+        """
+        重建第 index 帧的画面：最近的关键帧 + 本帧检测行覆盖（没有关键帧时其他像素为 0）
+
+        Returns:
+            (画面, 帧格式)，帧格式与本帧检测行一致
+        """
+        _, entry = self._data_entry(index)
+        block = self.rows_block(index)
+        frame = np.zeros((self.height, self.width, entry.channels), np.uint8)
+        found = self.keyframe(index)
+        if found is not None:
+            _, key, key_format = found
+            frame[...] = convert_format(key, key_format, entry.frame_format)
+        frame[list(self.rows)] = block
+        return frame, entry.frame_format
+
+    def taps(self) -> Tuple[ArchiveTap, ...]:
+        """所有点击"""
+        return tuple(ArchiveTap(*TAP_ENTRY.unpack_from(self._map, self.tap_offset + i * TAP_ENTRY.size))
+                     for i in range(self.tap_count))
+
+    def capture_times(self) -> 'np.ndarray':
+        """所有帧的 (截图开始, 截图完成)（perf_counter）"""
+        return np.array([self.entry(i)[3:5] for i in range(self.frame_count)]).reshape(-1, 2)
+
+
+def convert_format(frame: 'np.ndarray', source: str, target: str) -> 'np.ndarray':
+    """BGR / RGB / RGBA 之间转换（RGBA 的 alpha 补 255）"""
+    if source == target:
+        return frame
+    rgb = frame[..., [2, 1, 0]] if source == 'BGR' else frame[..., :3]
+    if target == 'RGBA':
+        alpha = np.full(rgb.shape[:2] + (1,), 255, np.uint8)
+        return np.concatenate([rgb, alpha], axis=2)
+    if target == 'BGR':
+        return np.ascontiguousarray(rgb[..., ::-1])
+    return np.ascontiguousarray(rgb)
+
+
+def main():
+    """输出归档概要，或导出某一帧的重建画面"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='帧归档查看')
+    parser.add_argument('path', help='归档文件')
+    parser.add_argument('--frame', type=int, default=None, help='导出第 N 帧的重建画面')
+    parser.add_argument('--output', default=None, help='导出文件（PNG）')
+    args = parser.parse_args()
+
+    reader = FrameArchiveReader(args.path)
+    count = len(reader)
+    print(f"📦 {args.path}: {reader.width}x{reader.height}, 检测行 {len(reader.rows)} 行, "
+          f"{count} 帧, {reader.tap_count} 次点击, 数据 {(reader.data_end - reader.data_offset) / 1e6:.1f} MB")
+    if count:
+        times = reader.capture_times()
+        duration = times[-1, 0] - times[0, 0]
+        kinds = [reader.entry(i).kind for i in range(count)]
+        print(f"   时长 {duration:.2f} 秒 ({count / duration if duration > 0 else 0:.1f} fps), "
+              f"未变化 {kinds.count(KIND_UNCHANGED)} 帧, "
+              f"关键帧 {kinds.count(KIND_KEYFRAME_RAW) + kinds.count(KIND_KEYFRAME_PNG)} 帧")
+    for tap in reader.taps():
+        print(f"   👆 +{tap.issued - reader.perf_origin:.3f}s ({tap.x}, {tap.y}) "
+              f"阶段 {tap.stage_index}, 耗时 {(tap.returned - tap.issued) * 1000:.1f}ms")
+
+    if args.frame is not None:
+        frame, frame_format = reader.reconstruct(args.frame)
+        output = args.output or f"frame_{args.frame}.png"
+        if OPENCV_AVAILABLE:
+            cv2.imwrite(output, convert_format(frame, frame_format, 'BGR'))
+            print(f"💾 已导出第 {args.frame} 帧: {output}")
+    reader.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+预分配帧环形缓冲 + 不可变帧快照
+
+截图线程把每一帧的检测行直接复制到环中下一个槽位预分配的行缓冲，
+然后用一次属性赋值发布 FrameSnapshot：
+
+- 稳态下截图循环不再为每帧分配行数据和瘦身版字典（raw 模式的完整帧本身就是复用缓冲区上的视图）
+- 快照对象发布后不再修改，读者直接读取 self.snapshot，无需加锁
+- 但 rows / slim 是槽位缓冲的视图，槽位轮转复用后内容会被新帧覆盖：
+  读取检测行前用 snapshot.ring.pin() 钉住快照的槽位（钉住期间不会被分配给截图线程），用完 unpin()；
+  pin() 失败说明槽位已被复用（之后已发布了更新的帧），读者应改用最新快照
+"""
+import threading
+from typing import Optional, NamedTuple, Tuple, Dict
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+FRAME_RING_SIZE = 4  # 默认槽位数（流水线截图时至少为在途请求数 + 2）
+
+
+class FrameSnapshot(NamedTuple):
+    """帧快照（对象发布后不再修改；rows / slim 指向槽位缓冲，读取前用 FrameRing.pin 钉住槽位）"""
+    frame_id: int
+    frame: Optional['np.ndarray']       # 完整帧（rows / PNG 部分解码模式为 None）
+    slim: Optional[Dict[int, 'np.ndarray']]  # 瘦身版 {y: row_data}（指向槽位行缓冲的视图）
+    rows: Optional['np.ndarray']        # 检测行缓冲 (行数, 宽度, 通道数)，行顺序与 all_needed_rows 一致
+    frame_format: str                   # 'BGR' / 'RGBA' / 'RGB'
+    png_data: Optional[bytes]           # 原始 PNG 数据（raw / rows / 视频流为 None）
+    capture_start: float                # 截图请求开始时间（perf_counter）
+    capture_end: float                  # 截图完成（收到并解码）时间（perf_counter）
+    fingerprint: Optional[int] = None   # 截图数据指纹（crc32），用于跳过未变化的帧
+    publish_time: float = 0.0           # 在本进程发布的时间（多进程截图时晚于 capture_end）
+    ring: Optional[object] = None       # 检测行所在的环（FrameRing / 多进程截图的 CaptureProcess），None 不需要钉住
+    slot: int = -1                      # 检测行所在的槽位下标
+    slot_generation: int = 0            # 写入时槽位的代数（槽位每次被复用都会变化，用于 pin 校验）
+    rows_fingerprint: Optional[int] = None  # 检测行缓冲的指纹（crc32），检测行未变化的帧不换帧ID、不重新检测
+
+
+class FrameSlot:
+    """
+    一个预分配槽位：检测行缓冲 + 指向各行的固定视图字典
+
+    缓冲区在第一次使用时按实际宽度/通道数分配（BGR 为 3 通道，RGBA 为 4 通道），之后复用
+    """
+
+    def __init__(self, rows: Tuple[int, ...], index: int = 0):
+        """
+        Args:
+            rows: 检测需要的行（升序）
+            index: 槽位在环中的下标
+        """
+        self.index = index
+        self.generation = 0  # 每次被截图线程取用 +1（快照记录写入时的代数）
+        self.pins = 0        # 钉住该槽位的读者数
+        self.row_list = list(rows)
+        self.rows: Optional['np.ndarray'] = None
+        self.slim: Optional[Dict[int, 'np.ndarray']] = None
+
+    def rows_buffer(self, width: int, channels: int) -> 'np.ndarray':
+        """获取检测行缓冲，同时准备好指向各行的固定视图字典（尺寸/通道数变化时重新分配）"""
+        shape = (len(self.row_list), width, channels)
+        if self.rows is None or self.rows.shape != shape:
+            self.rows = np.empty(shape, np.uint8)
+            self.slim = {y: self.rows[i] for i, y in enumerate(self.row_list)}
+        return self.rows
+
+    def fill_rows_from_frame(self, frame: 'np.ndarray') -> Dict[int, 'np.ndarray']:
+        """从完整帧复制检测行到行缓冲（np.take 直接写入，不分配临时数组）"""
+        block = self.rows_buffer(frame.shape[1], frame.shape[2])
+        np.take(frame, self.row_list, axis=0, out=block)
+        return self.slim
+
+    def fill_rows_from_dict(self, rows: Dict[int, 'np.ndarray']) -> Optional[Dict[int, 'np.ndarray']]:
+        """从 {y: row_data} 复制检测行到行缓冲，缺行返回 None"""
+        first = rows.get(self.row_list[0]) if self.row_list else None
+        if first is None:
+            return None
+        row_data = first.reshape(first.shape[0], -1)
+        block = self.rows_buffer(row_data.shape[0], row_data.shape[1])
+        for i, y in enumerate(self.row_list):
+            row = rows.get(y)
+            if row is None:
+                return None
+            block[i] = row.reshape(block.shape[1], block.shape[2])
+        return self.slim
+
+
+class FrameRing:
+    """
+    按轮转顺序分配给截图线程的槽位（流水线截图时多个工作线程并发取用）
+
+    正在写入的槽位、最新发布的槽位和被读者钉住的槽位不会被分配出去；
+    都不可用时（读者钉住过多）新增一个槽位，而不是覆盖读者正在使用的帧
+    """
+
+    def __init__(self, rows: Tuple[int, ...], size: int = FRAME_RING_SIZE):
+        """
+        Args:
+            rows: 检测需要的行（升序）
+            size: 槽位数（至少为同时写入的线程数 + 2）
+        """
+        self.rows = rows
+        self.slots = [FrameSlot(rows, i) for i in range(max(3, size))]
+        self._index = 0
+        self._busy = set()  # 正在写入的槽位下标
+        self._published = -1  # 最新发布的槽位下标
+        self._lock = threading.Lock()
+
+    def acquire(self) -> FrameSlot:
+        """取下一个空闲槽位（覆盖最旧的未钉住的帧）"""
+        with self._lock:
+            for _ in range(len(self.slots)):
+                index = self._index
+                self._index = (self._index + 1) % len(self.slots)
+                slot = self.slots[index]
+                if index not in self._busy and index != self._published and slot.pins == 0:
+                    break
+            else:
+                slot = FrameSlot(self.rows, len(self.slots))
+                self.slots.append(slot)
+            slot.generation += 1
+            self._busy.add(slot.index)
+            return slot
+
+    def release(self, slot: FrameSlot, published: bool):
+        """
+        写入结束
+
+        Args:
+            slot: acquire 得到的槽位
+            published: 该槽位的帧是否已作为最新快照发布
+        """
+        with self._lock:
+            self._busy.discard(slot.index)
+            if published:
+                self._published = slot.index
+
+    def pin(self, snapshot: FrameSnapshot) -> bool:
+        """
+        钉住快照的槽位（读取 rows / slim 前调用，成功后必须 unpin）
+
+        Returns:
+            槽位内容是否仍属于该快照（False 表示已被新帧复用，不要读取，也不需要 unpin）
+        """
+        with self._lock:
+            slot = self.slots[snapshot.slot]
+            if slot.generation != snapshot.slot_generation:
+                return False
+            slot.pins += 1
+            return True
+
+    def unpin(self, snapshot: FrameSnapshot):
+        """释放 pin() 钉住的槽位"""
+        with self._lock:
+            self.slots[snapshot.slot].pins -= 1
@@ -0,0 +1,177 @@
+"""
+端到端延迟追踪（每帧、每次点击）
+所有时间点都是 time.perf_counter()（单调时钟），写入预分配的 numpy 数组，热路径上只有几次元素赋值：
+
+帧记录（按帧ID轮转存放）：
+    requested   截图请求开始
+    first_byte  收到第一个字节（仅内置 adb 协议客户端可测，其他传输方式为 NaN）
+    last_byte   收到最后一个字节
+    decoded     解码 / 检测行提取完成
+    published   快照发布
+    evaluated   检测完成（检测引擎一次计算所有阶段，同一帧只记录第一次）
+    transition  该帧触发了阶段切换
+
+点击记录：阶段、发出时间、返回时间
+阶段切换记录：阶段、触发帧ID、切换时间
+
+结束时按环节汇总 p50 / p90 / p99，用于判断某台手机上的瓶颈是传输、解码还是调度
+"""
+from typing import Dict, Tuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+TRACE_FRAME_CAPACITY = 16384      # 保留的最近帧记录数
+TRACE_TAP_CAPACITY = 4096         # 保留的最近点击记录数
+TRACE_TRANSITION_CAPACITY = 256   # 保留的阶段切换记录数
+
+FRAME_POINTS = ('requested', 'first_byte', 'last_byte', 'decoded', 'published', 'evaluated', 'transition')
+_POINT_INDEX = {name: i for i, name in enumerate(FRAME_POINTS)}
+
+# 帧环节：(名字, 起点, 终点, 说明)
+FRAME_SEGMENTS = (
+    ('request', 'requested', 'first_byte', '请求 -> 首字节（设备截图/编码）'),
+    ('transfer', 'first_byte', 'last_byte', '首字节 -> 末字节（传输）'),
+    ('decode', 'last_byte', 'decoded', '末字节 -> 解码完成'),
+    ('capture', 'requested', 'decoded', '截图（请求 -> 解码完成）'),
+    ('handoff', 'decoded', 'published', '交接（解码完成 -> 发布）'),
+    ('detect', 'published', 'evaluated', '检测（发布 -> 检测完成）'),
+    ('transition', 'evaluated', 'transition', '检测完成 -> 阶段切换'),
+    ('total', 'requested', 'evaluated', '总计（请求 -> 检测完成）'),
+)
+# 点击环节
+TAP_SEGMENTS = (
+    ('tap', '点击调用（发出 -> 返回）'),
+    ('react', '阶段切换 -> 首次点击'),
+    ('end_to_end', '端到端（触发帧请求 -> 首次点击）'),
+)
+SEGMENT_LABELS = {name: label for name, _, _, label in FRAME_SEGMENTS}
+SEGMENT_LABELS.update(TAP_SEGMENTS)
+
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyTrace:
+    """预分配的延迟追踪记录（多线程写入；每个元素只由一个线程写，不加锁）"""
+
+    def __init__(
+        self,
+        frame_capacity: int = TRACE_FRAME_CAPACITY,
+        tap_capacity: int = TRACE_TAP_CAPACITY,
+        transition_capacity: int = TRACE_TRANSITION_CAPACITY
+    ):
+        """
+        Args:
+            frame_capacity: 帧记录容量（按帧ID轮转覆盖）
+            tap_capacity: 点击记录容量
+            transition_capacity: 阶段切换记录容量
+        """
+        self.frames = np.full((frame_capacity, len(FRAME_POINTS)), np.nan)
+        self.frame_ids = np.zeros(frame_capacity, np.int64)  # 各行当前属于哪一帧（0 表示空）
+        self.taps = np.full((tap_capacity, 3), np.nan)  # 阶段下标, 发出, 返回
+        self.transitions = np.full((transition_capacity, 3), np.nan)  # 阶段下标, 触发帧ID, 切换时间
+        self.tap_count = 0
+        self.transition_count = 0
+
+    # ---------- 记录 ----------
+    def record_frame(
+        self,
+        frame_id: int,
+        requested: float,
+        first_byte: float,
+        last_byte: float,
+        decoded: float,
+        published: float
+    ):
+        """记录一帧的截图/发布时间点（发布线程调用，覆盖该行之前的旧帧）"""
+        row = frame_id % len(self.frame_ids)
+        self.frames[row] = (requested, first_byte, last_byte, decoded, published, np.nan, np.nan)
+        self.frame_ids[row] = frame_id
+
+    def mark(self, frame_id: int, point: str, timestamp: float) -> bool:
+        """
+        记录帧的后续时间点（只保留第一次，例如多个检测线程中最先完成的一次）
+
+        Returns:
+            是否已记录（帧记录已被覆盖或该时间点已有值时返回 False）
+        """
+        row = frame_id % len(self.frame_ids)
+        column = _POINT_INDEX[point]
+        if self.frame_ids[row] != frame_id or not np.isnan(self.frames[row, column]):
+            return False
+        self.frames[row, column] = timestamp
+        return True
+
+    def record_transition(self, stage_index: int, frame_id: int, timestamp: float):
+        """记录阶段切换（并标记触发帧）"""
+        self.mark(frame_id, 'transition', timestamp)
+        index = self.transition_count % len(self.transitions)
+        self.transitions[index] = (stage_index, frame_id, timestamp)
+        self.transition_count += 1
+
+    def record_tap(self, stage_index: int, issued: float, returned: float):
+        """记录一次点击"""
+        index = self.tap_count % len(self.taps)
+        self.taps[index] = (stage_index, issued, returned)
+        self.tap_count += 1
+
+    # ---------- 汇总 ----------
+    def _frame_requested(self, frame_id: int) -> float:
+        row = int(frame_id) % len(self.frame_ids)
+        if self.frame_ids[row] != frame_id:
+            return np.nan
+        return self.frames[row, _POINT_INDEX['requested']]
+
+    def segment_samples(self) -> Dict[str, np.ndarray]:
+        """各环节的样本（秒，已去掉缺失值）"""
+        frames = self.frames[self.frame_ids > 0]
+        samples = {}
+        for name, start, end, _ in FRAME_SEGMENTS:
+            values = frames[:, _POINT_INDEX[end]] - frames[:, _POINT_INDEX[start]]
+            samples[name] = values[~np.isnan(values)]
+
+        taps = self.taps[:min(self.tap_count, len(self.taps))]
+        samples['tap'] = taps[:, 2] - taps[:, 1]
+
+        # 每次阶段切换之后该阶段的第一次点击
+        react, end_to_end = [], []
+        transitions = self.transitions[:min(self.transition_count, len(self.transitions))]
+        for stage_index, frame_id, switched in transitions:
+            issued = taps[(taps[:, 0] == stage_index) & (taps[:, 1] >= switched), 1]
+            if len(issued):
+                first_tap = issued.min()
+                react.append(first_tap - switched)
+                end_to_end.append(first_tap - self._frame_requested(int(frame_id)))
+        samples['react'] = np.array(react)
+        end_to_end = np.array(end_to_end)
+        samples['end_to_end'] = end_to_end[~np.isnan(end_to_end)]
+        return samples
+
+    def summary(self) -> Dict[str, Tuple[float, float, float, float, int]]:
+        """
+        各环节延迟统计
+
+        Returns:
+            {环节: (p50, p90, p99, 最大值, 样本数)}（秒），没有样本的环节不出现
+        """
+        report = {}
+        for name, values in self.segment_samples().items():
+            if len(values):
+                p50, p90, p99 = np.percentile(values, PERCENTILES)
+                report[name] = (float(p50), float(p90), float(p99), float(values.max()), len(values))
+        return report
+
+    def print_summary(self, title: str = "⚡ 各环节延迟:"):
+        """输出各环节 p50 / p90 / p99"""
+        report = self.summary()
+        if not report:
+            return
+        print(title)
+        for name, label in SEGMENT_LABELS.items():
+            if name in report:
+                p50, p90, p99, max_latency, count = report[name]
+                print(f"  - {label}: p50={p50 * 1000:.2f}ms, p90={p90 * 1000:.2f}ms, "
+                      f"p99={p99 * 1000:.2f}ms, 最大={max_latency * 1000:.2f}ms ({count})")
@@ -0,0 +1,358 @@
+"""
+多进程截图流水线（可选截图后端）
+单进程模式下 PNG/H.264 解码、检测行提取、检测、状态输出、调试截图保存都在争抢 GIL，
+给"帧 -> 点击"这条关键路径带来抖动。这里把截图 + 解码 + 检测行提取放到独立的工作进程：
+
+- 工作进程把检测行写入 multiprocessing.shared_memory 上的环形槽位
+- 每帧通过单向 Pipe 发送一条定长消息（槽位、帧格式、时间戳、指纹），约几十字节
+- 主进程（检测/点击）直接在共享内存上创建 numpy 视图，不复制像素数据
+- 反压：主进程用完槽位（不再是最新帧、也没有读者钉住）后经另一条 Pipe 归还，
+  工作进程只写入已归还的槽位，所有槽位都在使用时等待归还，不会覆盖主进程正在读取的帧
+
+对比单进程模式的各环节延迟：
+    python mp_capture_pipeline.py --seconds 10 --gil-load
+"""
+import multiprocessing
+import struct
+import threading
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Optional, Tuple, Dict, NamedTuple
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+MP_RING_SIZE = 8          # 共享内存槽位数（主进程同时持有的槽位 = 最新帧 + 被读者钉住的帧，通常只有 1-2 个）
+MAX_CHANNELS = 4          # 每个槽位按 4 通道（RGBA）预留空间
+FRAME_FORMATS = ('BGR', 'RGBA', 'RGB')
+
+# 帧消息：槽位, 通道数, 帧格式下标, 标志, 帧ID, 截图开始, 截图完成, 指纹
+FRAME_MESSAGE = struct.Struct('<IBBBqddI')
+FLAG_UNCHANGED = 1        # 与上一帧相同（槽位无新数据，只刷新时间戳）
+FLAG_FINGERPRINT = 2      # 指纹字段有效
+SLOT_RELEASE_MESSAGE = struct.Struct('<I')  # 主进程归还的槽位
+
+
+class SharedFrame(NamedTuple):
+    """主进程收到的一帧（rows / slim 是共享内存上的视图，不复制；读取前用 CaptureProcess.pin 钉住）"""
+    frame_id: int                             # 工作进程的帧编号（同时作为槽位代数）
+    slot: int
+    rows: Optional['np.ndarray']              # 检测行 (行数, 宽度, 通道数)，unchanged 时为 None
+    slim: Optional[Dict[int, 'np.ndarray']]   # {y: row_data}，unchanged 时为 None
+    frame_format: str
+    capture_start: float
+    capture_end: float
+    fingerprint: Optional[int]
+    unchanged: bool
+
+
+class SharedRowRing:
+    """共享内存上的检测行环形缓冲（主进程创建，工作进程按名字挂接）"""
+
+    def __init__(self, rows: Tuple[int, ...], width: int, size: int = MP_RING_SIZE, name: Optional[str] = None):
+        """
+        Args:
+            rows: 检测需要的行（升序）
+            width: 屏幕宽度
+            size: 槽位数
+            name: 共享内存名字，None 表示新建（主进程），否则挂接已有的（工作进程）
+        """
+        self.rows = tuple(rows)
+        self.width = width
+        self.size = size
+        self.slot_bytes = max(1, len(self.rows) * width * MAX_CHANNELS)
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * size)
+        else:
+            # spawn 出的工作进程与主进程共用 resource_tracker，挂接时的重复登记不影响主进程 unlink
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._views: Dict[Tuple[int, int], Tuple['np.ndarray', Dict[int, 'np.ndarray']]] = {}
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def view(self, slot: int, channels: int) -> Tuple['np.ndarray', Dict[int, 'np.ndarray']]:
+        """槽位的 numpy 视图 (行数, 宽度, 通道数) 和对应的 {y: row_data} 字典（按槽位缓存，不重复创建）"""
+        key = (slot, channels)
+        cached = self._views.get(key)
+        if cached is None:
+            block = np.ndarray(
+                (len(self.rows), self.width, channels), np.uint8,
+                buffer=self.shm.buf, offset=slot * self.slot_bytes
+            )
+            cached = (block, {y: block[i] for i, y in enumerate(self.rows)})
+            self._views[key] = cached
+        return cached
+
+    def close(self):
+        """释放共享内存（仍有视图被引用时交给 GC 回收）"""
+        self._views.clear()
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        if self.owner:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def _acquire_free_slot(free_slots: deque, release_conn, stop_event) -> Optional[int]:
+    """工作进程：取一个主进程已归还的槽位（都在使用时等待归还，停止时返回 None）"""
+    while True:
+        while release_conn.poll():
+            free_slots.append(SLOT_RELEASE_MESSAGE.unpack(release_conn.recv_bytes())[0])
+        if free_slots:
+            return free_slots.popleft()
+        if stop_event.is_set():
+            return None
+        release_conn.poll(0.05)
+
+
+def _worker_main(source, ring_args: tuple, conn, release_conn, stop_event):
+    """
+    工作进程入口：循环取帧 -> 写入已归还的共享内存槽位 -> 发送帧消息
+
+    source 需要实现 open() / next_frame() / close()，next_frame 返回：
+        - None：本次失败（由 source 自己退避）
+        - (rows_block 或 None, 帧格式, 截图开始时间, 指纹)：rows_block 为 None 表示与上一帧相同
+    """
+    ring = SharedRowRing(*ring_args)
+    free_slots = deque(range(ring.size))
+    slot = 0
+    frame_id = 0
+    try:
+        if not source.open():
+            return
+        while not stop_event.is_set():
+            result = source.next_frame()
+            if result is None:
+                continue
+            rows_block, frame_format, capture_start, fingerprint = result
+            flags = FLAG_FINGERPRINT if fingerprint is not None else 0
+            channels = 0
+            if rows_block is None:
+                flags |= FLAG_UNCHANGED
+            else:
+                channels = rows_block.shape[2]
+                slot = _acquire_free_slot(free_slots, release_conn, stop_event)
+                if slot is None:
+                    break
+                block, _ = ring.view(slot, channels)
+                block[...] = rows_block
+                frame_id += 1
+            conn.send_bytes(FRAME_MESSAGE.pack(
+                slot, channels, FRAME_FORMATS.index(frame_format), flags, frame_id,
+                capture_start, time.perf_counter(), fingerprint or 0
+            ))
+    except (BrokenPipeError, EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        source.close()
+        ring.close()
+        conn.close()
+        release_conn.close()
+
+
+class CaptureProcess:
+    """主进程侧：启动截图工作进程，接收帧消息并给出共享内存上的视图"""
+
+    def __init__(self, source, rows: Tuple[int, ...], width: int, ring_size: int = MP_RING_SIZE):
+        """
+        Args:
+            source: 帧来源（可 pickle，open() 在工作进程中调用）
+            rows: 检测需要的行（升序）
+            width: 屏幕宽度
+            ring_size: 共享内存槽位数
+        """
+        self.source = source
+        self.rows = tuple(rows)
+        self.width = width
+        self.ring_size = ring_size
+        self.ring: Optional[SharedRowRing] = None
+        self.process = None
+        self.conn = None
+        self.release_conn = None
+        self.stop_event = None
+
+        # 槽位归还（接收线程和检测线程都会调用，加锁）
+        self._slot_lock = threading.Lock()
+        self._slot_generation = [-1] * ring_size  # 槽位当前帧的编号，-1 表示已归还给工作进程
+        self._slot_pins = [0] * ring_size
+        self._latest_slot = -1
+
+        # 统计信息
+        self.frames_received = 0
+        self.messages_coalesced = 0  # 主进程来不及处理、被合并掉的旧消息
+
+    def start(self) -> bool:
+        """创建共享内存并启动工作进程（spawn：ADB 连接和线程不能跨 fork 继承）"""
+        if not NUMPY_AVAILABLE:
+            return False
+        ctx = multiprocessing.get_context('spawn')
+        self.ring = SharedRowRing(self.rows, self.width, self.ring_size)
+        self.conn, send_conn = ctx.Pipe(duplex=False)
+        release_recv, self.release_conn = ctx.Pipe(duplex=False)
+        self.stop_event = ctx.Event()
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(self.source, (self.rows, self.width, self.ring_size, self.ring.name),
+                  send_conn, release_recv, self.stop_event),
+            daemon=True
+        )
+        self.process.start()
+        send_conn.close()  # 主进程只保留读端，工作进程退出时 recv 得到 EOF
+        release_recv.close()
+        return True
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def receive(self, timeout: float) -> Optional[SharedFrame]:
+        """
+        等待下一帧（积压多条时只返回最新的一帧）
+
+        Returns:
+            SharedFrame，超时或工作进程已退出返回 None
+        """
+        try:
+            if not self.conn.poll(timeout):
+                return None
+            message = FRAME_MESSAGE.unpack(self.conn.recv_bytes())
+            latest_changed = None if message[3] & FLAG_UNCHANGED else message
+            while self.conn.poll():
+                message = FRAME_MESSAGE.unpack(self.conn.recv_bytes())
+                if not message[3] & FLAG_UNCHANGED:
+                    if latest_changed is not None:
+                        # 被合并掉的帧从未交给读者，槽位直接归还
+                        self._release_slot(latest_changed[0])
+                    latest_changed = message
+                self.messages_coalesced += 1
+        except (EOFError, OSError):
+            return None
+
+        # 合并时跳过了有变化的帧：发布该帧（之后的消息只是确认画面未变化）
+        if latest_changed is not None:
+            message = latest_changed
+        slot, channels, format_index, flags, frame_id, capture_start, capture_end, fingerprint = message
+        self.frames_received += 1
+        fingerprint = fingerprint if flags & FLAG_FINGERPRINT else None
+        if flags & FLAG_UNCHANGED:
+            return SharedFrame(frame_id, -1, None, None, FRAME_FORMATS[format_index],
+                               capture_start, capture_end, fingerprint, True)
+        self._set_latest(slot, frame_id)
+        rows_block, slim = self.ring.view(slot, channels)
+        return SharedFrame(frame_id, slot, rows_block, slim, FRAME_FORMATS[format_index],
+                           capture_start, capture_end, fingerprint, False)
+
+    # ---------- 槽位归还（反压） ----------
+    def _release_slot(self, slot: int):
+        """把槽位归还给工作进程（之后可能被新帧覆盖）"""
+        with self._slot_lock:
+            self._release_slot_locked(slot)
+
+    def _release_slot_locked(self, slot: int):
+        self._slot_generation[slot] = -1
+        try:
+            self.release_conn.send_bytes(SLOT_RELEASE_MESSAGE.pack(slot))
+        except (BrokenPipeError, OSError):
+            pass  # 工作进程已退出
+
+    def _set_latest(self, slot: int, frame_id: int):
+        """收到新的最新帧：上一帧的槽位没有读者钉住时归还"""
+        with self._slot_lock:
+            previous = self._latest_slot
+            self._slot_generation[slot] = frame_id
+            self._latest_slot = slot
+            if previous >= 0 and previous != slot and self._slot_pins[previous] == 0 \
+                    and self._slot_generation[previous] >= 0:
+                self._release_slot_locked(previous)
+
+    def pin(self, snapshot) -> bool:
+        """
+        钉住快照所在的共享内存槽位（与 FrameRing.pin 接口一致，snapshot 需有 slot / slot_generation）
+
+        Returns:
+            槽位是否仍是该帧（False 表示已归还、可能已被覆盖，不要读取，也不需要 unpin）
+        """
+        with self._slot_lock:
+            if self._slot_generation[snapshot.slot] != snapshot.slot_generation:
+                return False
+            self._slot_pins[snapshot.slot] += 1
+            return True
+
+    def unpin(self, snapshot):
+        """释放 pin() 钉住的槽位（已不是最新帧且没有其他读者时归还）"""
+        slot = snapshot.slot
+        with self._slot_lock:
+            self._slot_pins[slot] -= 1
+            if self._slot_pins[slot] == 0 and slot != self._latest_slot and self._slot_generation[slot] >= 0:
+                self._release_slot_locked(slot)
+
+    def stop(self):
+        """停止工作进程并释放共享内存"""
+        with self._slot_lock:
+            # 之后的 pin 全部失败（共享内存即将释放）
+            self._slot_generation = [-1] * self.ring_size
+            self._latest_slot = -1
+        if self.stop_event is not None:
+            self.stop_event.set()
+        if self.process is not None:
+            self.process.join(timeout=3.0)
+            if self.process.is_alive():
+                self.process.terminate()
+        if self.conn is not None:
+            self.conn.close()
+        if self.release_conn is not None:
+            self.release_conn.close()
+        if self.ring is not None:
+            self.ring.close()
+
+
+def main():
+    """对比单进程（线程）截图与多进程截图的各环节延迟"""
+    import argparse
+    from fast_multi_thread_purchase import (
+        ADBAutomation, TimedMultiThreadPurchase, CAPTURE_MODE, USE_WIRE_CLIENT
+    )
+
+    parser = argparse.ArgumentParser(description='多进程截图流水线延迟对比')
+    parser.add_argument('--device', default=None, help='设备 ID（默认第一个设备）')
+    parser.add_argument('--seconds', type=float, default=10.0, help='每种模式的运行时间（秒）')
+    parser.add_argument('--gil-load', action='store_true', help='主进程额外运行一个纯 Python 负载线程（模拟状态输出/调试保存）')
+    args = parser.parse_args()
+
+    auto = ADBAutomation(args.device)
+    if not auto.connect(capture_mode=CAPTURE_MODE, use_wire_client=USE_WIRE_CLIENT):
+        print("❌ 设备连接失败")
+        return
+
+    reports = {}
+    for backend in ('screencap', 'process'):
+        print(f"\n⏱️  测试截图后端: {backend}（{args.seconds:.0f} 秒）")
+        # 基准实例不点击：不启动事件日志和调试截图写入器（不额外占用 GIL / 磁盘）
+        purchase = TimedMultiThreadPurchase(auto, capture_backend=backend, debug_artifacts=False, event_log=False)
+        reports[backend] = purchase.run_latency_benchmark(args.seconds, gil_load=args.gil_load)
+    auto.close()
+
+    print("\n" + "=" * 60)
+    print("📊 各环节延迟对比 (p50 / p99, ms)")
+    print("=" * 60)
+    for stage in ('capture', 'handoff', 'detect', 'total'):
+        line = f"  {stage:<8}"
+        for backend, report in reports.items():
+            p50, _, p99, _, count = report.get(stage, (0.0, 0.0, 0.0, 0.0, 0))
+            line += f"  {backend}: {p50 * 1000:7.2f} / {p99 * 1000:7.2f} ({count})"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+PNG 部分解码（只解出检测需要的行）
+screencap -p 的 PNG 是 8 位 RGB/RGBA、非隔行扫描，检测只需要其中十几行：
+
+1. memoryview 解析 chunk，不复制 IDAT 数据
+2. 流式 zlib 解压 IDAT，解压到最大需要的行就停止（后面的行不再 inflate）
+3. 按扫描线的滤波类型找到每个需要行之前最近的"自包含"行（None/Sub 滤波，不依赖上一行），
+   只有从该行到需要行这一段需要反滤波
+4. 把每一段重新打包成一个极小的 PNG（stored deflate，几乎是 memcpy），交给 OpenCV/PIL 的 C 实现反滤波
+5. Up / Paeth 滤波的行会把段起点一直推到很靠前的位置：各段总行数超过高度的 PNG_ROWS_MAX_SPAN 时
+   部分解码比整帧解码还慢（每段都要重新打包、二次解码），返回 None 由调用方整帧解码
+
+部分解码至少要解压到最大需要的行，只有反滤波的段较短时才比整帧解码快；
+PngRowDecoder 在回退整帧解码后的 PNG_ROWS_BACKOFF 帧内直接整帧解码（同一页面各行的滤波方式基本不变，
+不必每帧先白白解压一遍再回退），之后再尝试部分解码
+
+输出与截图线程的瘦身版 frame 相同：{y: row_data}
+"""
+import struct
+import threading
+import zlib
+from io import BytesIO
+from typing import Optional, Tuple, Dict, Iterable, List
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    import cv2
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+CHUNK_HEADER = struct.Struct('>I4s')
+IHDR_STRUCT = struct.Struct('>IIBBBBB')
+
+# 8 位色深下各颜色类型的每像素字节数（只支持 screencap 会输出的 RGB / RGBA）
+PNG_COLOR_TYPE_BPP = {
+    2: 3,  # RGB
+    6: 4,  # RGBA
+}
+# 不依赖上一行的滤波类型：None(0)、Sub(1)
+INDEPENDENT_FILTERS = (0, 1)
+PNG_ROWS_MAX_SPAN = 0.15  # 需要反滤波的总行数超过高度的这个比例时放弃部分解码
+PNG_ROWS_BACKOFF = 30     # 放弃部分解码后，接下来这么多帧直接整帧解码
+
+
+def _parse_png(png_data: bytes) -> Optional[Tuple[memoryview, List[memoryview]]]:
+    """
+    解析 PNG chunk（不复制数据）
+
+    Returns:
+        (IHDR 数据, [IDAT 数据, ...])，格式不支持返回 None
+    """
+    if len(png_data) < 8 or png_data[:8] != PNG_SIGNATURE:
+        return None
+
+    view = memoryview(png_data)
+    offset = 8
+    ihdr = None
+    idat_chunks = []
+    while offset + CHUNK_HEADER.size <= len(view):
+        length, chunk_type = CHUNK_HEADER.unpack_from(view, offset)
+        data_start = offset + CHUNK_HEADER.size
+        data = view[data_start:data_start + length]
+        if chunk_type == b'IHDR':
+            ihdr = data
+        elif chunk_type == b'IDAT':
+            idat_chunks.append(data)
+        elif chunk_type == b'IEND':
+            break
+        offset = data_start + length + 4  # 跳过 CRC
+
+    if ihdr is None or not idat_chunks:
+        return None
+    return ihdr, idat_chunks
+
+
+def _inflate_until(idat_chunks: List[memoryview], needed: int) -> Optional[bytearray]:
+    """
+    流式解压 IDAT，得到 needed 字节后立即停止
+
+    Returns:
+        解压出的前 needed 字节，数据不足返回 None
+    """
+    output = bytearray(needed)
+    filled = 0
+    decompressor = zlib.decompressobj()
+    for chunk in idat_chunks:
+        data = chunk
+        while data and filled < needed:
+            part = decompressor.decompress(data, needed - filled)
+            output[filled:filled + len(part)] = part
+            filled += len(part)
+            data = decompressor.unconsumed_tail
+        if filled >= needed:
+            return output
+    return None
+
+
+def _make_png(width: int, height: int, color_type: int, scanlines: memoryview) -> bytes:
+    """把一段扫描线（含滤波字节）打包成独立的 PNG"""
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return (struct.pack('>I', len(data)) + chunk_type + data +
+                struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    ihdr = IHDR_STRUCT.pack(width, height, 8, color_type, 0, 0, 0)
+    # level=0：stored 块，几乎只是 memcpy，真正的反滤波交给 C 实现
+    idat = zlib.compress(scanlines, 0)
+    return PNG_SIGNATURE + chunk(b'IHDR', ihdr) + chunk(b'IDAT', idat) + chunk(b'IEND', b'')
+
+
+def _decode_segment(png_data: bytes) -> Tuple[Optional['np.ndarray'], str]:
+    """解码一段小 PNG（OpenCV 输出 BGR，PIL 输出 RGBA）"""
+    if OPENCV_AVAILABLE:
+        frame = cv2.imdecode(np.frombuffer(png_data, np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None:
+            return frame, 'BGR'
+    if PIL_AVAILABLE:
+        img = Image.open(BytesIO(png_data))
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        return np.array(img), 'RGBA'
+    return None, ''
+
+
+def decode_png_rows(
+    png_data: bytes,
+    rows: Iterable[int],
+    max_span: float = PNG_ROWS_MAX_SPAN
+) -> Optional[Tuple[Dict[int, 'np.ndarray'], str, int, int]]:
+    """
+    【优化】只解码 PNG 中指定的行
+
+    Args:
+        png_data: screencap -p 输出的 PNG 数据
+        rows: 需要的行号（y 坐标）
+        max_span: 需要反滤波的总行数占高度的上限（超过时部分解码不划算）
+
+    Returns:
+        ({y: row_data}, 帧格式, 宽度, 高度)，格式不支持、数据异常或反滤波段太长返回 None（调用方回退到整帧解码）
+    """
+    if not NUMPY_AVAILABLE or not (OPENCV_AVAILABLE or PIL_AVAILABLE):
+        return None
+
+    parsed = _parse_png(png_data)
+    if parsed is None:
+        return None
+    ihdr, idat_chunks = parsed
+
+    width, height, bit_depth, color_type, _, _, interlace = IHDR_STRUCT.unpack(ihdr)
+    bytes_per_pixel = PNG_COLOR_TYPE_BPP.get(color_type)
+    if bit_depth != 8 or bytes_per_pixel is None or interlace != 0:
+        return None
+
+    wanted = sorted(set(y for y in rows if 0 <= y < height))
+    if not wanted:
+        return None
+
+    stride = 1 + width * bytes_per_pixel
+    raw = _inflate_until(idat_chunks, (wanted[-1] + 1) * stride)
+    if raw is None:
+        return None
+
+    # 每行的滤波类型（每条扫描线第一个字节）；向前找最近的自包含行作为段起点
+    filters = np.frombuffer(raw, np.uint8)[::stride]
+    independent = np.where(np.isin(filters, INDEPENDENT_FILTERS), np.arange(len(filters)), 0)
+    segment_start = np.maximum.accumulate(independent)
+
+    # 合并重叠的段：[起点, 终点]
+    segments = []
+    for y in wanted:
+        start = int(segment_start[y])
+        if segments and start <= segments[-1][1] + 1:
+            segments[-1][1] = y
+        else:
+            segments.append([start, y])
+    if sum(end - start + 1 for start, end in segments) > height * max_span:
+        return None
+
+    raw_view = memoryview(raw)
+    result = {}
+    frame_format = ''
+    for start, end in segments:
+        segment_png = _make_png(width, end - start + 1, color_type,
+                                raw_view[start * stride:(end + 1) * stride])
+        decoded, frame_format = _decode_segment(segment_png)
+        if decoded is None:
+            return None
+        for y in wanted:
+            if start <= y <= end:
+                result[y] = decoded[y - start]
+    return result, frame_format, width, height
+
+
+class PngRowDecoder:
+    """部分解码 + 回退控制（多个截图线程共用，计数加锁）"""
+
+    def __init__(self, rows: Iterable[int], max_span: float = PNG_ROWS_MAX_SPAN, backoff: int = PNG_ROWS_BACKOFF):
+        """
+        Args:
+            rows: 需要的行号（y 坐标）
+            max_span: 需要反滤波的总行数占高度的上限
+            backoff: 回退整帧解码后，接下来直接整帧解码的帧数
+        """
+        self.rows = tuple(rows)
+        self.max_span = max_span
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._skip = 0
+        self.decoded = 0    # 部分解码成功的帧
+        self.fallbacks = 0  # 尝试部分解码后回退整帧解码的帧
+        self.skipped = 0    # 回退后直接整帧解码（不尝试）的帧
+
+    def decode(self, png_data: bytes) -> Optional[Tuple[Dict[int, 'np.ndarray'], str, int, int]]:
+        """
+        只解码需要的行
+
+        Returns:
+            同 decode_png_rows；返回 None 时调用方整帧解码
+        """
+        with self._lock:
+            if self._skip > 0:
+                self._skip -= 1
+                self.skipped += 1
+                return None
+        result = decode_png_rows(png_data, self.rows, self.max_span)
+        with self._lock:
+            if result is None:
+                self._skip = self.backoff
+                self.fallbacks += 1
+            else:
+                self.decoded += 1
+        return result
@@ -0,0 +1,342 @@
+"""
+可注入时钟 + 虚拟时间调度器（确定性仿真模式）
+状态机的所有计时（点击节奏、最小驻留时间、阶段执行超时、定时等待、截图间隔）都通过时钟接口：
+
+- SystemClock：真实时钟（默认），直接转发到 time / datetime / threading；
+  sleep_until 为精确等待（粗睡眠 + 短睡眠 + 最后约 1ms 自旋，收尾阶段临时缩短 GIL 切换间隔）
+- VirtualClock：虚拟时间。参与仿真的线程（clock.thread 创建，或在 clock.participate() 中运行）
+  同一时刻只有一个在运行；它调用 sleep / wait 阻塞时，调度器把执行权交给就绪时间最早的线程
+  （同一时刻按进入顺序），虚拟时间直接跳到该时刻。没有真实等待，一次完整的多阶段会话只需几十毫秒，
+  且线程交错顺序固定，配合 random.seed 可完全复现
+
+约束（虚拟时钟）：参与线程只能通过时钟阻塞（sleep / wait / join），持有锁时不能 sleep；
+计算本身不消耗虚拟时间（截图耗时由 ReplayAutomation 的 capture_latency 模拟）
+
+用法：
+    clock = VirtualClock(start=datetime(2026, 1, 22, 9, 59, 50))
+    auto = ReplayAutomation('temp_screenshots', speed=1, clock=clock)
+    purchase = TimedMultiThreadPurchase(auto, capture_backend='screencap', clock=clock)
+    with clock.participate():
+        purchase.run_timed_purchase(clock.now() + timedelta(seconds=5), initial_stage='stage1')
+
+    # 命令行：用录制的截图序列在虚拟时间中跑完整流程
+    python sim_clock.py temp_screenshots --seed 1 --initial-stage stage1
+"""
+import heapq
+import itertools
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Optional, Callable
+
+VIRTUAL_JOIN_QUANTUM = 0.01   # 虚拟时钟 join 的轮询间隔（虚拟秒）
+SIM_CAPTURE_LATENCY = 0.05    # 仿真中每次截图的耗时（虚拟秒，计算本身不消耗虚拟时间）
+
+# 【优化】精确等待（sleep_until）：粗睡眠 -> 短睡眠 -> 最后约 1ms 自旋
+PRECISE_FINAL_APPROACH = 0.012   # 剩余这么多秒时进入收尾阶段：缩短 GIL 切换间隔，改为短睡眠
+PRECISE_SLEEP_JITTER = 0.002     # 收尾阶段睡眠为唤醒抖动预留的余量（秒）
+PRECISE_SHORT_SLEEP = 0.0002     # 短睡眠步长（秒）
+PRECISE_SPIN_WINDOW = 0.001      # 最后自旋的时间窗口（秒），自旋最多持续这么久
+PRECISE_SWITCH_INTERVAL = 0.0002  # 收尾阶段的 GIL 切换间隔（秒）：自旋不主动让出 GIL，
+                                  # 其他线程请求 GIL 时最多等这么久，截图/检测线程不会被饿死
+INFINITY = float('inf')
+
+
+class SystemClock:
+    """真实时钟：perf_counter / time / now / sleep 及线程同步原语的直接转发"""
+
+    def perf_counter(self) -> float:
+        return time.perf_counter()
+
+    def time(self) -> float:
+        return time.time()
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            time.sleep(seconds)
+
+    def sleep_until(self, deadline: float) -> float:
+        """
+        【优化】精确等待到 deadline（perf_counter 单调时钟）
+
+        每轮都按截止时间重新计算剩余时间（唤醒抖动不会累积）：
+        剩余多于 PRECISE_FINAL_APPROACH 时粗睡眠；进入收尾阶段后临时缩短 GIL 切换间隔
+        （睡眠返回后能尽快拿回 GIL），短睡眠到最后 PRECISE_SPIN_WINDOW，再自旋到截止时间
+
+        Returns:
+            实际到达时间与 deadline 的误差（秒，正数表示晚到）
+        """
+        old_interval = None
+        try:
+            while True:
+                remaining = deadline - time.perf_counter()
+                if remaining <= PRECISE_SPIN_WINDOW:
+                    break
+                if remaining > PRECISE_FINAL_APPROACH:
+                    time.sleep(remaining - PRECISE_FINAL_APPROACH)
+                    continue
+                if old_interval is None:
+                    old_interval = sys.getswitchinterval()
+                    sys.setswitchinterval(PRECISE_SWITCH_INTERVAL)
+                if remaining > PRECISE_SPIN_WINDOW + PRECISE_SLEEP_JITTER:
+                    time.sleep(remaining - PRECISE_SPIN_WINDOW - PRECISE_SLEEP_JITTER)
+                else:
+                    time.sleep(PRECISE_SHORT_SLEEP)
+            # 有界自旋（最多 PRECISE_SPIN_WINDOW）
+            while time.perf_counter() < deadline:
+                pass
+            return time.perf_counter() - deadline
+        finally:
+            if old_interval is not None:
+                sys.setswitchinterval(old_interval)
+
+    def wait(self, cond: threading.Condition, timeout: Optional[float]) -> bool:
+        """等待条件变量（调用方持有 cond）"""
+        return cond.wait(timeout)
+
+    def notify_all(self, cond: threading.Condition):
+        """唤醒条件变量上的所有等待者（调用方持有 cond）"""
+        cond.notify_all()
+
+    def thread(self, target: Callable, args: tuple = (), daemon: bool = True,
+               name: Optional[str] = None) -> threading.Thread:
+        """创建线程（调用方负责 start）"""
+        return threading.Thread(target=target, args=args, daemon=daemon, name=name)
+
+    def join(self, thread: threading.Thread, timeout: Optional[float] = None):
+        thread.join(timeout)
+
+
+SYSTEM_CLOCK = SystemClock()
+
+
+class _Waiter:
+    """一个阻塞中的参与线程（调度到它时 set event）"""
+    __slots__ = ('event', 'entry', 'notified')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.entry = None      # 当前有效的调度队列条目 [就绪时间, 序号, waiter]
+        self.notified = False  # wait() 是被 notify 唤醒（而不是超时）
+
+
+class VirtualClock(SystemClock):
+    """虚拟时间调度器：参与线程轮流运行，阻塞时虚拟时间跳到下一个就绪时刻"""
+
+    def __init__(self, start: Optional[datetime] = None):
+        """
+        Args:
+            start: 虚拟时间起点（墙上时间），None 使用当前时间
+        """
+        self.start = start or datetime.now()
+        self._epoch = self.start.timestamp()
+        self._now = 0.0
+        self._lock = threading.Lock()
+        self._queue = []          # 阻塞中的参与线程：[就绪时间, 序号, waiter]，waiter 为 None 表示已取消
+        self._seq = itertools.count()
+        self._running = False     # 是否有参与线程正在运行（持有执行权）
+        self._cond_waiters = {}   # {条件变量: [waiter, ...]}
+        self._local = threading.local()
+        self.switches = 0         # 执行权切换次数
+
+    # ---------- 读时间 ----------
+    def perf_counter(self) -> float:
+        return self._now
+
+    def time(self) -> float:
+        return self._epoch + self._now
+
+    def now(self) -> datetime:
+        return self.start + timedelta(seconds=self._now)
+
+    @property
+    def elapsed(self) -> float:
+        """已经过的虚拟时间（秒）"""
+        return self._now
+
+    # ---------- 调度 ----------
+    def _is_participant(self) -> bool:
+        return getattr(self._local, 'participant', False)
+
+    def _enqueue(self, waiter: _Waiter, ready_at: float):
+        """（持有 _lock）把线程放入调度队列"""
+        entry = [ready_at, next(self._seq), waiter]
+        waiter.entry = entry
+        heapq.heappush(self._queue, entry)
+
+    def _dispatch(self):
+        """（持有 _lock）没有线程在运行时，把执行权交给就绪时间最早的线程并推进虚拟时间"""
+        if self._running:
+            return
+        while self._queue:
+            ready_at, _, waiter = self._queue[0]
+            if waiter is None:
+                heapq.heappop(self._queue)
+                continue
+            if ready_at == INFINITY:
+                print("⚠️  虚拟时钟: 所有参与线程都在无限期等待，仿真停止推进")
+                return
+            heapq.heappop(self._queue)
+            waiter.entry = None
+            if ready_at > self._now:
+                self._now = ready_at
+            self._running = True
+            self.switches += 1
+            waiter.event.set()
+            return
+
+    def _block(self, ready_at: float, cond: Optional[threading.Condition] = None) -> _Waiter:
+        """当前参与线程让出执行权，返回等待对象（调用方随后 waiter.event.wait()）"""
+        waiter = _Waiter()
+        with self._lock:
+            self._enqueue(waiter, ready_at)
+            if cond is not None:
+                self._cond_waiters.setdefault(cond, []).append(waiter)
+            self._running = False
+            self._dispatch()
+        return waiter
+
+    @contextmanager
+    def participate(self):
+        """让当前线程作为参与线程运行（通常是调用 run_timed_purchase 的主线程）"""
+        waiter = _Waiter()
+        with self._lock:
+            self._enqueue(waiter, self._now)
+            self._dispatch()
+        waiter.event.wait()
+        self._local.participant = True
+        try:
+            yield self
+        finally:
+            self._local.participant = False
+            with self._lock:
+                self._running = False
+                self._dispatch()
+
+    # ---------- 时钟接口 ----------
+    def sleep(self, seconds: float):
+        """参与线程：让出执行权直到虚拟时间到达（sleep(0) 让同一时刻的其他线程先运行）"""
+        if not self._is_participant():
+            # 非参与线程（如后台写入线程）不参与调度，按真实时间轮询虚拟时间
+            deadline = self._now + max(seconds, 0.0)
+            while self._now < deadline:
+                time.sleep(0.001)
+            return
+        self._block(self._now + max(seconds, 0.0)).event.wait()
+
+    def sleep_until(self, deadline: float) -> float:
+        """虚拟时间没有唤醒抖动：直接睡到 deadline，误差为 0"""
+        self.sleep(deadline - self._now)
+        return self._now - deadline
+
+    def wait(self, cond: threading.Condition, timeout: Optional[float]) -> bool:
+        """参与线程：释放 cond 等待 notify_all 或超时（虚拟时间），返回后重新持有 cond"""
+        if not self._is_participant():
+            return cond.wait(0.001)
+        ready_at = INFINITY if timeout is None else self._now + max(timeout, 0.0)
+        waiter = self._block(ready_at, cond)
+        cond.release()
+        try:
+            waiter.event.wait()
+        finally:
+            cond.acquire()
+        with self._lock:
+            waiters = self._cond_waiters.get(cond)
+            if waiters and waiter in waiters:
+                waiters.remove(waiter)
+        return waiter.notified
+
+    def notify_all(self, cond: threading.Condition):
+        """唤醒 cond 上的等待者：参与线程改为当前时刻就绪（在通知方让出执行权后运行）"""
+        cond.notify_all()
+        with self._lock:
+            for waiter in self._cond_waiters.pop(cond, []):
+                if waiter.entry is not None:
+                    waiter.entry[2] = None  # 取消超时条目
+                    waiter.notified = True
+                    self._enqueue(waiter, self._now)
+
+    def thread(self, target: Callable, args: tuple = (), daemon: bool = True,
+               name: Optional[str] = None) -> threading.Thread:
+        """创建参与线程（创建即进入调度队列，调用方必须在让出执行权前 start）"""
+        waiter = _Waiter()
+        with self._lock:
+            self._enqueue(waiter, self._now)
+
+        def run():
+            waiter.event.wait()
+            self._local.participant = True
+            try:
+                target(*args)
+            finally:
+                self._local.participant = False
+                with self._lock:
+                    self._running = False
+                    self._dispatch()
+
+        return threading.Thread(target=run, daemon=daemon, name=name)
+
+    def join(self, thread: threading.Thread, timeout: Optional[float] = None):
+        """参与线程：按虚拟时间轮询等待线程结束"""
+        if not self._is_participant():
+            thread.join(timeout)
+            return
+        deadline = INFINITY if timeout is None else self._now + timeout
+        while thread.is_alive() and self._now < deadline:
+            self.sleep(VIRTUAL_JOIN_QUANTUM)
+
+
+def main():
+    """在虚拟时间中用录制的截图序列运行一次完整抢购流程"""
+    import argparse
+    import random
+    from adb_automation import CAPTURE_MODE_PNG, CAPTURE_MODE_RAW, CAPTURE_MODE_ROWS
+    from adb_replay import ReplayAutomation, REPLAY_MAX_GAP
+    from fast_multi_thread_purchase import TimedMultiThreadPurchase
+
+    parser = argparse.ArgumentParser(description='虚拟时间仿真（不需要手机，不需要真实等待）')
+    parser.add_argument('source', help='帧来源：截图目录 / zip / 帧归档 .tkarc')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子（点击节奏 / 坐标偏移）')
+    parser.add_argument('--speed', type=float, default=1.0, help='回放速度（虚拟时间下 1 即按录制节奏）')
+    parser.add_argument('--max-gap', type=float, default=REPLAY_MAX_GAP, help='相邻帧最大间隔（秒）')
+    parser.add_argument('--capture-mode', default=CAPTURE_MODE_RAW,
+                        choices=(CAPTURE_MODE_RAW, CAPTURE_MODE_PNG, CAPTURE_MODE_ROWS), help='截图传输模式')
+    parser.add_argument('--capture-latency', type=float, default=SIM_CAPTURE_LATENCY, help='每次截图的耗时（虚拟秒）')
+    parser.add_argument('--wait', type=float, default=1.0, help='目标时间距仿真开始的秒数（虚拟）')
+    parser.add_argument('--initial-stage', default=None, help='初始阶段')
+    parser.add_argument('--linger', type=float, default=1.0, help='回放结束后继续运行的时间（虚拟秒）')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    clock = VirtualClock()
+    auto = ReplayAutomation(args.source, args.speed, args.max_gap, clock=clock, capture_latency=args.capture_latency)
+    if not auto.connect(capture_mode=args.capture_mode):
+        return
+
+    real_start = time.perf_counter()
+    with clock.participate():
+        purchase = TimedMultiThreadPurchase(auto, capture_backend='screencap', clock=clock)
+
+        def stop_when_finished():
+            while purchase.running.is_set() and not auto.finished.is_set():
+                clock.sleep(0.05)
+            clock.sleep(args.linger)
+            purchase.running.clear()
+
+        clock.thread(stop_when_finished).start()
+        purchase.run_timed_purchase(clock.now() + timedelta(seconds=args.wait), initial_stage=args.initial_stage)
+    real_elapsed = time.perf_counter() - real_start
+
+    auto.print_report(purchase)
+    auto.close()
+    print(f"🧪 虚拟时间 {clock.elapsed:.2f} 秒, 实际耗时 {real_elapsed * 1000:.0f}ms, "
+          f"执行权切换 {clock.switches} 次 (seed={args.seed})")
+
+
+if __name__ == "__main__":
+    main()
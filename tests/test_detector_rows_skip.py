@@ -0,0 +1,130 @@
+"""
+检测行未变化的帧：沿用帧ID、不唤醒检测线程、不重新检测（PNG / 视频流后端）
+
+运行：
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import numpy as np  # noqa: E402
+
+from adb_automation import CAPTURE_MODE_PNG  # noqa: E402
+from adb_replay import ReplayAutomation  # noqa: E402
+from fast_multi_thread_purchase import TimedMultiThreadPurchase  # noqa: E402
+
+SAMPLE_FRAME = 'screen_1080x2280_20260122_225631.png'
+
+
+class DetectorRowsSkipTest(unittest.TestCase):
+    """画面检测行以外的区域变化（倒计时、动画）时不重新检测"""
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        shutil.copy(os.path.join(ROOT, SAMPLE_FRAME), self.source)
+        self.auto = ReplayAutomation(self.source, speed=0, lockstep=False)
+        self.assertTrue(self.auto.connect())
+        self.purchase = TimedMultiThreadPurchase(
+            self.auto, capture_backend='screencap', record_session=False,
+            debug_artifacts=False, event_log=False
+        )
+        self.evaluations = 0
+        self.dispatches = 0
+        engine = self.purchase.detection_engine
+        evaluate = engine.evaluate
+        notify = self.purchase._notify_dispatch
+
+        def counting_evaluate(*args, **kwargs):
+            self.evaluations += 1
+            return evaluate(*args, **kwargs)
+
+        def counting_notify():
+            self.dispatches += 1
+            notify()
+
+        engine.evaluate = counting_evaluate
+        self.purchase._notify_dispatch = counting_notify
+
+    def tearDown(self):
+        self.purchase.running.clear()
+        self.auto.close()
+        shutil.rmtree(self.source, ignore_errors=True)
+
+    def _load_frame(self):
+        """样例截图解码为 numpy（BGR 或 RGBA）"""
+        with open(os.path.join(ROOT, SAMPLE_FRAME), 'rb') as f:
+            return self.purchase._png_bytes_to_numpy(f.read())
+
+    def _changed_outside_rows(self, frame: np.ndarray, value: int) -> np.ndarray:
+        """只改动检测行以外的一行（模拟倒计时 / 动画）"""
+        needed = set(self.purchase.all_needed_rows)
+        y = next(y for y in range(frame.shape[0]) if y not in needed)
+        changed = frame.copy()
+        changed[y, :, :3] = value
+        return changed
+
+    def _detect_latest(self):
+        """检测线程对最新快照做一次检测"""
+        self.assertIsNotNone(self.purchase._get_stage_matches(self.purchase.snapshot))
+
+    def _assert_rows_unchanged_skipped(self, publish, frames):
+        publish(frames[0])
+        first_id = self.purchase.snapshot.frame_id
+        self._detect_latest()
+        self.assertEqual((self.evaluations, self.dispatches), (1, 1))
+
+        for frame in frames[1:]:
+            publish(frame)
+            self._detect_latest()
+        self.assertEqual(self.purchase.snapshot.frame_id, first_id)
+        self.assertEqual((self.evaluations, self.dispatches), (1, 1))
+        self.assertEqual(self.purchase.stats['rows_unchanged'], len(frames) - 1)
+
+    def test_png_mode_skips_unchanged_detector_rows(self):
+        frame, frame_format = self._load_frame()
+        pngs = [self.purchase._encode_png(frame, frame_format)]
+        pngs += [self.purchase._encode_png(self._changed_outside_rows(frame, value), frame_format)
+                 for value in (10, 200)]
+        self.assertEqual(len(set(pngs)), 3)  # 压缩数据不同：整帧指纹挡不住
+
+        self.auto.capture_mode = CAPTURE_MODE_PNG
+        pending = list(pngs)
+        self.auto.get_screenshot_data = lambda: pending.pop(0)
+
+        def publish(_):
+            frame, frame_format, png_data, slim_frame, fingerprint = self.purchase._capture_frame()
+            self.assertTrue(self.purchase._publish_frame(frame, frame_format, png_data, slim_frame,
+                                                         fingerprint=fingerprint))
+
+        self._assert_rows_unchanged_skipped(publish, pngs)
+
+    def test_stream_mode_skips_unchanged_detector_rows(self):
+        frame, frame_format = self._load_frame()
+        bgr = np.ascontiguousarray(frame[:, :, [2, 1, 0]] if frame_format == 'RGBA' else frame[:, :, :3])
+        frames = [bgr] + [self._changed_outside_rows(bgr, value) for value in (10, 200)]
+
+        def publish(frame):
+            # 视频流后端：每解码一帧直接发布（没有截图数据指纹）
+            self.assertTrue(self.purchase._publish_frame(frame, 'BGR'))
+
+        self._assert_rows_unchanged_skipped(publish, frames)
+
+    def test_changed_detector_rows_are_detected(self):
+        frame, frame_format = self._load_frame()
+        self.purchase._publish_frame(frame, frame_format)
+        self._detect_latest()
+        changed = frame.copy()
+        changed[self.purchase.all_needed_rows[0], :, :3] ^= 0xFF
+        self.purchase._publish_frame(changed, frame_format)
+        self._detect_latest()
+        self.assertEqual((self.evaluations, self.dispatches), (2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()